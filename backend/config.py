@@ -3,7 +3,7 @@ import os
 from pathlib import Path
 from qfluentwidgets import (qconfig, ConfigItem, QConfig, OptionsValidator, BoolValidator, OptionsConfigItem, 
                             EnumSerializer, RangeValidator, RangeConfigItem, ConfigValidator)
-from backend.tools.constant import SubtitleArea, VideoSubFinderDecoder
+from backend.tools.constant import SubtitleArea, VideoSubFinderDecoder, FrameSourceBackend, OnnxGraphOptimization
 import configparser
 
 # 项目版本号
@@ -50,23 +50,71 @@ class Config(QConfig):
 
     # 字幕语言设置
     language = OptionsConfigItem("Main", "Language", "ch", OptionsValidator([name for name in tr["Language"]]))
+    # 双语字幕的第二识别语言，none为不识别第二语言。检测只进行一次，每个文本行取置信度最高的语言的识别结果
+    secondLanguage = OptionsConfigItem("Main", "SecondLanguage", "none", OptionsValidator(["none"] + [name for name in tr["Language"]]))
+    # 双语字幕的输出方式，merged为输出一个合并的字幕文件，separate为每种语言输出一个字幕文件
+    bilingualOutput = OptionsConfigItem("Main", "BilingualOutput", "merged", OptionsValidator(["merged", "separate"]))
     # 识别模式设置
-    mode = OptionsConfigItem("Main", "Mode", "fast",  OptionsValidator(["auto", "fast", "accurate"]))
+    mode = OptionsConfigItem("Main", "Mode", "fast",  OptionsValidator(["auto", "fast", "accurate", "quantized", "cascade"]))
     # 是否生成TXT文本字幕
     generateTxt = ConfigItem("Main", "GenerateTxt", False, BoolValidator())
     # 每张图中同时识别6个文本框中的文本，GPU显存越大，该数值可以设置越大
     recBatchNumber = RangeConfigItem("Main", "RecBatchNumber", 6, RangeValidator(1, 100))
     # DB算法每个batch识别多少张，默认为10
     maxBatchSize = RangeConfigItem("Main", "MaxBatchSize", 10, RangeValidator(1, 256))
+    # OCR进程每次最多取出多少帧，将这些帧的文本行合并后批量识别
+    ocrFrameBatchSize = RangeConfigItem("Main", "OcrFrameBatchSize", 8, RangeValidator(1, 64))
+    # 级联模式中，快速模型置信度低于该值(百分比)的文本行使用精准模型重新识别
+    cascadeScoreThreshold = RangeConfigItem("Main", "CascadeScoreThreshold", 90, RangeValidator(0, 100))
     # 字幕出现区域
     subtitleArea = OptionsConfigItem("Main", "SubtitleArea", SubtitleArea.UNKNOWN, OptionsValidator(SubtitleArea), EnumSerializer(SubtitleArea))
     # 每一秒抓取多少帧进行OCR识别
     extractFrequency = RangeConfigItem("Main", "ExtractFrequency", 3, RangeValidator(1, 60))
+    # 跳过两次采样之间视频帧的方式: read为逐帧读取, grab为只抓取不做图像转换
+    extractFrameSkipMode = OptionsConfigItem("Main", "ExtractFrameSkipMode", "grab", OptionsValidator(["read", "grab"]))
+    # grab模式下，两次采样间隔的帧数不少于该值且间隔中有关键帧时，直接seek到下一个采样帧，0为不seek
+    extractSeekThreshold = RangeConfigItem("Main", "ExtractSeekThreshold", 20, RangeValidator(0, 10000))
+    # 主进程向OCR进程传递视频帧的共享内存槽位数量，OCR跟不上时解码会在此处等待
+    sharedFrameBufferSize = RangeConfigItem("Main", "SharedFrameBufferSize", 16, RangeValidator(2, 256))
+    # 读取视频帧的解码组件, FFmpeg会在ffmpeg中完成字幕区域裁剪与抽帧
+    frameSourceBackend = OptionsConfigItem("Main", "FrameSourceBackend", FrameSourceBackend.OPENCV, OptionsValidator(FrameSourceBackend), EnumSerializer(FrameSourceBackend))
+    # 按时间切分视频并行解码的分片数，即解码线程数，1为不切分
+    extractShardCount = RangeConfigItem("Main", "ExtractShardCount", 1, RangeValidator(1, 64))
+    # OCR识别进程数，每个进程加载独立的模型，视频帧按轮询方式分配给各进程
+    ocrWorkerCount = RangeConfigItem("Main", "OcrWorkerCount", 1, RangeValidator(1, 64))
+    # 使用常驻OCR推理服务，模型只加载一次，由队列中的所有任务共享
+    ocrServer = ConfigItem("Main", "OcrServer", False, BoolValidator())
+    # 没有可用的GPU类ONNX执行器时，在CPU上使用ONNX Runtime推理
+    onnxCpu = ConfigItem("Main", "OnnxCpu", False, BoolValidator())
+    # ONNX Runtime算子内并行线程数，0为自动
+    onnxIntraOpThreads = RangeConfigItem("Main", "OnnxIntraOpThreads", 0, RangeValidator(0, os.cpu_count()))
+    # ONNX Runtime算子间并行线程数，0为自动
+    onnxInterOpThreads = RangeConfigItem("Main", "OnnxInterOpThreads", 0, RangeValidator(0, os.cpu_count()))
+    # ONNX Runtime图优化级别
+    onnxGraphOptimization = OptionsConfigItem("Main", "OnnxGraphOptimization", OnnxGraphOptimization.ALL, OptionsValidator(OnnxGraphOptimization), EnumSerializer(OnnxGraphOptimization))
+    # ONNX Runtime是否使用CPU内存池
+    onnxMemArena = ConfigItem("Main", "OnnxMemArena", True, BoolValidator())
+    # 查找字幕结束帧时，先比较识别区域的灰度图与文字掩码，差异超过阈值时才进行OCR
+    changeDetector = ConfigItem("Main", "ChangeDetector", True, BoolValidator())
+    # 识别区域灰度平均绝对差阈值(百分比)
+    changeDetectMadThreshold = RangeConfigItem("Main", "ChangeDetectMadThreshold", 3, RangeValidator(0, 100))
+    # 识别区域文字掩码变化比例阈值(百分比)
+    changeDetectMaskThreshold = RangeConfigItem("Main", "ChangeDetectMaskThreshold", 8, RangeValidator(0, 100))
+    # 识别区域未变化时沿用上一帧的文本检测框，跳过DB检测，只识别文本
+    boxTracker = ConfigItem("Main", "BoxTracker", True, BoolValidator())
+    # 先分段再识别：逐帧比较识别区域，划分出字幕不变的区间后每个区间只OCR一帧，起止时间精确到帧
+    segmentExtraction = ConfigItem("Main", "SegmentExtraction", False, BoolValidator())
+    # 按频率提取后，在文本不同的相邻采样帧之间二分查找字幕切换的位置，使起止时间精确到帧
+    refineSubtitleBoundary = ConfigItem("Main", "RefineSubtitleBoundary", False, BoolValidator())
+    # 识别过程中流式去重，每条字幕结束后立即写入字幕文件，只支持单个OCR进程
+    streamSubtitle = ConfigItem("Main", "StreamSubtitle", False, BoolValidator())
     # 容忍的像素点偏差
     tolerantPixelY = RangeConfigItem("Main", "TolerantPixelY", 50, RangeValidator(1, 1000))
     tolerantPixelX = RangeConfigItem("Main", "TolerantPixelX", 100, RangeValidator(1, 1000))
     # 字幕区域偏移量
     subtitleAreaDeviationPixel = RangeConfigItem("Main", "SubtitleAreaDeviationPixel", 50, RangeValidator(1, 1000))
+    # 指定字幕区域后，只检测与识别字幕区域及其周围的像素，该值为字幕区域向外扩展的像素
+    subtitleAreaMargin = RangeConfigItem("Main", "SubtitleAreaMargin", 30, RangeValidator(0, 1000))
     # 最有可能出现的水印区域
     waterarkAreaNum = RangeConfigItem("Main", "WaterarkAreaNum", 5, RangeValidator(1, 10))
     # 文本相似度阈值
@@ -6,8 +6,10 @@
 @desc: 主程序入口文件
 """
 import os
+import queue
 import re
 import random
+import math
 import shutil
 import traceback
 from collections import Counter, namedtuple
@@ -17,6 +19,7 @@ from pathlib import Path
 import cv2
 from Levenshtein import ratio
 from PIL import Image
+import numpy as np
 from numpy import average, dot, linalg
 from tqdm import tqdm
 import sys
@@ -27,11 +30,19 @@ from backend.config import *
 from backend.tools.hardware_accelerator import HardwareAccelerator
 from tools import reformat
 
-from backend.tools.ocr import OcrRecogniser, get_coordinates
-from backend.tools import subtitle_ocr
+from backend.tools.postprocess import get_coordinates
+from backend.tools.ocr_server import create_recogniser
+from backend.tools import model_registry, postprocess, subtitle_ocr
+from backend.tools.constant import FrameSourceBackend
 from backend.tools.paddle_model_config import PaddleModelConfig
 from backend.tools.process_manager import ProcessManager
+from backend.tools.change_detector import ChangeDetector, StableSegmenter, compute_signature
+from backend.tools.frame_source import OpenCVFrameSource, FFmpegFrameSource
+from backend.tools.shared_frame_buffer import SharedFrameBuffer
+from backend.tools.subtitle_store import SubtitleStore, load_subtitle_stores
+from backend.tools.subtitle_stream import milliseconds_to_timecode, text_similarity
 from backend.tools.subtitle_detect import SubtitleDetect
+from backend.tools.video_index import KeyframeIndex, FrameTimestampIndex, CaptureTimestampIndex
 from backend.bean.subtitle_area import SubtitleArea
 import threading
 import platform
@@ -57,18 +68,20 @@ class SubtitleExtractor:
         self.sub_detector = SubtitleDetect()
         # 视频路径
         self.video_path = vd_path
-        self.video_cap = cv2.VideoCapture(vd_path)
+        self.video_cap = OpenCVFrameSource(vd_path)
         # 通过视频路径获取视频名称
         self.vd_name = Path(self.video_path).stem
         # 临时存储文件夹
         self.temp_output_dir = os.path.join(os.path.dirname(BASE_DIR), 'output', str(self.vd_name))
         # 视频帧总数
-        self.frame_count = self.video_cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        self.frame_count = self.video_cap.frame_count
         # 视频帧率
-        self.fps = self.video_cap.get(cv2.CAP_PROP_FPS)
+        self.fps = self.video_cap.fps
+        # 帧时间戳索引，首次将帧号与时间相互转换时建立
+        self.frame_timestamp_index = None
         # 视频尺寸
-        self.frame_height = int(self.video_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        self.frame_width = int(self.video_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.frame_height = self.video_cap.frame_height
+        self.frame_width = self.video_cap.frame_width
         # 提取的视频帧储存目录
         self.frame_output_dir = os.path.join(self.temp_output_dir, 'frames')
         # 提取的字幕文件存储目录
@@ -77,12 +90,26 @@ class SubtitleExtractor:
         self.use_vsf = False
         # 定义vsf的字幕输出路径
         self.vsf_subtitle = os.path.join(self.subtitle_output_dir, 'raw_vsf.srt')
-        # 提取的原始字幕文本存储路径
+        # 原始字幕，OCR结束后合并各OCR进程的识别结果，SubtitleStore
+        self.raw_subtitles = SubtitleStore()
+        # 双语字幕分别输出时其他语言的原始字幕{语言: SubtitleStore}
+        self.language_raw_subtitles = {}
+        # 原始字幕导出为文本的路径，只在保留缓存时导出用于调试
         self.raw_subtitle_path = os.path.join(self.subtitle_output_dir, 'raw.txt')
         # 定义输出字幕文件路径
         self.subtitle_output_path = os.path.splitext(self.video_path)[0] + '.srt'
+        # 双语字幕分别输出时单独生成字幕文件的其他语言
+        self.separate_languages = []
+        # 识别过程中去重后逐条写入的字幕文件，None为不流式输出
+        self.stream_subtitle_path = None
+        # 流式写入的字幕是否即为最终结果，不需要识别结束后再过滤与生成
+        self.stream_subtitle_final = False
+        # iter_events使用的有界字幕队列，OCR进程将流式写入的最终字幕同时放入其中
+        self.event_queue = None
         # 自定义ocr对象
         self.ocr = None
+        # 常驻OCR推理服务的地址与认证密钥(address, authkey)，为None时在本任务的进程中加载模型
+        self.ocr_server = None
         # 总处理进度
         self.progress_total = 200
         # 视频帧提取进度
@@ -91,10 +118,17 @@ class SubtitleExtractor:
         self.progress_ocr = 0
         # 是否完成
         self.isFinished = False
-        # 字幕OCR任务队列
-        self.subtitle_ocr_task_queue = None
-        # 字幕OCR进度队列
-        self.subtitle_ocr_progress_queue = None
+        # 字幕OCR进程池，OcrWorker列表，每个进程有独立的任务队列、进度队列与共享内存缓冲区
+        self.ocr_workers = []
+        # 各OCR进程输出的原始字幕文件路径
+        self.ocr_raw_subtitle_paths = []
+        # 各OCR进程的进度更新线程，识别结果保存后结束
+        self.ocr_progress_threads = []
+        # 轮询分配OCR任务的锁、下一个接收任务的进程，以及已提交与已完成的任务数
+        self.ocr_worker_lock = threading.Lock()
+        self.ocr_worker_index = 0
+        self.ocr_task_count = 0
+        self.ocr_finished_count = 0
         # vsf运行状态
         self.vsf_running = False
         # 进度监听器列表
@@ -107,88 +141,167 @@ class SubtitleExtractor:
         # 记录开始运行的时间
         start_time = time.time()
         self.lock.acquire()
-        # 重置进度条
-        self.update_progress(ocr=0, frame_extract=0)
-        # 打印识别语言与识别模式
-        self.append_output(f"{tr['Main']['RecSubLang']}：{config.language.value}")
-        self.append_output(f"{tr['Main']['RecMode']}：{config.mode.value}")
-        # 如果使用GPU加速，则打印GPU加速提示
-        if self.hardware_accelerator.has_accelerator():
-            self.append_output(tr['Main']['AcceleratorON'].format(self.hardware_accelerator.accelerator_name))
-        
-        # 打印视频帧数与帧率
-        self.append_output(f"{tr['Main']['FrameCount']}：{self.frame_count}"
-              f"，{tr['Main']['FrameRate']}：{self.fps}")
-        # 打印加载模型信息
-        self.append_output(f'{os.path.basename(os.path.dirname(self.model_config.DET_MODEL_PATH))}-{os.path.basename(self.model_config.DET_MODEL_PATH)}')
-        self.append_output(f'{os.path.basename(os.path.dirname(self.model_config.REC_MODEL_PATH))}-{os.path.basename(self.model_config.REC_MODEL_PATH)}')
-        # 打印视频帧提取开始提示
-        self.append_output(tr['Main']['StartProcessFrame'])
-        # 删除缓存
-        self.__delete_frame_cache()
-        # 若目录不存在，则创建文件夹
-        if not os.path.exists(self.frame_output_dir):
-            os.makedirs(self.frame_output_dir)
-        if not os.path.exists(self.subtitle_output_dir):
-            os.makedirs(self.subtitle_output_dir)
-        self.capture_frame_with_subtitle_area()
-        # 创建一个字幕OCR识别进程
-        subtitle_ocr_process = self.start_subtitle_ocr_async()
-        if self.sub_area is not None:
-            if platform.system() in ['Windows', 'Linux']:
-                # 使用GPU且使用accurate模式时才开放此方法：
-                if self.hardware_accelerator.has_accelerator() and config.mode.value == 'accurate':
-                    self.extract_frame_by_det()
-                else:
-                    self.extract_frame_by_vsf()
-            else:
-                self.extract_frame_by_fps()
-        else:
-            self.extract_frame_by_fps()
-
-        # 往字幕OCR任务队列中，添加OCR识别任务结束标志
-        # 任务格式为：(total_frame_count总帧数, current_frame_no当前帧, dt_box检测框, rec_res识别结果, 当前帧时间， subtitle_area字幕区域)
-        self.subtitle_ocr_task_queue.put((self.frame_count, -1, None, None, None, None))
-        # 等待子线程完成
-        subtitle_ocr_process.join()
-        # 打印完成提示
-        self.append_output(tr['Main']['FinishProcessFrame'])
-        self.append_output(tr['Main']['FinishFindSub'])
+        try:
+            # 重置进度条
+            self.update_progress(ocr=0, frame_extract=0)
+            # 打印识别语言与识别模式
+            self.append_output(f"{tr['Main']['RecSubLang']}：{config.language.value}")
+            second_language = model_registry.get_second_language()
+            if second_language is not None:
+                self.append_output(f"{tr['LanguageModeGUI']['SecondLanguage']}：{second_language}")
+            self.separate_languages = [second_language] if second_language is not None and config.bilingualOutput.value == 'separate' else []
+            self.append_output(f"{tr['Main']['RecMode']}：{config.mode.value}")
+            if config.mode.value == 'cascade' and self.model_config.CASCADE_REC_MODEL_PATH is None:
+                self.append_output(tr['Main']['CascadeModelNotFound'].format(config.language.value))
+            # 如果使用GPU加速，则打印GPU加速提示
+            if self.hardware_accelerator.has_accelerator():
+                self.append_output(tr['Main']['AcceleratorON'].format(self.hardware_accelerator.accelerator_name))
+            if self.ocr_server is not None:
+                self.append_output(tr['Main']['UseOcrServer'])
+            
+            # 打印视频帧数与帧率
+            self.append_output(f"{tr['Main']['FrameCount']}：{self.frame_count}"
+                  f"，{tr['Main']['FrameRate']}：{self.fps}")
+            # 打印加载模型信息
+            self.append_output(f'{os.path.basename(os.path.dirname(self.model_config.DET_MODEL_PATH))}-{os.path.basename(self.model_config.DET_MODEL_PATH)}')
+            self.append_output(f'{os.path.basename(os.path.dirname(self.model_config.REC_MODEL_PATH))}-{os.path.basename(self.model_config.REC_MODEL_PATH)}')
+            # 打印视频帧提取开始提示
+            self.append_output(tr['Main']['StartProcessFrame'])
+            # 删除缓存
+            self.__delete_frame_cache()
+            # 若目录不存在，则创建文件夹
+            if not os.path.exists(self.frame_output_dir):
+                os.makedirs(self.frame_output_dir)
+            if not os.path.exists(self.subtitle_output_dir):
+                os.makedirs(self.subtitle_output_dir)
+            self.capture_frame_with_subtitle_area()
+            extract_frame = self.extract_frame_by_fps
+            if self.sub_area is not None:
+                if platform.system() in ['Windows', 'Linux']:
+                    # 使用GPU且使用accurate模式时才开放此方法：
+                    if self.hardware_accelerator.has_accelerator() and config.mode.value == 'accurate':
+                        extract_frame = self.extract_frame_by_det
+                    elif self.event_queue is None:
+                        # vsf模式由VideoSubFinder先找出全部字幕帧再识别，iter_events时不使用
+                        extract_frame = self.extract_frame_by_vsf
+            if extract_frame == self.extract_frame_by_fps and config.segmentExtraction.value:
+                # 先分段再识别，每段字幕只OCR一帧
+                extract_frame = self.extract_frame_by_segment
+            if extract_frame == self.extract_frame_by_fps and config.extractShardCount.value > 1 and self.event_queue is None:
+                # 分片模式下多个解码线程并行解码，共用OCR进程池
+                extract_frame = self.extract_frame_by_shards
+            self._prepare_subtitle_stream(extract_frame)
+            # 创建字幕OCR识别进程池, vsf模式下由OCR进程自行读取视频帧，不需要共享内存
+            # 分片模式下多个解码线程交替提交任务，OCR进程收到的帧不相邻
+            self.start_subtitle_ocr_async(use_frame_buffer=extract_frame != self.extract_frame_by_vsf,
+                                          neighbour_frames=extract_frame != self.extract_frame_by_shards)
+            refine = self._should_refine_boundaries(extract_frame)
+            try:
+                try:
+                    extract_frame()
+                finally:
+                    # 通知OCR进程结束，等待识别完成后合并各进程的识别结果，精确起止位置时OCR进程继续响应识别请求
+                    self.finish_subtitle_ocr(keep_workers=refine)
+                if refine:
+                    # 采样帧之间的字幕起止位置精确到帧
+                    self.append_output(tr['Main']['RefineSubtitleBoundary'])
+                    self.refine_subtitle_boundaries()
+            finally:
+                self.close_ocr_workers()
+                self.close_recogniser()
+            if self.event_queue is not None and self.isFinished:
+                # iter_events提前结束，已确定的字幕已经写入字幕文件，不再生成字幕
+                self.empty_cache()
+                return
+            # 打印完成提示
+            self.append_output(tr['Main']['FinishProcessFrame'])
+            self.append_output(tr['Main']['FinishFindSub'])
+
+            has_watermark = False
+            if self.sub_area is None:
+                self.append_output(tr['Main']['StartDetectWaterMark'])
+                # 询问用户视频是否有水印区域
+                user_input = input(tr['Main']['checkWaterMark']).strip()
+                has_watermark = user_input == 'y'
+                if not has_watermark:
+                    self.append_output('-----------------------------')
+
+            # 每种语言的字幕分别过滤并生成字幕文件
+            raw_subtitles = self.raw_subtitles
+            raw_subtitle_path = self.raw_subtitle_path
+            subtitle_output_path = self.subtitle_output_path
+            subtitle_tracks = self._get_subtitle_tracks()
+            try:
+                for language, self.raw_subtitles, self.raw_subtitle_path, self.subtitle_output_path in subtitle_tracks:
+                    self.generate_subtitle_track(language, has_watermark)
+            finally:
+                self.raw_subtitles = raw_subtitles
+                self.raw_subtitle_path = raw_subtitle_path
+                self.subtitle_output_path = subtitle_output_path
+            self.append_output(tr['Main']['FinishGenerateSub'], f"{round(time.time() - start_time, 2)}s")
+            self.update_progress(ocr=100, frame_extract=100)
+            self.isFinished = True
+            # 删除缓存文件
+            self.empty_cache()
+        finally:
+            self.lock.release()
+        if config.generateTxt.value:
+            for _, _, _, output_path in subtitle_tracks:
+                self.srt2txt(output_path)
 
+    def iter_events(self, buffer_size=16):
+        """
+        运行字幕提取，每条字幕确定后立即返回
+        字幕由OCR进程经过有界队列传回，调用方处理不及时队列满后OCR进程暂停识别，进而暂停视频帧的提取
+        为了在识别过程中得到最终的字幕，本次提取只使用一个OCR进程按帧号顺序识别，不使用vsf与分片模式，也不精确字幕起止位置
+        提前结束迭代时通知提取停止，OCR进程识别完已提交的帧后退出，等待提取线程结束后才返回
+        :param buffer_size 已确定但调用方还未取出的字幕最多缓存的条数
+        :return 生成器，每项为TimedSubtitleEvent(start_ms, end_ms, text, box, confidence)
+        """
         if self.sub_area is None:
-            self.append_output(tr['Main']['StartDetectWaterMark'])
-            # 询问用户视频是否有水印区域
-            user_input = input(tr['Main']['checkWaterMark']).strip()
-            if user_input == 'y':
-                self.filter_watermark()
-                self.append_output(tr['Main']['FinishDetectWaterMark'])
-            else:
-                self.append_output('-----------------------------')
+            # 未指定字幕区域时，提取结束后需要在控制台询问是否有水印，字幕也要过滤水印后才能确定
+            raise ValueError('iter_events requires sub_area to be set')
+        return self.__iter_events(buffer_size)
 
-        if self.sub_area is None:
-            self.append_output(tr['Main']['StartDeleteNonSub'])
-            self.filter_scene_text()
-            self.append_output(tr['Main']['FinishDeleteNonSub'])
+    def __iter_events(self, buffer_size):
+        self.event_queue = multiprocessing.Queue(max(buffer_size, 1))
+        self.isFinished = False
+        errors = []
 
-        # 打印开始字幕生成提示
-        self.append_output(tr['Main']['StartGenerateSub'])
-        # 判断是否使用了vsf提取字幕
-        if self.use_vsf:
-            # 如果使用了vsf提取字幕，则使用vsf的字幕生成方法
-            self.generate_subtitle_file_vsf()
-        else:
-            # 如果未使用vsf提取字幕，则使用常规字幕生成方法
-            self.generate_subtitle_file()
-        if config.wordSegmentation.value:
-            reformat.execute(self.subtitle_output_path, config.language.value)
-        self.append_output(tr['Main']['FinishGenerateSub'], f"{round(time.time() - start_time, 2)}s")
-        self.update_progress(ocr=100, frame_extract=100)
-        self.isFinished = True
-        # 删除缓存文件
-        self.empty_cache()
-        self.lock.release()
-        if config.generateTxt.value:
-            self.srt2txt(self.subtitle_output_path)
+        def run():
+            try:
+                self.run()
+            except Exception as e:
+                errors.append(e)
+
+        thread = Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            while True:
+                try:
+                    event = self.event_queue.get(timeout=0.5)
+                except queue.Empty:
+                    # OCR进程异常退出时不会放入结束标志
+                    if thread.is_alive():
+                        continue
+                    break
+                if event is None:
+                    break
+                yield event
+            thread.join()
+            if errors:
+                raise errors[0]
+        finally:
+            if thread.is_alive():
+                # 提前结束迭代，通知提取停止，run()在识别结束后直接返回
+                # 等待提取线程结束，期间继续取出字幕，避免OCR进程阻塞在已满的队列上
+                self.isFinished = True
+                while thread.is_alive():
+                    try:
+                        self.event_queue.get(timeout=0.5)
+                    except queue.Empty:
+                        pass
+            self.event_queue = None
 
     def capture_frame_with_subtitle_area(self):
         """
@@ -200,10 +313,10 @@ class SubtitleExtractor:
             
         # 确保视频已打开
         if not self.video_cap.isOpened():
-            self.video_cap = cv2.VideoCapture(self.video_path)
+            self.video_cap = OpenCVFrameSource(self.video_path)
             
         # 将视频指针设置到第一帧
-        # self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        # self.video_cap.seek(0)
         
         # 读取第一帧
         ret, frame = self.video_cap.read()
@@ -223,34 +336,397 @@ class SubtitleExtractor:
             cv2.imwrite(output_path, frame)
             
             # 重置视频指针到第一帧
-            self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.video_cap.seek(0)
 
     def extract_frame_by_fps(self):
         """
         根据帧率，定时提取视频帧，容易丢字幕，但速度快，将提取到的视频帧加入ocr识别任务队列
         """
+        # 每隔多少帧采样一帧
+        frame_step = self._get_frame_step()
+        video_cap, keyframe_index = self._open_sampled_frame_source(frame_step)
+        try:
+            self._extract_sampled_frames(video_cap, 0, self.frame_count, frame_step, keyframe_index=keyframe_index,
+                                         on_progress=lambda frame_no: self.update_progress(frame_extract=(frame_no / self.frame_count) * 100))
+        finally:
+            video_cap.release()
+
+    def extract_frame_by_segment(self):
+        """
+        先分段再识别：逐帧解码并计算识别区域的签名，将字幕不变的连续帧划分为一个区间，
+        每个区间只OCR其中最清晰的一帧，区间的首尾帧即为字幕准确的起止帧
+        """
+        roi = self._get_frame_roi()
+        if config.frameSourceBackend.value == FrameSourceBackend.FFMPEG:
+            # 由ffmpeg完成识别区域裁剪
+            self.video_cap.release()
+            video_cap = FFmpegFrameSource(self.video_path, crop=roi)
+        else:
+            video_cap = self.video_cap if self.video_cap.isOpened() else OpenCVFrameSource(self.video_path)
+        cropped = isinstance(video_cap, FFmpegFrameSource)
+        change_detector = ChangeDetector(config.changeDetectMadThreshold.value / 100,
+                                         config.changeDetectMaskThreshold.value / 100)
+        # 短于采样间隔的区间多为字幕切换的过渡帧，画面持续变化时最多按提取频率识别
+        segmenter = StableSegmenter(change_detector, min_frame_count=self._get_frame_step())
+
+        def put_segment(segment):
+            if segment is not None:
+                self.put_frame_task(self.frame_count, segment.start_frame_no, segment.image, cropped=True,
+                                    end_frame_no=segment.end_frame_no)
+
         # 当前视频帧的帧号
         current_frame_no = 0
-        while self.video_cap.isOpened():
-            ret, frame = self.video_cap.read()
+        try:
+            while video_cap.isOpened() and not self.isFinished:
+                ret, frame = video_cap.read()
+                if not ret:
+                    break
+                current_frame_no += 1
+                put_segment(segmenter.push(current_frame_no, frame if cropped else subtitle_ocr.crop_frame(frame, roi)))
+                if current_frame_no % 50 == 0:
+                    self.update_progress(frame_extract=(current_frame_no / self.frame_count) * 100)
+            put_segment(segmenter.flush())
+        finally:
+            video_cap.release()
+
+    def extract_frame_by_shards(self):
+        """
+        将视频按时间切分为多个分片，每个分片使用独立的解码线程并行解码，采样帧交给OCR进程池识别
+        """
+        frame_step = self._get_frame_step()
+        sample_count = int(math.ceil(self.frame_count / frame_step))
+        shard_count = max(min(config.extractShardCount.value, sample_count), 1)
+        # 分片边界与采样点对齐，保证各分片采样到的帧与不分片时完全一致
+        bounds = [i * sample_count // shard_count * frame_step for i in range(shard_count)] + [int(self.frame_count)]
+        self.video_cap.release()
+        keyframe_index = None
+        if config.frameSourceBackend.value != FrameSourceBackend.FFMPEG:
+            # 关键帧索引只需要扫描一次，各分片共用
+            keyframe_index = self._load_keyframe_index(frame_step)
+        # 各分片已提取的帧数
+        extract_progress = [0] * shard_count
+        errors = []
+
+        def extract_shard(i):
+            def on_progress(frame_no):
+                extract_progress[i] = min(frame_no, bounds[i + 1]) - bounds[i]
+                self.update_progress(frame_extract=sum(extract_progress) / self.frame_count * 100)
+            video_cap = None
+            try:
+                video_cap, _ = self._open_sampled_frame_source(frame_step, with_keyframe_index=False)
+                self._extract_sampled_frames(video_cap, bounds[i], bounds[i + 1], frame_step,
+                                             keyframe_index=keyframe_index, on_progress=on_progress)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                if video_cap is not None:
+                    video_cap.release()
+
+        self.append_output(tr['Main']['ExtractShardCount'].format(shard_count))
+        # 解码在线程中进行，OpenCV与ffmpeg管道读取时都会释放GIL
+        threads = [Thread(target=extract_shard, args=(i,), daemon=True) for i in range(shard_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def _prepare_subtitle_stream(self, extract_frame):
+        """
+        判断能否在识别过程中流式输出字幕
+        OCR进程需要按帧号顺序收到全部任务，因此只支持单个OCR进程，且不能是分片或vsf模式
+        需要识别全部视频后才能进行的处理(水印与场景文本过滤、精确起止位置)存在时，流式写入的字幕只是初步结果，识别结束后重新生成
+        :param extract_frame 视频帧提取方法
+        """
+        self.stream_subtitle_path = None
+        self.stream_subtitle_final = False
+        # iter_events调用时不论是否开启了流式输出都尝试流式输出
+        if not config.streamSubtitle.value and self.event_queue is None:
+            return
+        if self._get_ocr_worker_count() > 1 or extract_frame not in (self.extract_frame_by_fps, self.extract_frame_by_segment,
+                                                                    self.extract_frame_by_det):
+            self.append_output(tr['Main']['StreamSubtitleUnavailable'])
+            return
+        self.stream_subtitle_path = self.subtitle_output_path
+        self.stream_subtitle_final = self.sub_area is not None and not self._should_refine_boundaries(extract_frame)
+        if self.stream_subtitle_final:
+            self.append_output(tr['Main']['StreamSubtitle'].format(self.stream_subtitle_path))
+        else:
+            self.append_output(tr['Main']['StreamSubtitlePreliminary'].format(self.stream_subtitle_path))
+
+    def _should_refine_boundaries(self, extract_frame):
+        """
+        是否在识别结束后精确字幕起止位置，iter_events返回的字幕即为最终结果，不再精确
+        :param extract_frame 视频帧提取方法
+        """
+        return extract_frame in (self.extract_frame_by_fps, self.extract_frame_by_shards) and \
+            config.refineSubtitleBoundary.value and self.event_queue is None
+
+    def _get_ocr_worker_count(self):
+        """
+        OCR进程数，iter_events需要按帧号顺序识别，只使用一个OCR进程
+        """
+        return 1 if self.event_queue is not None else config.ocrWorkerCount.value
+
+    def _get_subtitle_tracks(self):
+        """
+        获取需要生成的字幕文件
+        双语字幕合并输出时只有一个字幕文件，分别输出时其他语言的字幕文件名带有语言后缀
+        :return [(语言, 原始字幕SubtitleStore, 原始字幕导出路径, 输出字幕文件路径), ...]
+        """
+        tracks = [(config.language.value, self.raw_subtitles, self.raw_subtitle_path, self.subtitle_output_path)]
+        for lang in self.separate_languages:
+            tracks.append((lang, self.language_raw_subtitles.get(lang, SubtitleStore()),
+                           subtitle_ocr.language_raw_subtitle_path(self.raw_subtitle_path, lang),
+                           f'{os.path.splitext(self.subtitle_output_path)[0]}.{lang}.srt'))
+        return tracks
+
+    def generate_subtitle_track(self, language, has_watermark):
+        """
+        过滤当前原始字幕中的水印与场景文本，并生成字幕文件
+        :param language 字幕语言
+        :param has_watermark 用户确认视频有水印区域
+        """
+        if config.debugNoDeleteCache.value:
+            self.raw_subtitles.export_text(self.raw_subtitle_path)
+        if self.stream_subtitle_final and self.subtitle_output_path == self.stream_subtitle_path:
+            # 识别过程中已经生成了字幕文件
+            self.append_output(tr['Main']['SubLocation'].format(self.subtitle_output_path))
+            if config.wordSegmentation.value:
+                reformat.execute(self.subtitle_output_path, language)
+            return
+        if has_watermark:
+            self.filter_watermark()
+            self.append_output(tr['Main']['FinishDetectWaterMark'])
+
+        if self.sub_area is None:
+            self.append_output(tr['Main']['StartDeleteNonSub'])
+            self.filter_scene_text()
+            self.append_output(tr['Main']['FinishDeleteNonSub'])
+
+        # 打印开始字幕生成提示
+        self.append_output(tr['Main']['StartGenerateSub'])
+        # 判断是否使用了vsf提取字幕
+        if self.use_vsf:
+            # 如果使用了vsf提取字幕，则使用vsf的字幕生成方法
+            self.generate_subtitle_file_vsf()
+        else:
+            # 如果未使用vsf提取字幕，则使用常规字幕生成方法
+            self.generate_subtitle_file()
+        if config.wordSegmentation.value:
+            reformat.execute(self.subtitle_output_path, language)
+
+    def refine_subtitle_boundaries(self):
+        """
+        按频率采样时，字幕的起止位置只能精确到采样间隔
+        对文本不同的相邻两个采样帧，解码两者之间的视频帧，用识别区域的签名二分查找字幕切换的位置，签名无法判断时才OCR，
+        再将前一条字幕的结束帧与后一条字幕的起始帧加入原始字幕，去重后即为准确的起止帧
+        """
+        frame_step = self._get_frame_step()
+        if frame_step <= 1 or len(self.raw_subtitles) == 0:
+            return
+        # 各采样帧的原始字幕记录位置与文本
+        records = self.raw_subtitles.records
+        frame_lines = {}
+        for index, frame_no in enumerate(records['frame_no'].tolist()):
+            frame_lines.setdefault(frame_no, []).append(index)
+        texts = self.raw_subtitles.text_list(records)
+        frame_texts = {frame_no: ''.join(texts[index] for index in indices).replace(' ', '')
+                       for frame_no, indices in frame_lines.items()}
+        threshold = config.thresholdTextSimilarity.value / 100.0
+        # 采样帧的帧号(从1开始)，文本不同的相邻采样帧之间有字幕切换
+        sample_frame_nos = range(1, int(self.frame_count) + 1, frame_step)
+        changes = [(a, b) for a, b in zip(sample_frame_nos, sample_frame_nos[1:])
+                   if ratio(frame_texts.get(a, ''), frame_texts.get(b, '')) < threshold]
+        if not changes:
+            return
+        roi = self._get_frame_roi()
+        change_detector = ChangeDetector(config.changeDetectMadThreshold.value / 100,
+                                         config.changeDetectMaskThreshold.value / 100)
+        seek_threshold = config.extractSeekThreshold.value
+        keyframe_index = None
+        if config.extractFrameSkipMode.value == 'grab' and seek_threshold > 0:
+            keyframe_index = KeyframeIndex.from_video(self.video_path)
+        video_cap = OpenCVFrameSource(self.video_path)
+        # 已读取的帧数，以及上一段最后一帧的识别区域图像，相邻两段共用同一个采样帧
+        current_frame_no = 0
+        last_crop = None
+        refined_lines = {}
+        try:
+            for a, b in changes:
+                crops = {}
+                if last_crop is not None and last_crop[0] == a:
+                    crops[a] = last_crop[1]
+                else:
+                    skip_count = a - 1 - current_frame_no
+                    current_frame_no = self._skip_frames(current_frame_no, skip_count,
+                                                         keyframe_index if skip_count >= seek_threshold else None, video_cap)
+                while current_frame_no < b:
+                    ret, frame = video_cap.read()
+                    if not ret:
+                        break
+                    current_frame_no += 1
+                    crops[current_frame_no] = subtitle_ocr.crop_frame(frame, roi).copy()
+                if a not in crops or b not in crops:
+                    break
+                last_crop = (b, crops[b])
+                lo, hi = self._bisect_subtitle_boundary(crops, a, b, frame_texts.get(a, ''), change_detector, threshold)
+                # 前一条字幕持续到lo，后一条字幕从hi开始
+                if lo > a and a in frame_lines:
+                    refined_lines[lo] = frame_lines[a]
+                if hi < b and b in frame_lines:
+                    refined_lines[hi] = frame_lines[b]
+                self.update_progress(frame_extract=(current_frame_no / self.frame_count) * 100)
+        finally:
+            video_cap.release()
+        if not refined_lines:
+            return
+        chunks = [records]
+        for frame_no, indices in refined_lines.items():
+            refined = records[indices]
+            refined['frame_no'] = frame_no
+            chunks.append(refined)
+        self.raw_subtitles.replace(np.concatenate(chunks))
+        self.raw_subtitles.sort()
+
+    def _bisect_subtitle_boundary(self, crops, start_frame_no, end_frame_no, start_text, change_detector, threshold):
+        """
+        在两个文本不同的采样帧之间二分查找字幕切换的位置
+        中间帧的签名只与其中一端相同时直接判断，与两端都相同或都不同时OCR中间帧，与起点文本相似则属于起点
+        :param crops 帧号到识别区域图像的字典，包含start_frame_no到end_frame_no的所有帧
+        :return (与起点字幕相同的最后一帧, 与起点字幕不同的第一帧)
+        """
+        signatures = {}
+
+        def get_signature(frame_no):
+            if frame_no not in signatures:
+                signatures[frame_no] = compute_signature(crops[frame_no])
+            return signatures[frame_no]
+
+        lo, hi = start_frame_no, end_frame_no
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            same_as_start = change_detector.is_same(get_signature(start_frame_no), get_signature(mid))
+            same_as_end = change_detector.is_same(get_signature(end_frame_no), get_signature(mid))
+            if same_as_start == same_as_end:
+                same_as_start = ratio(start_text, self._recognize_area_text(crops[mid])) >= threshold
+            if same_as_start:
+                lo = mid
+            else:
+                hi = mid
+        return lo, hi
+
+    def _recognize_area_text(self, image):
+        """
+        识别图像中置信度高于阈值的文本，去除空格后拼接
+        由识别结束后仍在运行的OCR进程识别，使用进程中已经加载的模型，主进程不加载模型
+        """
+        worker = self.ocr_workers[0]
+        worker.task_queue.put(image)
+        rec_res = self._wait_ocr_worker_reply(worker)
+        if rec_res is None:
+            raise RuntimeError(f'OCR process {worker.process.pid} exited')
+        return ''.join(text for text, score in rec_res if score > config.dropScore.value / 100.0).replace(' ', '')
+
+    def _get_frame_roi(self):
+        """
+        获取视频帧中需要检测与识别的区域(x, y, w, h)
+        指定了字幕区域时只处理字幕区域及其周围subtitleAreaMargin像素，否则按默认字幕区域裁剪
+        """
+        return subtitle_ocr.get_frame_roi(config.subtitleArea.value, self.sub_area, self.frame_width, self.frame_height,
+                                          config.subtitleAreaMargin.value)
+
+    def _get_frame_step(self):
+        """
+        获取按提取频率采样时，每隔多少帧采样一帧
+        """
+        return max(int(self.fps // config.extractFrequency.value), 1)
+
+    def _load_keyframe_index(self, frame_step):
+        """
+        跳过的帧数较多时，借助关键帧索引直接seek
+        """
+        if config.extractFrameSkipMode.value == 'grab' and 0 < config.extractSeekThreshold.value <= frame_step - 1:
+            return KeyframeIndex.from_video(self.video_path)
+        return None
+
+    def _open_sampled_frame_source(self, frame_step, with_keyframe_index=True):
+        """
+        根据配置的解码组件打开按frame_step采样的视频帧来源
+        :return (视频帧来源, 关键帧索引)
+        """
+        if config.frameSourceBackend.value == FrameSourceBackend.FFMPEG:
+            # 由ffmpeg完成抽帧与识别区域裁剪，只把需要OCR的字幕区域图像读回来
+            self.video_cap.release()
+            return FFmpegFrameSource(self.video_path, crop=self._get_frame_roi(), frame_step=frame_step), None
+        video_cap = self.video_cap if self.video_cap.isOpened() else OpenCVFrameSource(self.video_path)
+        keyframe_index = self._load_keyframe_index(frame_step) if with_keyframe_index else None
+        return video_cap, keyframe_index
+
+    def _extract_sampled_frames(self, video_cap, start_frame_no, end_frame_no, frame_step, keyframe_index=None,
+                                on_progress=None):
+        """
+        从start_frame_no(从0开始)开始每隔frame_step帧采样一帧，直到end_frame_no(不含)，将采样帧加入OCR识别任务队列
+        :param video_cap 视频帧来源，FFmpegFrameSource已经在ffmpeg中完成抽帧与识别区域裁剪
+        :param keyframe_index 关键帧索引
+        :param on_progress 每个采样点的回调，参数为已读取的帧数
+        """
+        presampled = isinstance(video_cap, FFmpegFrameSource)
+        if start_frame_no > 0:
+            video_cap.seek(start_frame_no)
+        # 已读取的帧数，即当前视频帧的帧号
+        current_frame_no = start_frame_no
+        while current_frame_no < end_frame_no and video_cap.isOpened() and not self.isFinished:
+            ret, frame = video_cap.read()
             # 如果读取视频帧失败（视频读到最后一帧）
             if not ret:
                 break
-            # 读取视频帧成功
+            current_frame_no += 1
+            # 已解码的视频帧通过共享内存交给OCR进程, ffmpeg输出的frame为复用的缓冲区，写入共享内存时会被复制
+            self.put_frame_task(self.frame_count, current_frame_no, frame, cropped=presampled)
+            # 跳过剩下的帧
+            if presampled:
+                current_frame_no += frame_step - 1
             else:
-                current_frame_no += 1
-                # subtitle_ocr_task_queue: (total_frame_count总帧数, current_frame_no当前帧, dt_box检测框, rec_res识别结果, 当前帧时间，subtitle_area字幕区域)
-                task = (self.frame_count, current_frame_no, None, None, None, config.subtitleArea.value)
-                self.subtitle_ocr_task_queue.put(task)
-                # 跳过剩下的帧
-                for i in range(int(self.fps // config.extractFrequency.value) - 1):
-                    ret, _ = self.video_cap.read()
-                    if ret:
-                        current_frame_no += 1
-                        # 更新进度条
-                        self.update_progress(frame_extract=(current_frame_no / self.frame_count) * 100)
+                current_frame_no = self._skip_frames(current_frame_no, frame_step - 1, keyframe_index, video_cap)
+            # 每个采样点更新一次进度条
+            if on_progress is not None:
+                on_progress(min(current_frame_no, self.frame_count))
 
-        self.video_cap.release()
+    def _skip_frames(self, current_frame_no, count, keyframe_index=None, video_cap=None):
+        """
+        跳过接下来的count帧
+        :param current_frame_no 已读取的帧数
+        :param count 需要跳过的帧数
+        :param keyframe_index 关键帧索引，跳过的帧中有关键帧时直接seek到目标帧，省去关键帧之前的解码
+        :param video_cap 视频帧来源，None为self.video_cap
+        :return 跳过后已读取的帧数
+        """
+        if video_cap is None:
+            video_cap = self.video_cap
+        if count <= 0:
+            return current_frame_no
+        if config.extractFrameSkipMode.value == 'read':
+            for i in range(count):
+                ret, _ = video_cap.read()
+                if not ret:
+                    break
+                current_frame_no += 1
+            return current_frame_no
+        # 下一次读取的帧(从0开始)
+        target_frame_no = current_frame_no + count
+        if keyframe_index is not None and target_frame_no < self.frame_count:
+            keyframe = keyframe_index.next_keyframe(current_frame_no + 1)
+            if keyframe is not None and keyframe <= target_frame_no:
+                video_cap.seek(target_frame_no)
+                return target_frame_no
+        # grab只解码不做颜色空间转换
+        for i in range(count):
+            if not video_cap.grab():
+                break
+            current_frame_no += 1
+        return current_frame_no
 
     def extract_frame_by_det(self):
         """
@@ -270,9 +746,20 @@ class SubtitleExtractor:
         start_frame_no = 0
         start_end_frame_no = []
         start_frame = None
+        # 上一帧，字幕结束帧为当前帧的前一帧
+        last_frame = None
+        # 变化检测器，识别区域与最近一次确认的字幕帧几乎相同时，不需要OCR就能判断字幕未变化
+        change_detector = None
+        if config.changeDetector.value:
+            change_detector = ChangeDetector(config.changeDetectMadThreshold.value / 100.0,
+                                             config.changeDetectMaskThreshold.value / 100.0)
+        # 最近一次确认与头帧字幕相同的帧的签名
+        reference_signature = None
         if self.ocr is None:
-            self.ocr = OcrRecogniser()
-        while self.video_cap.isOpened():
+            self.ocr = create_recogniser(self.ocr_server, self.hardware_accelerator)
+        # 检测与识别只在识别区域上进行，检测框坐标需要还原为视频帧中的坐标
+        roi = self._get_frame_roi()
+        while self.video_cap.isOpened() and not self.isFinished:
             ret, frame = self.video_cap.read()
             # 如果读取视频帧失败（视频读到最后一帧）
             if not ret:
@@ -280,11 +767,12 @@ class SubtitleExtractor:
             # 读取视频帧成功
             current_frame_no += 1
             tbar.update(1)
+            frame = subtitle_ocr.crop_frame(frame, roi)
             dt_boxes, elapse = self.sub_detector.detect_subtitle(frame)
             has_subtitle = False
             sub_area = self.sub_area
             if sub_area is not None:
-                coordinate_list = get_coordinates(dt_boxes.tolist())
+                coordinate_list = subtitle_ocr.offset_coordinates(get_coordinates(dt_boxes.tolist()), roi)
                 if coordinate_list:
                     for coordinate in coordinate_list:
                         xmin, xmax, ymin, ymax = coordinate
@@ -304,14 +792,17 @@ class SubtitleExtractor:
                 # 判断是字幕头还是尾
                 if is_finding_start_frame_no:
                     start_frame_no = current_frame_no
-                    dt_box, rec_res = self.ocr.predict(frame)
+                    # 直接使用已检测到的文本框，识别时不再重复检测
+                    dt_box, rec_res = self.ocr.predict(frame, dt_boxes)
                     area_text1 = "".join(self.__get_area_text((dt_box, rec_res)))
                     if start_frame_no not in compare_ocr_result_cache.keys():
                         compare_ocr_result_cache[current_frame_no] = {'text': area_text1, 'dt_box': dt_box, 'rec_res': rec_res}
                         frame_lru_list.append((frame, current_frame_no))
-                        ocr_args_list.append((self.frame_count, current_frame_no))
+                        ocr_args_list.append((self.frame_count, current_frame_no, frame))
                         # 缓存头帧
                         start_frame = frame
+                    if change_detector is not None:
+                        reference_signature = compute_signature(frame)
                     # 开始找尾
                     is_finding_start_frame_no = False
                     is_finding_end_frame_no = True
@@ -321,18 +812,27 @@ class SubtitleExtractor:
                     is_finding_start_frame_no = False
                     end_frame_no = current_frame_no
                     frame_lru_list.append((frame, current_frame_no))
-                    ocr_args_list.append((self.frame_count, current_frame_no))
+                    ocr_args_list.append((self.frame_count, current_frame_no, frame))
                     start_end_frame_no.append((start_frame_no, end_frame_no))
                 # 如果在找结束帧的时候
                 if is_finding_end_frame_no:
-                    # 判断该帧与头帧ocr内容是否一致,若不一致则找到尾，尾巴为前一帧
-                    if not self._compare_ocr_result(compare_ocr_result_cache, None, start_frame_no, frame, current_frame_no):
-                        is_finding_end_frame_no = False
-                        is_finding_start_frame_no = True
-                        end_frame_no = current_frame_no - 1
-                        frame_lru_list.append((start_frame, end_frame_no))
-                        ocr_args_list.append((self.frame_count, end_frame_no))
-                        start_end_frame_no.append((start_frame_no, end_frame_no))
+                    # 识别区域与最近确认的字幕帧没有明显变化时，不需要OCR就能确定字幕未变化
+                    signature = compute_signature(frame) if change_detector is not None else None
+                    unchanged = (signature is not None and reference_signature is not None
+                                 and change_detector.is_same(reference_signature, signature))
+                    if not unchanged:
+                        # 判断该帧与头帧ocr内容是否一致,若不一致则找到尾，尾巴为前一帧
+                        if self._compare_ocr_result(compare_ocr_result_cache, None, start_frame_no, frame, current_frame_no,
+                                                   img2_boxes=dt_boxes):
+                            # 字幕相同但画面有变化(如背景变化)，之后的帧与该帧比较
+                            reference_signature = signature
+                        else:
+                            is_finding_end_frame_no = False
+                            is_finding_start_frame_no = True
+                            end_frame_no = current_frame_no - 1
+                            frame_lru_list.append((start_frame, end_frame_no))
+                            ocr_args_list.append((self.frame_count, end_frame_no, last_frame))
+                            start_end_frame_no.append((start_frame_no, end_frame_no))
 
             else:
                 # 如果检测到字幕头后有没有字幕，则找到结尾，尾巴为前一帧
@@ -341,8 +841,9 @@ class SubtitleExtractor:
                     is_finding_end_frame_no = False
                     is_finding_start_frame_no = True
                     frame_lru_list.append((start_frame, end_frame_no))
-                    ocr_args_list.append((self.frame_count, end_frame_no))
+                    ocr_args_list.append((self.frame_count, end_frame_no, last_frame))
                     start_end_frame_no.append((start_frame_no, end_frame_no))
+            last_frame = frame
 
             while len(frame_lru_list) > frame_lru_list_max_size:
                 frame_lru_list.pop(0)
@@ -351,28 +852,25 @@ class SubtitleExtractor:
                 # self.append_output(start_end_frame_no)
 
             while len(ocr_args_list) > 1:
-                total_frame_count, ocr_info_frame_no = ocr_args_list.pop(0)
+                total_frame_count, ocr_info_frame_no, ocr_frame = ocr_args_list.pop(0)
                 if current_frame_no in compare_ocr_result_cache:
                     predict_result = compare_ocr_result_cache[current_frame_no]
                     dt_box, rec_res = predict_result['dt_box'], predict_result['rec_res']
                 else:
                     dt_box, rec_res = None, None
-                # subtitle_ocr_task_queue: (total_frame_count总帧数, current_frame_no当前帧, dt_box检测框, rec_res识别结果, 当前帧时间， subtitle_area字幕区域)
-                task = (total_frame_count, ocr_info_frame_no, dt_box, rec_res, None, config.subtitleArea.value)
                 # 添加任务
-                self.subtitle_ocr_task_queue.put(task)
+                self.put_frame_task(total_frame_count, ocr_info_frame_no, ocr_frame, dt_box, rec_res, cropped=True)
                 self.update_progress(frame_extract=(current_frame_no / self.frame_count) * 100)
 
         while len(ocr_args_list) > 0:
-            total_frame_count, ocr_info_frame_no = ocr_args_list.pop(0)
+            total_frame_count, ocr_info_frame_no, ocr_frame = ocr_args_list.pop(0)
             if current_frame_no in compare_ocr_result_cache:
                 predict_result = compare_ocr_result_cache[current_frame_no]
                 dt_box, rec_res = predict_result['dt_box'], predict_result['rec_res']
             else:
                 dt_box, rec_res = None, None
-            task = (total_frame_count, ocr_info_frame_no, dt_box, rec_res, None, config.subtitleArea.value)
             # 添加任务
-            self.subtitle_ocr_task_queue.put(task)
+            self.put_frame_task(total_frame_count, ocr_info_frame_no, ocr_frame, dt_box, rec_res, cropped=True)
         self.video_cap.release()
 
     def extract_frame_by_vsf(self):
@@ -410,9 +908,9 @@ class SubtitleExtractor:
                         h, m, s, ms = rgb_image.split('__')[0].split('_')
                         total_ms = int(ms) + int(s) * 1000 + int(m) * 60 * 1000 + int(h) * 60 * 60 * 1000
                         if total_ms > last_total_ms:
-                            frame_no = int(total_ms / self.fps)
-                            task = (self.frame_count, frame_no, None, None, total_ms, config.subtitleArea.value)
-                            self.subtitle_ocr_task_queue.put(task)
+                            frame_no = self._timestamp_to_frameno(total_ms)
+                            task = subtitle_ocr.OcrTask(self.frame_count, frame_no, None, None, total_ms, self._get_frame_roi())
+                            self.put_ocr_task(task)
                         last_total_ms = total_ms
                         if total_ms / duration_ms >= 1:
                             self.update_progress(frame_extract=100)
@@ -435,9 +933,9 @@ class SubtitleExtractor:
                     h, m, s, ms = line.split('__')[0].split('_')
                     total_ms = int(ms) + int(s) * 1000 + int(m) * 60 * 1000 + int(h) * 60 * 60 * 1000
                     if total_ms > last_total_ms:
-                        frame_no = int(total_ms / self.fps)
-                        task = (self.frame_count, frame_no, None, None, total_ms, config.subtitleArea.value)
-                        self.subtitle_ocr_task_queue.put(task)
+                        frame_no = self._timestamp_to_frameno(total_ms)
+                        task = subtitle_ocr.OcrTask(self.frame_count, frame_no, None, None, total_ms, self._get_frame_roi())
+                        self.put_ocr_task(task)
                     last_total_ms = total_ms
                     if total_ms / duration_ms >= 1:
                         self.update_progress(frame_extract=100)
@@ -462,7 +960,9 @@ class SubtitleExtractor:
         left_end = self.sub_area.xmin / self.frame_width
         # re：图像右半部分所占百分比，取值【0-1】
         right_end = self.sub_area.xmax / self.frame_width
-        if (not self.hardware_accelerator.has_cuda()) and len(self.hardware_accelerator.onnx_providers) > 0:
+        # OCR在GPU类ONNX执行器上运行时，VSF可以使用全部CPU核心
+        if ((not self.hardware_accelerator.has_cuda()) and len(self.hardware_accelerator.onnx_providers) > 0
+                and not self.hardware_accelerator.is_onnx_cpu()):
             cpu_count = multiprocessing.cpu_count()
         else:
             # 留2核心来给其他任务使用
@@ -511,11 +1011,11 @@ class SubtitleExtractor:
         watermark_areas = self._detect_watermark_area()
 
         # 随机选择一帧, 将所水印区域标记出来，用户看图判断是否是水印区域
-        cap = cv2.VideoCapture(self.video_path)
+        cap = OpenCVFrameSource(self.video_path)
         ret, sample_frame = False, None
         for i in range(10):
             frame_no = random.randint(int(self.frame_count * 0.1), int(self.frame_count * 0.9))
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
+            cap.seek(frame_no)
             ret, sample_frame = cap.read()
             if ret:
                 break
@@ -551,13 +1051,7 @@ class SubtitleExtractor:
             user_input = input(f"{area_num.pop()}{str(watermark_area)} "
                                f"{tr['Main']['QuestionDelete']}").strip()
             if user_input == 'y' or user_input == '\n':
-                with open(self.raw_subtitle_path, mode='r+', encoding='utf-8') as f:
-                    content = f.readlines()
-                    f.seek(0)
-                    for i in content:
-                        if i.find(str(watermark_area[0])) == -1:
-                            f.write(i)
-                    f.truncate()
+                self.raw_subtitles.keep(np.any(self.raw_subtitles.coordinates() != watermark_area[0], axis=1))
                 self.append_output(tr['Main']['FinishDelete'])
         self.append_output(tr['Main']['FinishWaterMarkFilter'])
         # 删除缓存
@@ -572,11 +1066,11 @@ class SubtitleExtractor:
         subtitle_area = self._detect_subtitle_area()[0][0]
 
         # 随机选择一帧，将所水印区域标记出来，用户看图判断是否是水印区域
-        cap = cv2.VideoCapture(self.video_path)
+        cap = OpenCVFrameSource(self.video_path)
         ret, sample_frame = False, None
         for i in range(10):
             frame_no = random.randint(int(self.frame_count * 0.1), int(self.frame_count * 0.9))
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
+            cap.seek(frame_no)
             ret, sample_frame = cap.read()
             if ret:
                 break
@@ -597,15 +1091,8 @@ class SubtitleExtractor:
 
         user_input = input(f"{(ymin, ymax)} {tr['Main']['DeleteNoSubArea']}").strip()
         if user_input == 'y' or user_input == '\n':
-            with open(self.raw_subtitle_path, mode='r+', encoding='utf-8') as f:
-                content = f.readlines()
-                f.seek(0)
-                for i in content:
-                    i_ymin = int(i.split('\t')[1].split('(')[1].split(')')[0].split(', ')[2])
-                    i_ymax = int(i.split('\t')[1].split('(')[1].split(')')[0].split(', ')[3])
-                    if ymin <= i_ymin and i_ymax <= ymax:
-                        f.write(i)
-                f.truncate()
+            records = self.raw_subtitles.records
+            self.raw_subtitles.keep((ymin <= records['ymin']) & (records['ymax'] <= ymax))
             self.append_output(tr['Main']['FinishDeleteNoSubArea'])
         # 删除缓存
         if os.path.exists(sample_frame_file_path):
@@ -630,7 +1117,7 @@ class SubtitleExtractor:
                     else:
                         frame_end = self._frame_to_timecode(int(content[1]))
                     frame_content = content[2]
-                    subtitle_line = f'{line_code}\n{frame_start} --> {frame_end}\n{frame_content}\n'
+                    subtitle_line = f'{line_code}\n{frame_start} --> {frame_end}\n{frame_content}\n\n'
                     f.write(subtitle_line)
             self.append_output(tr['Main']['SubLocation'].format(self.subtitle_output_path))
             # 返回持续时间低于1s的字幕行
@@ -670,120 +1157,71 @@ class SubtitleExtractor:
 
     def _detect_watermark_area(self):
         """
-        根据识别出来的raw txt文件中的坐标点信息，查找水印区域
+        根据识别出来的原始字幕中的坐标点信息，查找水印区域
         假定：水印区域（台标）的坐标在水平和垂直方向都是固定的，也就是具有(xmin, xmax, ymin, ymax)相对固定
         根据坐标点信息，进行统计，将一直具有固定坐标的文本区域选出
         :return 返回最有可能的水印区域
         """
-        f = open(self.raw_subtitle_path, mode='r', encoding='utf-8')  # 打开txt文件，以‘utf-8’编码读取
-        line = f.readline()  # 以行的形式进行读取文件
+        # 将坐标的相似值统一
+        coordinates = self._unite_coordinates(self.raw_subtitles.coordinates())
+
+        # 将原始字幕的坐标更新为归一后的坐标
+        self.raw_subtitles.set_coordinates(coordinates)
         # 坐标点列表
-        coordinates_list = []
-        # 帧列表
-        frame_no_list = []
-        # 内容列表
-        content_list = []
-        while line:
-            frame_no = line.split('\t')[0]
-            text_position = line.split('\t')[1].split('(')[1].split(')')[0].split(', ')
-            content = line.split('\t')[2]
-            frame_no_list.append(frame_no)
-            coordinates_list.append((int(text_position[0]),
-                                     int(text_position[1]),
-                                     int(text_position[2]),
-                                     int(text_position[3])))
-            content_list.append(content)
-            line = f.readline()
-        f.close()
-        # 将坐标列表的相似值统一
-        coordinates_list = self._unite_coordinates(coordinates_list)
-
-        # 将原txt文件的坐标更新为归一后的坐标
-        with open(self.raw_subtitle_path, mode='w', encoding='utf-8') as f:
-            for frame_no, coordinate, content in zip(frame_no_list, coordinates_list, content_list):
-                f.write(f'{frame_no}\t{coordinate}\t{content}')
-
-        if len(Counter(coordinates_list).most_common()) > config.waterarkAreaNum.value:
+        coordinates_list = [tuple(coordinate) for coordinate in coordinates.tolist()]
+
+        coordinates_counter = Counter(coordinates_list)
+        if len(coordinates_counter) > config.waterarkAreaNum.value:
             # 读取配置文件，返回可能为水印区域的坐标列表
-            return Counter(coordinates_list).most_common(config.waterarkAreaNum.value)
+            return coordinates_counter.most_common(config.waterarkAreaNum.value)
         else:
             # 不够则有几个返回几个
-            return Counter(coordinates_list).most_common()
+            return coordinates_counter.most_common()
 
     def _detect_subtitle_area(self):
         """
-        读取过滤水印区域后的raw txt文件，根据坐标信息，查找字幕区域
+        读取过滤水印区域后的原始字幕，根据坐标信息，查找字幕区域
         假定：字幕区域在y轴上有一个相对固定的坐标范围，相对于场景文本，这个范围出现频率更高
         :return 返回字幕的区域位置
         """
-        # 打开去水印区域处理过的raw txt
-        f = open(self.raw_subtitle_path, mode='r', encoding='utf-8')  # 打开txt文件，以‘utf-8’编码读取
-        line = f.readline()  # 以行的形式进行读取文件
+        records = self.raw_subtitles.records
         # y坐标点列表
-        y_coordinates_list = []
-        while line:
-            text_position = line.split('\t')[1].split('(')[1].split(')')[0].split(', ')
-            y_coordinates_list.append((int(text_position[2]), int(text_position[3])))
-            line = f.readline()
-        f.close()
+        y_coordinates_list = list(zip(records['ymin'].tolist(), records['ymax'].tolist()))
         return Counter(y_coordinates_list).most_common(1)
 
+    def _get_frame_timestamp_index(self):
+        """
+        获取帧时间戳索引，只扫描一次视频的数据包
+        扫描失败或数据包与视频帧不是一一对应时，改为用OpenCV定位到各帧读取时间
+        """
+        if self.frame_timestamp_index is None:
+            index = FrameTimestampIndex.from_video(self.video_path, self.fps, self.frame_count)
+            self.frame_timestamp_index = index if index is not None else CaptureTimestampIndex(self.video_path, self.fps)
+        return self.frame_timestamp_index
+
     def _frame_to_timecode(self, frame_no):
         """
         将视频帧转换成时间
         :param frame_no: 视频的帧号，i.e. 第几帧视频帧
         :returns: SMPTE格式时间戳 as string, 如'01:02:12:032' 或者 '01:02:12;032'
         """
-        # 设置当前帧号
-        cap = cv2.VideoCapture(self.video_path)
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
-        ret, _ = cap.read()
-        # 获取当前帧号对应的时间戳
-        if ret:
-            milliseconds = cap.get(cv2.CAP_PROP_POS_MSEC)
-            if milliseconds <= 0:
-                return '{0:02d}:{1:02d}:{2:02d},{3:03d}'.format(int(frame_no / (3600 * self.fps)),
-                                                                int(frame_no / (60 * self.fps) % 60),
-                                                                int(frame_no / self.fps % 60),
-                                                                int(frame_no % self.fps))
-            seconds = milliseconds // 1000
-            milliseconds = int(milliseconds % 1000)
-            minutes = 0
-            hours = 0
-            if seconds >= 60:
-                minutes = int(seconds // 60)
-                seconds = int(seconds % 60)
-            if minutes >= 60:
-                hours = int(minutes // 60)
-                minutes = int(minutes % 60)
-            smpte_token = ','
-            cap.release()
-            return "%02d:%02d:%02d%s%03d" % (hours, minutes, seconds, smpte_token, milliseconds)
-        else:
-            return '{0:02d}:{1:02d}:{2:02d},{3:03d}'.format(int(frame_no / (3600 * self.fps)),
-                                                            int(frame_no / (60 * self.fps) % 60),
-                                                            int(frame_no / self.fps % 60),
-                                                            int(frame_no % self.fps))
+        return milliseconds_to_timecode(self._frameno_to_milliseconds(frame_no))
 
     def _timestamp_to_frameno(self, time_ms):
-        return int(time_ms / self.fps)
+        return self._get_frame_timestamp_index().frame_no(time_ms)
 
     def _frameno_to_milliseconds(self, frame_no):
-        return float(int(frame_no / self.fps * 1000))
+        return float(int(self._get_frame_timestamp_index().milliseconds(frame_no)))
 
     def _remove_duplicate_subtitle(self):
         """
-        读取原始的raw txt，去除重复行，返回去除了重复后的字幕列表
+        读取原始字幕，去除重复行，返回去除了重复后的字幕列表
         """
         self._concat_content_with_same_frameno()
-        with open(self.raw_subtitle_path, mode='r', encoding='utf-8') as r:
-            lines = r.readlines()
+        records = self.raw_subtitles.records
         RawInfo = namedtuple('RawInfo', 'no content')
-        content_list = []
-        for line in lines:
-            frame_no = line.split('\t')[0]
-            content = line.split('\t')[2]
-            content_list.append(RawInfo(frame_no, content))
+        content_list = [RawInfo(frame_no, content) for frame_no, content in
+                        zip(records['frame_no'].tolist(), self.raw_subtitles.text_list(records))]
         # 去重后的字幕列表
         unique_subtitle_list = []
         idx_i = 0
@@ -796,7 +1234,7 @@ class SubtitleExtractor:
             while idx_j < content_list_len:
                 # 计算当前行与下一行的Levenshtein距离
                 # 判决idx_j的下一帧是否与idx_i不同，若不同（或者是最后一帧）则找到结束帧
-                if idx_j + 1 == content_list_len or ratio(i.content.replace(' ', ''), content_list[idx_j + 1].content.replace(' ', '')) < (config.thresholdTextSimilarity.value / 100.0):
+                if idx_j + 1 == content_list_len or text_similarity(i.content.replace(' ', ''), content_list[idx_j + 1].content.replace(' ', '')) < (config.thresholdTextSimilarity.value / 100.0):
                     # 若找到终点帧,定义字幕结束帧帧号
                     end_frame = content_list[idx_j].no
                     if not self.use_vsf:
@@ -819,66 +1257,20 @@ class SubtitleExtractor:
 
     def _concat_content_with_same_frameno(self):
         """
-        将raw txt文本中具有相同帧号的字幕行合并
-        """
-        with open(self.raw_subtitle_path, mode='r', encoding='utf-8') as r:
-            lines = r.readlines()
-        content_list = []
-        frame_no_list = []
-        for line in lines:
-            frame_no = line.split('\t')[0]
-            frame_no_list.append(frame_no)
-            coordinate = line.split('\t')[1]
-            content = line.split('\t')[2]
-            content_list.append([frame_no, coordinate, content])
-
-        # 找出那些不止一行的帧号
-        frame_no_list = [i[0] for i in Counter(frame_no_list).most_common() if i[1] > 1]
-
-        # 找出这些帧号出现的位置
-        concatenation_list = []
-        for frame_no in frame_no_list:
-            position = [i for i, x in enumerate(content_list) if x[0] == frame_no]
-            concatenation_list.append((frame_no, position))
-
-        for i in concatenation_list:
-            content = []
-            for j in i[1]:
-                content.append(content_list[j][2])
-            content = ' '.join(content).replace('\n', ' ') + '\n'
-            for k in i[1]:
-                content_list[k][2] = content
-
-        # 将多余的字幕行删除
-        to_delete = []
-        for i in concatenation_list:
-            for j in i[1][1:]:
-                to_delete.append(content_list[j])
-        for i in to_delete:
-            if i in content_list:
-                content_list.remove(i)
-
-        with open(self.raw_subtitle_path, mode='w', encoding='utf-8') as f:
-            for frame_no, coordinate, content in content_list:
-                content = unicodedata.normalize('NFKC', content)
-                f.write(f'{frame_no}\t{coordinate}\t{content}')
-
-    def _unite_coordinates(self, coordinates_list):
-        """
-        给定一个坐标列表，将这个列表中相似的坐标统一为一个值
-        e.g. 由于检测框检测的结果不是一致的，相同位置文字的坐标可能一次检测为(255,123,456,789)，另一次检测为(253,122,456,799)
-        因此要对相似的坐标进行值的统一
-        :param coordinates_list 包含坐标点的列表
-        :return: 返回一个统一值后的坐标列表
-        """
-        # 将相似的坐标统一为一个
-        index = 0
-        for coordinate in coordinates_list:  # TODO：时间复杂度n^2，待优化
-            for i in coordinates_list:
-                if self.__is_coordinate_similar(coordinate, i):
-                    coordinates_list[index] = i
-            index += 1
-        return coordinates_list
+        将原始字幕中具有相同帧号的字幕行合并，合并后的字幕行使用第一行的坐标
+        """
+        records, texts = self.raw_subtitles.group_by_frame()
+        records['text'] = [self.raw_subtitles.intern(unicodedata.normalize('NFKC', ' '.join(content))) for content in texts]
+        self.raw_subtitles.replace(records)
+
+    @staticmethod
+    def _unite_coordinates(coordinates_list):
+        """
+        给定一个坐标列表，将这个列表中相似的坐标统一为一个值，见postprocess.unite_coordinates
+        :param coordinates_list 包含坐标点(xmin, xmax, ymin, ymax)的列表或(n, 4)数组
+        :return: 返回一个统一值后的坐标数组(n, 4)
+        """
+        return postprocess.unite_coordinates(coordinates_list, config.tolerantPixelX.value, config.tolerantPixelY.value)
 
     def _compute_image_similarity(self, image1, image2):
         """
@@ -908,7 +1300,7 @@ class SubtitleExtractor:
         获取字幕区域内的文本内容
         """
         box, text = ocr_result
-        coordinates = get_coordinates(box)
+        coordinates = subtitle_ocr.offset_coordinates(get_coordinates(box), self._get_frame_roi())
         area_text = []
         for content, coordinate in zip(text, coordinates):
             sub_area = self.sub_area
@@ -921,23 +1313,25 @@ class SubtitleExtractor:
                     area_text.append(content[0])
         return area_text
 
-    def _compare_ocr_result(self, result_cache, img1, img1_no, img2, img2_no):
+    def _compare_ocr_result(self, result_cache, img1, img1_no, img2, img2_no, img1_boxes=None, img2_boxes=None):
         """
         比较两张图片预测出的字幕区域文本是否相同
+        :param img1_boxes img1已检测到的文本框，None时识别前重新检测
+        :param img2_boxes img2已检测到的文本框，None时识别前重新检测
         """
         if self.ocr is None:
-            self.ocr = OcrRecogniser()
+            self.ocr = create_recogniser(self.ocr_server, self.hardware_accelerator)
         if img1_no in result_cache:
             area_text1 = result_cache[img1_no]['text']
         else:
-            dt_box, rec_res = self.ocr.predict(img1)
+            dt_box, rec_res = self.ocr.predict(img1, img1_boxes)
             area_text1 = "".join(self.__get_area_text((dt_box, rec_res)))
             result_cache[img1_no] = {'text': area_text1, 'dt_box': dt_box, 'rec_res': rec_res}
 
         if img2_no in result_cache:
             area_text2 = result_cache[img2_no]['text']
         else:
-            dt_box, rec_res = self.ocr.predict(img2)
+            dt_box, rec_res = self.ocr.predict(img2, img2_boxes)
             area_text2 = "".join(self.__get_area_text((dt_box, rec_res)))
             result_cache[img2_no] = {'text': area_text2, 'dt_box': dt_box, 'rec_res': rec_res}
         delete_no_list = []
@@ -951,17 +1345,6 @@ class SubtitleExtractor:
         else:
             return False
 
-    @staticmethod
-    def __is_coordinate_similar(coordinate1, coordinate2):
-        """
-        计算两个坐标是否相似，如果两个坐标点的xmin,xmax,ymin,ymax的差值都在像素点容忍度内
-        则认为这两个坐标点相似
-        """
-        return abs(coordinate1[0] - coordinate2[0]) < config.tolerantPixelX and \
-            abs(coordinate1[1] - coordinate2[1]) < config.tolerantPixelX and \
-            abs(coordinate1[2] - coordinate2[2]) < config.tolerantPixelY and \
-            abs(coordinate1[3] - coordinate2[3]) < config.tolerantPixelY
-
     @staticmethod
     def __get_thum(image, size=(64, 64), greyscale=False):
         """
@@ -999,40 +1382,197 @@ class SubtitleExtractor:
         # 通知所有监听器
         self.notify_progress_listeners()
 
-    def start_subtitle_ocr_async(self):
-        def get_ocr_progress():
+    def put_frame_task(self, total_frame_count, frame_no, frame, dt_box=None, rec_res=None, cropped=False,
+                       end_frame_no=None):
+        """
+        将已解码的视频帧裁剪为识别区域后写入共享内存，并向OCR任务队列添加只带槽位索引的任务
+        :param dt_box 识别区域内的检测框
+        :param cropped 视频帧是否已经裁剪为识别区域
+        :param end_frame_no 字幕不变区间的结束帧，frame为该区间中用于识别的一帧
+        """
+        worker = self._next_ocr_worker()
+        roi = self._get_frame_roi()
+        if not cropped:
+            frame = subtitle_ocr.crop_frame(frame, roi)
+        while True:
+            try:
+                slot = worker.frame_buffer.put(frame, timeout=1)
+                break
+            except queue.Empty:
+                # 共享内存槽位已满, OCR进程异常退出时不再等待
+                if not worker.process.is_alive():
+                    raise RuntimeError("subtitle ocr process exited unexpectedly")
+        task = subtitle_ocr.OcrTask(total_frame_count, frame_no, dt_box, rec_res, None, roi, slot, end_frame_no)
+        worker.task_queue.put(task)
+
+    def put_ocr_task(self, task):
+        """
+        向OCR进程池添加不经过共享内存的识别任务，由OCR进程自行读取视频帧
+        """
+        self._next_ocr_worker().task_queue.put(task)
+
+    def _next_ocr_worker(self):
+        """
+        按轮询方式选择接收下一个任务的OCR进程
+        """
+        with self.ocr_worker_lock:
+            worker = self.ocr_workers[self.ocr_worker_index]
+            self.ocr_worker_index = (self.ocr_worker_index + 1) % len(self.ocr_workers)
+            self.ocr_task_count += 1
+        return worker
+
+    def release_frame_buffer(self, frame_buffer):
+        """
+        释放视频帧共享内存
+        """
+        if frame_buffer is not None:
+            frame_buffer.close()
+            frame_buffer.unlink()
+
+    def start_subtitle_ocr_async(self, use_frame_buffer=True, neighbour_frames=True):
+        """
+        创建字幕OCR进程池，每个进程加载独立的模型，识别任务按轮询方式分配
+        :param use_frame_buffer 是否通过共享内存传递已解码的视频帧
+        :param neighbour_frames 视频帧是否按顺序提交，只有一个OCR进程时各进程依次收到视频中相邻的帧
+        :return OcrWorker列表
+        """
+        # 已经结束的OCR进程数
+        finished_workers = []
+
+        def get_ocr_progress(worker):
             """
             获取ocr识别进度
             """
-            # 获取视频总帧数
-            total_frame_count = self.frame_count
-            # 是否打印提示开始查找字幕的信息
-            notify = True
             while True:
-                current_frame_no = self.subtitle_ocr_progress_queue.get(block=True)
+                current_frame_no = worker.progress_queue.get(block=True)
+                with self.ocr_worker_lock:
+                    # 是否打印提示开始查找字幕的信息
+                    notify = self.ocr_finished_count == 0 and not finished_workers
+                    if current_frame_no == -1:
+                        finished_workers.append(worker)
+                    else:
+                        self.ocr_finished_count += 1
+                    finished = len(finished_workers) == len(self.ocr_workers)
+                    task_count = max(self.ocr_task_count, 1)
                 if notify:
                     self.append_output(tr['Main']['StartFindSub'])
-                    notify = False
+                # OCR进度不会超过视频帧提取进度
                 self.update_progress(
-                    ocr=100 if current_frame_no == -1 else (current_frame_no / total_frame_count * 100))
-                # self.append_output(f'recv total_ms:{total_ms}')
+                    ocr=100 if finished else (self.progress_frame_extract * min(self.ocr_finished_count / task_count, 1)))
                 if current_frame_no == -1:
-                    return
+                    break
+            # 进程保存识别结果后，进度队列用于回复识别请求
+            while worker.progress_queue.get(block=True) != subtitle_ocr.OCR_RESULTS_SAVED:
+                pass
+        worker_count = self._get_ocr_worker_count()
+        self.ocr_raw_subtitle_paths = [os.path.join(self.subtitle_output_dir, f'raw_{i}.npz') for i in range(worker_count)]
+        self.ocr_worker_index = 0
+        self.ocr_task_count = 0
+        self.ocr_finished_count = 0
+        self.ocr_workers = [self._start_ocr_worker(path, use_frame_buffer, neighbour_frames and worker_count == 1)
+                            for path in self.ocr_raw_subtitle_paths]
+        if worker_count > 1:
+            self.append_output(tr['Main']['OcrWorkerCount'].format(worker_count))
+        # 每个OCR进程开启一个线程负责更新OCR进度
+        self.ocr_progress_threads = [Thread(target=get_ocr_progress, args=(worker,), daemon=True) for worker in self.ocr_workers]
+        for thread in self.ocr_progress_threads:
+            thread.start()
+        return self.ocr_workers
+
+    def finish_subtitle_ocr(self, keep_workers=False):
+        """
+        通知所有OCR进程识别结束，等待识别结果保存后按帧号顺序合并各进程的识别结果
+        :param keep_workers 为True时OCR进程继续运行，用已加载的模型响应识别请求，之后需要调用close_ocr_workers
+        """
+        try:
+            for worker in self.ocr_workers:
+                # 往字幕OCR任务队列中，添加OCR识别任务结束标志
+                worker.task_queue.put(subtitle_ocr.OcrTask(self.frame_count, -1, None, None, None, None))
+            for worker, thread in zip(self.ocr_workers, self.ocr_progress_threads):
+                # 进度线程在进程保存识别结果后结束，进程异常退出时不再等待
+                while thread.is_alive() and worker.process.is_alive():
+                    thread.join(0.5)
+        finally:
+            if not keep_workers:
+                self.close_ocr_workers()
+        self.raw_subtitles = load_subtitle_stores(self.ocr_raw_subtitle_paths)
+        self.language_raw_subtitles = {
+            lang: load_subtitle_stores([subtitle_ocr.language_raw_subtitle_path(path, lang) for path in self.ocr_raw_subtitle_paths])
+            for lang in self.separate_languages
+        }
+
+    def close_ocr_workers(self):
+        """
+        通知OCR进程退出，等待退出后释放视频帧共享内存
+        """
+        try:
+            for worker in self.ocr_workers:
+                worker.task_queue.put(None)
+            for worker in self.ocr_workers:
+                worker.process.join()
+        finally:
+            for worker in self.ocr_workers:
+                self.release_frame_buffer(worker.frame_buffer)
+            self.ocr_workers = []
+            self.ocr_progress_threads = []
+
+    def close_recogniser(self):
+        """
+        断开主进程与OCR推理服务的连接，释放传递视频帧的共享内存
+        """
+        if self.ocr is not None and hasattr(self.ocr, 'close'):
+            self.ocr.close()
+            self.ocr = None
+
+    @staticmethod
+    def _wait_ocr_worker_reply(worker):
+        """
+        等待OCR进程回复识别请求
+        :return 识别结果[(text, score), ...]，进程已经退出时返回None
+        """
+        while True:
+            try:
+                return worker.progress_queue.get(timeout=0.5)
+            except queue.Empty:
+                if not worker.process.is_alive():
+                    return None
+
+    def _start_ocr_worker(self, raw_subtitle_path, use_frame_buffer=True, neighbour_frames=True):
+        """
+        创建一个字幕OCR识别进程
+        :param raw_subtitle_path 该进程输出的原始字幕文件路径
+        :param use_frame_buffer 是否通过共享内存传递已解码的视频帧
+        :param neighbour_frames 该进程依次收到的是否为视频中相邻的帧
+        :return OcrWorker
+        """
         options = {
             'REC_CHAR_TYPE': config.language.value,
             'DROP_SCORE': config.dropScore.value / 100.0,
             'SUB_AREA_DEVIATION_RATE': config.subtitleAreaDeviationRate.value / 100.0,
             'DEBUG_OCR_LOSS': config.debugOcrLoss.value,
             'HARDWARD_ACCELERATOR': self.hardware_accelerator,
+            'OCR_FRAME_BATCH_SIZE': config.ocrFrameBatchSize.value,
+            'OCR_SERVER': self.ocr_server,
+            'SEPARATE_LANGUAGES': self.separate_languages,
+            'STREAM_SUBTITLE_PATH': self.stream_subtitle_path,
+            'STREAM_SUBTITLE_FINAL': self.stream_subtitle_final,
+            'KEEP_RAW_SUBTITLES': config.debugNoDeleteCache.value,
+            'TEXT_SIMILARITY': config.thresholdTextSimilarity.value / 100.0,
+            'FRAME_TIMESTAMP_INDEX': self._get_frame_timestamp_index() if self.stream_subtitle_path is not None else None,
+            'FPS': self.fps,
+            'EVENT_QUEUE': self.event_queue if self.stream_subtitle_final else None,
+            # 收到的是视频中相邻的帧时，级联识别才与上一帧比较
+            'CASCADE_NEIGHBOUR_FRAMES': neighbour_frames,
         }
-        process, task_queue, progress_queue = subtitle_ocr.async_start(self.video_path, self.raw_subtitle_path, self.sub_area, options)
+        frame_buffer = None
+        if use_frame_buffer:
+            # 共享内存槽位大小为识别区域的尺寸
+            _, _, roi_width, roi_height = self._get_frame_roi()
+            frame_buffer = SharedFrameBuffer((roi_height, roi_width, 3), config.sharedFrameBufferSize.value)
+        process, task_queue, progress_queue = subtitle_ocr.async_start(self.video_path, raw_subtitle_path, self.sub_area, options, frame_buffer)
         ProcessManager.instance().add_process(process)
         self.manage_process(process.pid)
-        self.subtitle_ocr_task_queue = task_queue
-        self.subtitle_ocr_progress_queue = progress_queue
-        # 开启线程负责更新OCR进度
-        Thread(target=get_ocr_progress, daemon=True).start()
-        return process
+        return subtitle_ocr.OcrWorker(process, task_queue, progress_queue, frame_buffer)
 
     def srt2txt(self, srt_file):
         subs = pysrt.open(srt_file, encoding='utf-8')
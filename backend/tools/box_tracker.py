@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 文本检测框跟踪，字幕停留在画面上时沿用上一次检测的文本框，跳过DB检测
+"""
+import cv2
+import numpy as np
+from backend.config import config
+from backend.tools.change_detector import ChangeDetector, compute_signature, stroke_edge_mask
+
+
+def box_iou(box1, box2):
+    """
+    计算两个矩形(xmin, ymin, xmax, ymax)的IoU
+    """
+    w = min(box1[2], box2[2]) - max(box1[0], box2[0])
+    h = min(box1[3], box2[3]) - max(box1[1], box2[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    intersection = w * h
+    union = (box1[2] - box1[0]) * (box1[3] - box1[1]) + (box2[2] - box2[0]) * (box2[3] - box2[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class BoxTracker:
+    """
+    检测框跟踪
+    与上一次检测的帧相比，识别区域的签名没有变化，且每个检测框内文字笔画的范围与上次的IoU足够大、框内灰度足够接近时，
+    认为文本框没有移动，直接沿用上次的检测框，只需要识别文本
+    """
+
+    def __init__(self, change_detector, iou_threshold=0.8, intensity_threshold=0.04, edge_threshold=64):
+        """
+        :param change_detector ChangeDetector，识别区域签名变化时重新检测
+        :param iou_threshold 检测框内文字笔画外接矩形的IoU阈值
+        :param intensity_threshold 检测框内灰度平均绝对差阈值[0, 1]
+        :param edge_threshold 文字笔画边缘的梯度阈值，见change_detector.stroke_edge_mask
+        """
+        self.change_detector = change_detector
+        self.iou_threshold = iou_threshold
+        self.intensity_threshold = intensity_threshold
+        self.edge_threshold = edge_threshold
+        # 上一次检测的帧的签名、灰度图、检测框，以及每个检测框的范围与其中文字笔画的外接矩形
+        self.signature = None
+        self.gray = None
+        self.boxes = None
+        self.box_rects = []
+        self.stroke_rects = []
+
+    def track(self, image, signature=None):
+        """
+        判断能否沿用上一次检测的文本框
+        :param image 识别区域的BGR图像
+        :param signature 图像的签名，None时根据image计算
+        :return 可以沿用的检测框，需要重新检测时为None
+        """
+        if self.signature is None:
+            return None
+        if signature is None:
+            signature = compute_signature(image)
+        if image.shape[:2] != self.gray.shape[:2] or not self.change_detector.is_same(self.signature, signature):
+            return None
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        for rect, stroke_rect in zip(self.box_rects, self.stroke_rects):
+            x1, y1, x2, y2 = rect
+            mad = float(cv2.absdiff(self.gray[y1:y2, x1:x2], gray[y1:y2, x1:x2]).mean()) / 255
+            if mad > self.intensity_threshold:
+                return None
+            current_stroke_rect = self.__stroke_rect(gray, rect)
+            if stroke_rect is None or current_stroke_rect is None:
+                if stroke_rect is not current_stroke_rect:
+                    return None
+            elif box_iou(stroke_rect, current_stroke_rect) < self.iou_threshold:
+                return None
+        return self.boxes
+
+    def update(self, image, boxes, signature=None):
+        """
+        记录一次完整检测的结果
+        :param image 识别区域的BGR图像
+        :param boxes 检测框，每个检测框为4个顶点
+        :param signature 图像的签名，None时根据image计算
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        h, w = gray.shape[:2]
+        self.signature = signature if signature is not None else compute_signature(image)
+        self.gray = gray.copy()
+        self.boxes = boxes
+        self.box_rects = []
+        self.stroke_rects = []
+        for box in boxes:
+            points = np.asarray(box, dtype=np.float64).reshape(-1, 2)
+            # 检测框向外扩展半个框高，文字移动时笔画范围会越过原检测框
+            margin = (points[:, 1].max() - points[:, 1].min()) / 2
+            x1 = int(max(points[:, 0].min() - margin, 0))
+            y1 = int(max(points[:, 1].min() - margin, 0))
+            x2 = int(min(points[:, 0].max() + margin + 1, w))
+            y2 = int(min(points[:, 1].max() + margin + 1, h))
+            rect = (x1, y1, max(x2, x1 + 1), max(y2, y1 + 1))
+            self.box_rects.append(rect)
+            self.stroke_rects.append(self.__stroke_rect(gray, rect))
+
+    def __stroke_rect(self, gray, rect):
+        """
+        计算rect范围内文字笔画边缘的外接矩形
+        """
+        x1, y1, x2, y2 = rect
+        patch = gray[y1:y2, x1:x2]
+        ys, xs = np.nonzero(stroke_edge_mask(patch, self.edge_threshold))
+        if len(xs) == 0:
+            return None
+        return x1 + int(xs.min()), y1 + int(ys.min()), x1 + int(xs.max()) + 1, y1 + int(ys.max()) + 1
+
+
+def create_box_tracker():
+    """
+    根据配置创建检测框跟踪器，未开启时返回None
+    """
+    if not config.boxTracker.value:
+        return None
+    return BoxTracker(ChangeDetector(config.changeDetectMadThreshold.value / 100.0,
+                                     config.changeDetectMaskThreshold.value / 100.0))
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 字幕区域变化检测，通过比较缩小后的灰度图与文字掩码判断两帧的字幕是否相同，避免逐帧OCR
+"""
+from collections import namedtuple
+import cv2
+import numpy as np
+
+# 计算签名时将识别区域缩放到的宽度
+SIGNATURE_WIDTH = 320
+
+# 字幕不变的连续帧区间
+# start_frame_no起始帧, end_frame_no结束帧(含), best_frame_no区间内最清晰的帧, image最清晰帧的识别区域图像
+Segment = namedtuple('Segment', 'start_frame_no end_frame_no best_frame_no image')
+
+
+class RoiSignature:
+    """
+    识别区域的紧凑签名
+    gray: 缩小后的灰度图
+    mask: 文字掩码，见stroke_edge_mask
+    """
+    __slots__ = ('gray', 'mask', 'mask_count')
+
+    def __init__(self, gray, mask):
+        self.gray = gray
+        self.mask = mask
+        self.mask_count = int(np.count_nonzero(mask))
+
+
+def stroke_edge_mask(gray, edge_threshold=64):
+    """
+    文字掩码，字幕文字的笔画边缘形态学梯度很大，与颜色无关
+    :param gray 灰度图
+    :param edge_threshold 形态学梯度大于该值的像素视为文字笔画边缘
+    :return 布尔数组，与gray形状相同
+    """
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, np.ones((3, 3), dtype=np.uint8))
+    return gradient > edge_threshold
+
+
+def compute_signature(image, width=SIGNATURE_WIDTH, edge_threshold=64):
+    """
+    计算识别区域图像的签名
+    :param image BGR图像
+    :param width 缩放后的宽度，图像更窄时不放大
+    :param edge_threshold 形态学梯度大于该值的像素视为文字笔画边缘
+    :return RoiSignature
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    h, w = gray.shape[:2]
+    if w > width:
+        gray = cv2.resize(gray, (width, max(int(round(h * width / w)), 1)), interpolation=cv2.INTER_AREA)
+    return RoiSignature(gray, stroke_edge_mask(gray, edge_threshold))
+
+
+def signature_distance(signature1, signature2, bands=16):
+    """
+    计算两个签名的差异
+    文字掩码按列切分为bands个竖条分别比较，只改动了一两个字时，变化集中在少数竖条中，不会被整行的笔画数量稀释
+    :return (灰度平均绝对差[0, 1], 竖条中文字掩码异或比例的最大值[0, 1])
+    """
+    if signature1.gray.shape != signature2.gray.shape:
+        return 1.0, 1.0
+    mad = float(cv2.absdiff(signature1.gray, signature2.gray).mean()) / 255
+    if signature1.mask_count == 0 and signature2.mask_count == 0:
+        return mad, 0.0
+    width = signature1.mask.shape[1]
+    bands = max(min(bands, width), 1)
+    edges = np.linspace(0, width, bands + 1).astype(np.int64)
+    # 每列的异或像素数与笔画像素数，再按竖条求和
+    xor_columns = np.count_nonzero(signature1.mask ^ signature2.mask, axis=0)
+    union_columns = np.count_nonzero(signature1.mask | signature2.mask, axis=0)
+    xor_bands = np.add.reduceat(xor_columns, edges[:-1])
+    union_bands = np.add.reduceat(union_columns, edges[:-1])
+    # 笔画很少的竖条以整行平均笔画数为分母，避免零星噪点被放大
+    min_union = max(max(signature1.mask_count, signature2.mask_count) / bands, 1)
+    return mad, float(np.max(xor_bands / np.maximum(union_bands, min_union)))
+
+
+class ChangeDetector:
+    """
+    判断两帧识别区域中的字幕是否相同
+    差异都低于阈值时认为是同一条字幕，否则需要OCR确认
+    """
+
+    def __init__(self, mad_threshold=0.03, mask_threshold=0.08):
+        """
+        :param mad_threshold 灰度平均绝对差阈值
+        :param mask_threshold 文字掩码异或比例阈值
+        """
+        self.mad_threshold = mad_threshold
+        self.mask_threshold = mask_threshold
+
+    def is_same(self, signature1, signature2):
+        mad, xor = signature_distance(signature1, signature2)
+        return mad <= self.mad_threshold and xor <= self.mask_threshold
+
+
+def frame_sharpness(signature):
+    """
+    计算帧的清晰度得分，即缩小后灰度图的拉普拉斯方差
+    文字笔画越锐利、与背景对比度越高得分越高，字幕淡入淡出或运动模糊的帧得分较低
+    """
+    return float(cv2.Laplacian(signature.gray, cv2.CV_32F).var())
+
+
+class StableSegmenter:
+    """
+    将逐帧输入的识别区域划分为字幕不变的区间
+    每一帧都与区间第一帧比较，变化超过阈值时结束当前区间，同时记录区间内最清晰的一帧用于OCR
+    """
+
+    def __init__(self, change_detector, min_frame_count=1, min_mask_ratio=0.001):
+        """
+        :param change_detector ChangeDetector
+        :param min_frame_count 帧数少于该值的区间视为过渡帧，与上一个输出区间的间隔同样少于该值时丢弃，
+                               背景持续变化时OCR的频率不会超过按该间隔采样
+        :param min_mask_ratio 文字掩码像素比例低于该值的区间没有文字，直接丢弃
+        """
+        self.change_detector = change_detector
+        self.min_frame_count = max(int(min_frame_count), 1)
+        self.min_mask_ratio = min_mask_ratio
+        # 当前区间的起始帧号、结束帧号、第一帧签名，以及最清晰帧的帧号、得分、签名与图像
+        self.start_frame_no = None
+        self.end_frame_no = None
+        self.reference_signature = None
+        self.best_frame_no = None
+        self.best_score = None
+        self.best_signature = None
+        self.best_image = None
+        # 上一个输出区间的起始帧号
+        self.last_output_frame_no = None
+
+    def push(self, frame_no, image, signature=None):
+        """
+        输入一帧识别区域图像
+        :param frame_no 帧号，需要连续递增
+        :param image 识别区域的BGR图像，需要保留时会被复制
+        :param signature 已经计算好的签名，None时根据image计算
+        :return 因这一帧而结束的区间Segment，没有结束或区间被丢弃时为None
+        """
+        if signature is None:
+            signature = compute_signature(image)
+        segment = None
+        if self.reference_signature is not None and not self.change_detector.is_same(self.reference_signature, signature):
+            segment = self.flush()
+        if self.reference_signature is None:
+            self.start_frame_no = frame_no
+            self.reference_signature = signature
+        self.end_frame_no = frame_no
+        score = frame_sharpness(signature)
+        if self.best_score is None or score > self.best_score:
+            self.best_frame_no = frame_no
+            self.best_score = score
+            self.best_signature = signature
+            self.best_image = image.copy()
+        return segment
+
+    def flush(self):
+        """
+        结束当前区间
+        :return 需要OCR的区间Segment，没有区间或区间被丢弃时为None
+        """
+        if self.reference_signature is None:
+            return None
+        segment = Segment(self.start_frame_no, self.end_frame_no, self.best_frame_no, self.best_image)
+        signature = self.best_signature
+        self.reference_signature = None
+        self.best_score = None
+        self.best_signature = None
+        self.best_image = None
+        if signature.mask_count < signature.mask.size * self.min_mask_ratio:
+            return None
+        frame_count = segment.end_frame_no - segment.start_frame_no + 1
+        if frame_count < self.min_frame_count and self.last_output_frame_no is not None \
+                and segment.start_frame_no - self.last_output_frame_no < self.min_frame_count:
+            return None
+        self.last_output_frame_no = segment.start_frame_no
+        return segment
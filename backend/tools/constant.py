@@ -24,6 +24,17 @@ class VideoSubFinderDecoder(Enum):
     OPENCV = "OpenCV"
     FFMPEG = "FFmpeg"
 
+
+class FrameSourceBackend(Enum):
+    OPENCV = "OpenCV"
+    FFMPEG = "FFmpeg"
+
+class OnnxGraphOptimization(Enum):
+    DISABLE = "Disable"
+    BASIC = "Basic"
+    EXTENDED = "Extended"
+    ALL = "All"
+
 BGR_COLOR_GREEN = (0, 0xff, 0)
 BGR_COLOR_BLUE = (0xff, 0, 0)
 BGR_COLOR_RED = (0, 0, 0xff)
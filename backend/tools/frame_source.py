@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 视频帧来源，统一OpenCV与ffmpeg管道两种读取视频帧的方式
+"""
+import math
+import subprocess
+import cv2
+import numpy as np
+
+
+class FrameSource:
+    """
+    视频帧来源基类
+    帧号从0开始，position为下一次read/grab将得到的帧号
+    """
+
+    def __init__(self, video_path):
+        self.video_path = video_path
+        self.frame_count = 0
+        self.fps = 0
+        self.frame_width = 0
+        self.frame_height = 0
+
+    def isOpened(self):
+        raise NotImplementedError
+
+    def read(self):
+        """
+        读取下一帧
+        :return (ret, frame)
+        """
+        raise NotImplementedError
+
+    def grab(self):
+        """
+        跳过下一帧，不返回图像
+        :return 是否成功
+        """
+        ret, _ = self.read()
+        return ret
+
+    def seek(self, frame_no):
+        """
+        定位到帧号为frame_no的帧，下一次读取从该帧开始
+        """
+        raise NotImplementedError
+
+    def seek_ms(self, milliseconds):
+        """
+        定位到时间为milliseconds的帧
+        """
+        self.seek(int(round(milliseconds / 1000 * self.fps)))
+
+    @property
+    def position(self):
+        raise NotImplementedError
+
+    def release(self):
+        raise NotImplementedError
+
+
+class OpenCVFrameSource(FrameSource):
+    """
+    使用cv2.VideoCapture读取视频帧
+    """
+
+    def __init__(self, video_path):
+        super().__init__(video_path)
+        self.cap = cv2.VideoCapture(video_path)
+        self.frame_count = self.cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        return self.cap.read()
+
+    def grab(self):
+        # grab只解码，不做颜色空间转换
+        return self.cap.grab()
+
+    def seek(self, frame_no):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
+
+    def seek_ms(self, milliseconds):
+        self.cap.set(cv2.CAP_PROP_POS_MSEC, milliseconds)
+
+    @property
+    def position(self):
+        return int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+    def release(self):
+        self.cap.release()
+
+
+class FFmpegFrameSource(FrameSource):
+    """
+    通过ffmpeg管道读取视频帧
+    裁剪(crop)与抽帧(frame_step)都在ffmpeg中完成，只有处理后的bgr24图像传回python，
+    每一帧都读入同一块可复用的缓冲区，需要保留图像时调用方应自行复制
+    """
+
+    def __init__(self, video_path, crop=None, frame_step=1):
+        """
+        :param video_path 视频路径
+        :param crop 裁剪区域(x, y, w, h)，None为不裁剪
+        :param frame_step 每隔多少帧输出一帧，按帧序号抽帧，保证输出帧与逐帧读取时的帧号一致
+        """
+        super().__init__(video_path)
+        # 视频信息仍然从OpenCV中获取，保证与其他模块的帧数、帧率一致
+        cap = cv2.VideoCapture(video_path)
+        self.frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        self.frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+        self.crop = crop
+        self.frame_step = max(int(frame_step), 1)
+        _, _, w, h = crop if crop is not None else (0, 0, self.frame_width, self.frame_height)
+        self.buffer = np.empty((h, w, 3), dtype=np.uint8)
+        self.process = None
+        # 当前ffmpeg进程的起始帧号与已输出的帧数
+        self.start_frame_no = 0
+        self.output_count = 0
+        # 各帧相对于视频开始的显示时间(秒)，第一次跳转时扫描数据包得到，不能使用时为None
+        self.frame_times = None
+        self.keyframes = None
+        self.frame_times_loaded = False
+        self.opened = True
+        self.__start()
+
+    def __load_frame_times(self):
+        """
+        扫描数据包得到各帧的显示时间，要求每个数据包对应一帧，与FrameTimestampIndex相同
+        """
+        self.frame_times_loaded = True
+        from backend.tools.video_index import scan_video_packets
+        packets = scan_video_packets(self.video_path)
+        if packets is None:
+            return
+        pts, keys, time_base = packets
+        if len(pts) != int(self.frame_count):
+            print(f"Video packet count {len(pts)} does not match frame count {int(self.frame_count)}")
+            return
+        if np.any(np.diff(pts) <= 0):
+            # 时间戳相同的帧不能按时间区分
+            return
+        self.frame_times = pts * float(time_base)
+        self.keyframes = np.flatnonzero(keys)
+
+    def __build_seek(self):
+        """
+        可变帧率的视频不能按帧率换算跳转位置，按数据包的时间戳跳转到起始帧之前的关键帧，再按时间戳选出起始帧之后的帧
+        没有可用的数据包时间戳时从头解码，按帧序号选出起始帧之后的帧
+        :return (跳转位置(秒), 选帧的滤镜列表)
+        """
+        start, step = self.start_frame_no, self.frame_step
+        if start == 0:
+            return None, [f'select=not(mod(n\\,{step}))'] if step > 1 else []
+        if not self.frame_times_loaded:
+            self.__load_frame_times()
+        if self.frame_times is None or start >= len(self.frame_times):
+            if step > 1:
+                return None, [f'select=gte(n\\,{start})*not(mod(n-{start}\\,{step}))']
+            return None, [f'select=gte(n\\,{start})']
+        keyframe = self.keyframes[max(np.searchsorted(self.keyframes, start, side='right') - 1, 0)]
+        # 跳转位置向下取整到微秒，不会越过关键帧；跳转后输出的时间戳从跳转位置开始计算
+        seek_time = math.floor(self.frame_times[keyframe] * 1e6) / 1e6
+        # 以起始帧与前一帧时间的中点为界，避免浮点误差
+        threshold = (self.frame_times[start - 1] + self.frame_times[start]) / 2 - seek_time
+        filters = [f'select=gte(t\\,{threshold:.6f})']
+        if step > 1:
+            filters.append(f'select=not(mod(n\\,{step}))')
+        return seek_time, filters
+
+    def __build_filters(self, select_filters):
+        filters = list(select_filters)
+        if self.crop is not None:
+            x, y, w, h = self.crop
+            filters.append(f'crop={w}:{h}:{x}:{y}')
+        return filters
+
+    def __start(self):
+        import imageio_ffmpeg
+        cmd = [imageio_ffmpeg.get_ffmpeg_exe(), '-hide_banner', '-loglevel', 'error', '-nostdin']
+        seek_time, select_filters = self.__build_seek()
+        if seek_time is not None and seek_time > 0:
+            cmd += ['-ss', f'{seek_time:.6f}']
+        cmd += ['-i', self.video_path, '-map', '0:v:0', '-an', '-sn']
+        filters = self.__build_filters(select_filters)
+        if filters:
+            cmd += ['-vf', ','.join(filters)]
+        # 不复制或丢弃帧，输出帧与抽帧结果一一对应
+        cmd += ['-fps_mode', 'passthrough', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        bufsize=self.buffer.nbytes)
+        self.output_count = 0
+
+    def __stop(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.stdout.close()
+            self.process.wait()
+            self.process = None
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if self.process is None:
+            return False, None
+        view = memoryview(self.buffer).cast('B')
+        filled = 0
+        while filled < len(view):
+            n = self.process.stdout.readinto(view[filled:])
+            if not n:
+                # 视频已经读完
+                self.__stop()
+                self.opened = False
+                return False, None
+            filled += n
+        self.output_count += 1
+        return True, self.buffer
+
+    def seek(self, frame_no):
+        self.__stop()
+        self.start_frame_no = max(int(frame_no), 0)
+        self.opened = True
+        self.__start()
+
+    @property
+    def position(self):
+        """
+        下一次读取的帧在原视频中的帧号
+        """
+        return self.start_frame_no + self.output_count * self.frame_step
+
+    def release(self):
+        self.__stop()
+        self.opened = False
+
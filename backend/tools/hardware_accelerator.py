@@ -1,4 +1,4 @@
-from backend.config import tr
+from backend.config import config, tr
 import paddle
 
 class HardwareAccelerator:
@@ -17,7 +17,11 @@ class HardwareAccelerator:
     def __init__(self):
         self.__cuda = False
         self.__onnx_providers = []
+        # onnxruntime是否可以使用CPUExecutionProvider
+        self.__onnx_cpu = False
         self.__enabled = True
+        # 只使用CPU推理(paddle或ONNX Runtime CPU)，用于在CPU上对比不同推理方式的工具
+        self.__cpu_only = False
 
     def initialize(self):
         self.check_paddle()
@@ -32,11 +36,13 @@ class HardwareAccelerator:
                 self.__cuda = True
 
     def check_onnx(self):
-        if self.__cuda:
-            return
         try:
             import onnxruntime as ort
             available_providers = ort.get_available_providers()
+            # CPU不作为加速器，只在开启ONNX CPU推理或使用量化模型时使用
+            self.__onnx_cpu = "CPUExecutionProvider" in available_providers
+            if self.__cuda:
+                return
             for provider in available_providers:
                 if provider in [
                     "CPUExecutionProvider"
@@ -57,16 +63,17 @@ class HardwareAccelerator:
                 print(tr['Main']['OnnxExecutionProviderDetected'].format(provider))
                 self.__onnx_providers.append(provider)
         except ModuleNotFoundError as e:
-            print(tr['Main']['OnnxRuntimeNotInstall'])
+            if not self.__cuda:
+                print(tr['Main']['OnnxRuntimeNotInstall'])
 
     def has_accelerator(self):
-        if not self.__enabled:
+        if not self.__enabled or self.__cpu_only:
             return False
         return self.__cuda or len(self.__onnx_providers) > 0
 
     @property
     def accelerator_name(self):
-        if not self.__enabled:
+        if not self.__enabled or self.__cpu_only:
             return "CPU"
         if self.__cuda:
             return "GPU"
@@ -79,16 +86,36 @@ class HardwareAccelerator:
     def onnx_providers(self):
         if not self.__enabled:
             return []
-        return self.__onnx_providers
+        # 量化模式的INT8模型只在CPU上使用ONNX Runtime推理
+        if config.mode.value == 'quantized':
+            return ["CPUExecutionProvider"] if self.__onnx_cpu else []
+        if not self.__cpu_only and len(self.__onnx_providers) > 0:
+            return self.__onnx_providers
+        # 没有使用GPU时，可以在CPU上使用ONNX Runtime推理
+        if self.__onnx_cpu and not self.has_cuda() and config.onnxCpu.value:
+            return ["CPUExecutionProvider"]
+        return []
+
+    def is_onnx_cpu(self):
+        """
+        是否在CPU上使用ONNX Runtime推理
+        """
+        return self.onnx_providers == ["CPUExecutionProvider"]
 
     def has_cuda(self):
-        if not self.__enabled:
+        if not self.__enabled or self.__cpu_only:
             return False
         return self.__cuda
     
     def set_enabled(self, enable):
         self.__enabled = enable
 
+    def set_cpu_only(self, cpu_only):
+        """
+        只使用CPU推理，不使用GPU与GPU类的ONNX Runtime执行器，开启ONNX CPU推理或量化模式时仍可使用ONNX Runtime
+        """
+        self.__cpu_only = cpu_only
+
         
 
     
\ No newline at end of file
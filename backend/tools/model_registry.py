@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 模型注册表，同一进程中相同配置的文本检测与识别模型只加载一次，由字幕检测与文本识别共享
+"""
+import copy
+import threading
+from collections import namedtuple
+from backend.config import config
+from backend.tools.paddle_model_config import PaddleModelConfig
+
+# 模型规格，决定加载哪一份检测与识别模型，可以在进程之间传递
+# onnx_cpu_options为CPU上ONNX Runtime的会话参数OnnxCpuOptions，不在CPU上使用ONNX Runtime时为None
+# cascade_rec_model_dir为级联模式的精准识别模型路径，不使用级联模式时为None
+# extra_specs为双语字幕中其他语言的模型规格，检测结果共用，只使用其中的识别模型
+ModelSpec = namedtuple('ModelSpec', 'det_model_dir rec_model_dir lang model_version rec_image_shape '
+                                    'rec_batch_num max_batch_size use_gpu onnx_providers onnx_cpu_options '
+                                    'cascade_rec_model_dir extra_specs')
+# intra_op_threads算子内线程数, inter_op_threads算子间线程数, 0为自动; graph_optimization图优化级别; mem_arena是否使用内存池
+OnnxCpuOptions = namedtuple('OnnxCpuOptions', 'intra_op_threads inter_op_threads graph_optimization mem_arena')
+
+_lock = threading.Lock()
+# 已加载的PaddleOCR实例，键为ModelSpec
+_text_systems = {}
+# 已加载的级联精准识别模型，键为ModelSpec
+_cascade_recognizers = {}
+
+
+def get_second_language():
+    """
+    获取双语字幕的第二识别语言，未设置或与字幕语言相同时为None
+    """
+    language = config.secondLanguage.value
+    if language == 'none' or language == config.language.value:
+        return None
+    return language
+
+
+def model_spec(hardware_accelerator, language=None):
+    """
+    根据当前配置获取模型规格
+    :param hardware_accelerator HardwareAccelerator
+    :param language 识别语言，None为配置中的字幕语言，此时同时包含第二识别语言的模型规格
+    """
+    model_config = PaddleModelConfig(hardware_accelerator, language)
+    second_language = get_second_language() if language is None else None
+    return ModelSpec(
+        det_model_dir=model_config.convertToOnnxModelIfNeeded(model_config.DET_MODEL_PATH),
+        rec_model_dir=model_config.convertToOnnxModelIfNeeded(model_config.REC_MODEL_PATH),
+        lang=model_config.REC_CHAR_TYPE,
+        model_version=model_config.MODEL_VERSION,
+        rec_image_shape=model_config.REC_IMAGE_SHAPE,
+        rec_batch_num=config.recBatchNumber.value,
+        max_batch_size=config.maxBatchSize.value,
+        use_gpu=hardware_accelerator.has_cuda(),
+        onnx_providers=tuple(hardware_accelerator.onnx_providers),
+        onnx_cpu_options=OnnxCpuOptions(
+            intra_op_threads=config.onnxIntraOpThreads.value,
+            inter_op_threads=config.onnxInterOpThreads.value,
+            graph_optimization=config.onnxGraphOptimization.value.value,
+            mem_arena=config.onnxMemArena.value,
+        ) if hardware_accelerator.is_onnx_cpu() else None,
+        cascade_rec_model_dir=model_config.convertToOnnxModelIfNeeded(model_config.CASCADE_REC_MODEL_PATH)
+        if model_config.CASCADE_REC_MODEL_PATH else None,
+        extra_specs=(model_spec(hardware_accelerator, second_language),) if second_language else (),
+    )
+
+
+def create_onnx_session_options(onnx_cpu_options):
+    """
+    根据OnnxCpuOptions创建onnxruntime.SessionOptions
+    """
+    import onnxruntime as ort
+    graph_optimization_levels = {
+        'Disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        'Basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        'Extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        'All': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    sess_options = ort.SessionOptions()
+    sess_options.intra_op_num_threads = onnx_cpu_options.intra_op_threads
+    sess_options.inter_op_num_threads = onnx_cpu_options.inter_op_threads
+    # 算子间并行只在并行执行模式下生效
+    if onnx_cpu_options.inter_op_threads > 1:
+        sess_options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    sess_options.graph_optimization_level = graph_optimization_levels[onnx_cpu_options.graph_optimization]
+    sess_options.enable_cpu_mem_arena = onnx_cpu_options.mem_arena
+    return sess_options
+
+
+def get_text_system(hardware_accelerator):
+    """
+    获取共享的PaddleOCR实例
+    text_detector为文本检测模型，text_recognizer为文本识别模型
+    :param hardware_accelerator HardwareAccelerator
+    """
+    return get_text_system_by_spec(model_spec(hardware_accelerator))
+
+
+def get_text_system_by_spec(spec):
+    """
+    获取模型规格对应的共享PaddleOCR实例，首次获取时加载
+    :param spec ModelSpec
+    """
+    from paddleocr import PaddleOCR
+    with _lock:
+        if spec not in _text_systems:
+            _text_systems[spec] = PaddleOCR(
+                use_gpu=spec.use_gpu,
+                gpu_mem=500,
+                det_algorithm='DB',
+                # 设置文本检测模型路径
+                det_model_dir=spec.det_model_dir,
+                rec_algorithm='CRNN',
+                # 设置每张图文本框批处理数量
+                rec_batch_num=spec.rec_batch_num,
+                # 设置文本识别模型路径
+                rec_model_dir=spec.rec_model_dir,
+                max_batch_size=spec.max_batch_size,
+                det=True,
+                use_angle_cls=False,
+                drop_score=0,
+                lang=spec.lang,
+                ocr_version=f'PP-OCR{spec.model_version.lower()}',
+                rec_image_shape=spec.rec_image_shape,
+                use_onnx=len(spec.onnx_providers) > 0,
+                onnx_providers=list(spec.onnx_providers),
+                onnx_sess_options=create_onnx_session_options(spec.onnx_cpu_options) if spec.onnx_cpu_options else False,
+                debug=False,
+                show_log=False,
+            )
+        return _text_systems[spec]
+
+
+def get_cascade_recognizer_by_spec(spec):
+    """
+    获取级联模式的精准识别模型，参数与spec的轻量级识别模型相同，只替换模型路径
+    :return TextRecognizer，spec不使用级联模式时为None
+    """
+    if not spec.cascade_rec_model_dir:
+        return None
+    from paddleocr.tools.infer.predict_rec import TextRecognizer
+    text_system = get_text_system_by_spec(spec)
+    with _lock:
+        if spec not in _cascade_recognizers:
+            args = copy.copy(text_system.args)
+            args.rec_model_dir = spec.cascade_rec_model_dir
+            _cascade_recognizers[spec] = TextRecognizer(args)
+        return _cascade_recognizers[spec]
+
+
+def get_extra_recognizers_by_spec(spec):
+    """
+    获取双语字幕中其他语言的识别模型
+    其他语言的PaddleOCR实例同样由注册表共享，只使用其中的识别模型
+    :return [(语言, TextRecognizer), ...]
+    """
+    return [(extra_spec.lang, get_text_system_by_spec(extra_spec).text_recognizer) for extra_spec in spec.extra_specs]
+
+
+def get_text_detector(hardware_accelerator):
+    """
+    获取共享的文本检测模型
+    """
+    return get_text_system(hardware_accelerator).text_detector
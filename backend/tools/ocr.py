@@ -1,134 +1,237 @@
 import os
 from backend.config import *
 import importlib
-from paddleocr import PaddleOCR
+import copy
+import math
+import numpy as np
+from Levenshtein import ratio
+from paddleocr.tools.infer.predict_system import sorted_boxes
+from paddleocr.tools.infer.utility import get_rotate_crop_image, get_minarea_rect_crop
+from backend.tools.box_tracker import create_box_tracker
 from backend.tools.hardware_accelerator import HardwareAccelerator
-from backend.tools.paddle_model_config import PaddleModelConfig
+from backend.tools.postprocess import get_coordinates, rank_result
+from backend.tools.ocr_types import RecResult, CascadeState
+from backend.tools import model_registry
+
+# 文本行识别时输入宽度的分桶，文本行按缩放到模型高度后的宽度放入不小于该宽度的最小的桶
+REC_WIDTH_BUCKETS = (64, 96, 128, 192, 256, 320, 480, 640, 960, 1280)
+# 级联识别时，与相邻帧同一行的文本相似度不低于该值但不相同，认为是识别错误而不是字幕切换
+CASCADE_NEIGHBOUR_SIMILARITY = 0.5
+
 
 # 加载文本检测+识别模型
 class OcrRecogniser:
     def __init__(self):
         self.recogniser = None
+        # 模型规格，model_registry.ModelSpec
+        self.spec = None
+        # 级联模式的精准识别模型，不使用级联模式时为None
+        self.cascade_recognizer = None
+        # 双语字幕中其他语言的识别模型[(语言, TextRecognizer), ...]
+        self.extra_recognizers = []
+        # 级联识别的文本行总数，以及使用精准模型重新识别的文本行数
+        self.cascade_line_count = 0
+        self.cascade_refine_count = 0
+        # 未指定视频流时使用的级联识别状态
+        self.cascade_state = CascadeState()
+        # 按输入宽度分桶识别时使用的识别模型副本{(识别模型, 输入宽度): 副本}
+        self.bucket_recognizers = {}
         # 占位，应该由main.py初始化
         self.hardware_accelerator = HardwareAccelerator()
+        # 检测框跟踪，字幕未变化时沿用上一帧的检测框
+        self.box_tracker = create_box_tracker()
 
-    @staticmethod
-    def y_round(y):
-        y_min = y + 10 - y % 10
-        y_max = y - y % 10
-        if abs(y - y_min) < abs(y - y_max):
-            return y_min
-        else:
-            return y_max
+    def predict(self, image, dt_boxes=None, cascade_state=None):
+        """
+        识别图像中的文本
+        :param dt_boxes 已经检测到的文本框(如SubtitleDetect.detect_subtitle的结果)，None时先检测
+        :param cascade_state 图像所属视频流的级联识别状态CascadeState，None时使用self.cascade_state
+        """
+        return self.predict_batch([image], None if dt_boxes is None else [dt_boxes],
+                                  None if cascade_state is None else [cascade_state])[0]
 
-    def predict(self, image):
+    def predict_batch(self, images, boxes_list=None, cascade_states=None):
+        """
+        批量识别多帧图像
+        先逐帧检测文本框，再把所有帧的文本行图像合并后一次交给识别模型，使识别模型的每个batch都尽量装满
+        :param images 图像列表
+        :param boxes_list 各帧已经检测到的文本框，为None的帧需要检测
+        :param cascade_states 各帧所属视频流的级联识别状态CascadeState，同一视频流的帧共用一份，None时使用self.cascade_state
+        :return [(dt_box, rec_res), ...]，与逐帧调用predict的结果一一对应
+        """
         if not self.recogniser:
             self.recogniser = self.init_model()
-        detection_box, recognise_result, _ = self.recogniser(image, cls=False)
-        if len(detection_box) > 0:
-            coordinate_list = list()
-            if isinstance(detection_box, list):
-                for i in detection_box:
-                    i = list(i)
-                    (x1, y1) = int(i[0][0]), int(i[0][1])
-                    (x2, y2) = int(i[1][0]), int(i[1][1])
-                    (x3, y3) = int(i[2][0]), int(i[2][1])
-                    (x4, y4) = int(i[3][0]), int(i[3][1])
-                    xmin = max(x1, x4)
-                    xmax = min(x2, x3)
-                    ymin = max(y1, y2)
-                    ymax = min(y3, y4)
-                    coordinate_list.append([xmin, xmax, ymin, ymax])
-
-            # 计算有多少行字幕，将每行字幕最小的ymin值放入lines
-            lines = []
-            for i in coordinate_list:
-                if len(lines) < 1:
-                    lines.append(self.y_round(i[2]))
+        det_box_type = getattr(self.recogniser.args, 'det_box_type', 'quad')
+        # 每帧的检测框，以及所有帧的文本行图像
+        frame_boxes = []
+        crop_list = []
+        for index, image in enumerate(images):
+            dt_boxes = boxes_list[index] if boxes_list is not None else None
+            if dt_boxes is not None:
+                dt_boxes = sorted_boxes(np.asarray(dt_boxes, dtype=np.float32)) if len(dt_boxes) > 0 else []
+            else:
+                dt_boxes = self.detect(image, self.box_tracker)
+            for box in dt_boxes:
+                box = copy.deepcopy(box)
+                if det_box_type == 'quad':
+                    crop_list.append(get_rotate_crop_image(image, box))
                 else:
-                    if self.y_round(i[2]) not in lines \
-                            and self.y_round(i[2]) + 10 not in lines \
-                            and self.y_round(i[2]) - 10 not in lines:
-                        lines.append(self.y_round(i[2]))
-            lines = sorted(lines)
+                    crop_list.append(get_minarea_rect_crop(image, box))
+            frame_boxes.append(dt_boxes)
+        rec_res = self.recognize(crop_list)
+        if self.cascade_recognizer is not None:
+            if cascade_states is None:
+                cascade_states = [self.cascade_state] * len(frame_boxes)
+            self.refine_by_cascade(crop_list, frame_boxes, rec_res, cascade_states)
+        if self.extra_recognizers:
+            rec_res = self.recognize_multilingual(crop_list, rec_res)
+        # 按每帧的文本行数切分识别结果
+        results = []
+        start = 0
+        for dt_boxes in frame_boxes:
+            end = start + len(dt_boxes)
+            results.append(self.rank_result(list(dt_boxes), list(rec_res[start:end])))
+            start = end
+        return results
+
+    def detect(self, image, box_tracker=None):
+        """
+        检测图像中的文本框，并按从上到下、从左到右排序
+        :param box_tracker 检测框跟踪器，能沿用上一次的检测框时跳过检测
+        """
+        if not self.recogniser:
+            self.recogniser = self.init_model()
+        dt_boxes = box_tracker.track(image) if box_tracker is not None else None
+        if dt_boxes is None:
+            dt_boxes, _ = self.recogniser.text_detector(image)
+            dt_boxes = sorted_boxes(dt_boxes) if dt_boxes is not None and len(dt_boxes) > 0 else []
+            if box_tracker is not None:
+                box_tracker.update(image, dt_boxes)
+        return dt_boxes
 
-            for i in coordinate_list:
-                for j in lines:
-                    if abs(j - self.y_round(i[2])) <= 10:
-                        i[2] = j
+    def recognize(self, crop_list, text_recognizer=None):
+        """
+        识别文本行图像
+        识别模型会把一个batch中的图像都补齐到最宽的一张，且宽度不小于REC_IMAGE_SHAPE中的宽度，
+        因此先按缩放后的宽度分桶，每个桶使用紧凑的输入宽度单独识别，再按原顺序还原识别结果
+        :param crop_list 文本行图像列表
+        :param text_recognizer 识别模型，None为默认的识别模型
+        :return [(text, score), ...]
+        """
+        if len(crop_list) == 0:
+            return []
+        if text_recognizer is None:
+            text_recognizer = self.recogniser.text_recognizer
+        img_h = text_recognizer.rec_image_shape[1]
+        buckets = {}
+        for index, crop in enumerate(crop_list):
+            h, w = crop.shape[:2]
+            width = int(math.ceil(img_h * w / max(h, 1)))
+            bucket_width = next((bucket for bucket in REC_WIDTH_BUCKETS if bucket >= width), REC_WIDTH_BUCKETS[-1])
+            buckets.setdefault(bucket_width, []).append(index)
+        rec_res = [None] * len(crop_list)
+        for bucket_width, indices in buckets.items():
+            bucket_res, _ = self.get_bucket_recognizer(text_recognizer, bucket_width)([crop_list[i] for i in indices])
+            for i, res in zip(indices, bucket_res):
+                rec_res[i] = res
+        return rec_res
 
-            to_rank_res = list(zip(coordinate_list, recognise_result))
-            ranked_res = []
-            for line in lines:
-                tmp_list = []
-                for i in to_rank_res:
-                    if i[0][2] == line:
-                        tmp_list.append(i)
-                # 先根据纵坐标排序
-                for k in range(1, len(tmp_list)):
-                    for j in range(0, len(tmp_list) - k):
-                        if tmp_list[j][0][2] > tmp_list[j + 1][0][2]:
-                            print(tmp_list[j][0][2])
-                            tmp_list[j], tmp_list[j + 1] = tmp_list[j + 1], tmp_list[j]
-                # 再根据横坐标排列
-                for l in range(1, len(tmp_list)):
-                    for j in range(0, len(tmp_list) - l):
-                        if tmp_list[j][0][0] > tmp_list[j + 1][0][0]:
-                            tmp_list[j], tmp_list[j + 1] = tmp_list[j + 1], tmp_list[j]
-                for m in tmp_list:
-                    ranked_res.append(m)
-            dt_box = []
-            for i in [j[0] for j in ranked_res]:
-                dt_box.append([(i[0], i[2]), (i[1], i[2]), (i[1], i[3]), (i[0], i[3])])
-            res = [i[1] for i in ranked_res]
-            return dt_box, res
-        else:
-            return detection_box, recognise_result
+    def get_bucket_recognizer(self, text_recognizer, bucket_width):
+        """
+        获取以bucket_width为最小输入宽度的识别模型，超过最后一个桶的文本行仍按自身宽度识别
+        返回的是识别模型的浅拷贝，与原模型共用推理引擎，只有rec_image_shape不同，
+        不修改共享的识别模型，多个线程同时使用同一个识别模型时互不影响
+        """
+        key = (text_recognizer, bucket_width)
+        recognizer = self.bucket_recognizers.get(key)
+        if recognizer is None:
+            rec_image_shape = text_recognizer.rec_image_shape
+            recognizer = copy.copy(text_recognizer)
+            recognizer.rec_image_shape = [rec_image_shape[0], rec_image_shape[1], bucket_width] + list(rec_image_shape[3:])
+            self.bucket_recognizers[key] = recognizer
+        return recognizer
+
+    def recognize_multilingual(self, crop_list, rec_res):
+        """
+        双语字幕：文本行图像再交给其他语言的识别模型识别，每个文本行保留置信度最高的结果
+        :param rec_res 字幕语言的识别结果
+        :return [RecResult, ...]
+        """
+        results = [RecResult(text, score, self.spec.lang) for text, score in rec_res]
+        for lang, text_recognizer in self.extra_recognizers:
+            for i, (text, score) in enumerate(self.recognize(crop_list, text_recognizer)):
+                if score > results[i][1]:
+                    results[i] = RecResult(text, score, lang)
+        return results
+
+    def refine_by_cascade(self, crop_list, frame_boxes, rec_res, cascade_states):
+        """
+        级联识别：所有文本行先由轻量级模型识别，置信度低于阈值，或与同一视频流相邻帧同一行的文本相近但不相同的文本行，
+        再使用精准模型重新识别，直接修改rec_res
+        :param crop_list 所有帧的文本行图像
+        :param frame_boxes 每帧的检测框，顺序与crop_list一致
+        :param rec_res 轻量级模型的识别结果
+        :param cascade_states 各帧所属视频流的级联识别状态，识别后记录各视频流最后一帧的文本行
+        """
+        threshold = config.cascadeScoreThreshold.value / 100.0
+        refine = {i for i, (_, score) in enumerate(rec_res) if score < threshold}
+        # 各视频流在本批中最后一帧的文本行(index, ymin, ymax)
+        last_lines = {}
+        start = 0
+        for dt_boxes, cascade_state in zip(frame_boxes, cascade_states):
+            lines = []
+            for offset, box in enumerate(dt_boxes):
+                ys = np.asarray(box)[:, 1]
+                lines.append((start + offset, float(ys.min()), float(ys.max())))
+            if not cascade_state.compare_neighbours:
+                previous = []
+            elif cascade_state in last_lines:
+                previous = [(index, ymin, ymax, rec_res[index][0]) for index, ymin, ymax in last_lines[cascade_state]]
+            else:
+                previous = cascade_state.previous_lines
+            for index, ymin, ymax in lines:
+                text = rec_res[index][0]
+                for previous_index, previous_ymin, previous_ymax, previous_text in previous:
+                    # 纵向重叠超过较矮一行的一半视为同一行
+                    overlap = min(ymax, previous_ymax) - max(ymin, previous_ymin)
+                    if overlap < 0.5 * min(ymax - ymin, previous_ymax - previous_ymin):
+                        continue
+                    if text != previous_text and ratio(text, previous_text) >= CASCADE_NEIGHBOUR_SIMILARITY:
+                        refine.add(index)
+                        # 上一批的文本行已经返回，无法重新识别
+                        if previous_index is not None:
+                            refine.add(previous_index)
+            last_lines[cascade_state] = lines
+            start += len(dt_boxes)
+        if refine:
+            indices = sorted(refine)
+            for i, res in zip(indices, self.recognize([crop_list[i] for i in indices], self.cascade_recognizer)):
+                rec_res[i] = res
+        self.cascade_line_count += len(rec_res)
+        self.cascade_refine_count += len(refine)
+        # 各视频流最后一帧的最终结果与该视频流下一批的第一帧比较
+        for cascade_state, lines in last_lines.items():
+            cascade_state.previous_lines = [(None, ymin, ymax, rec_res[index][0]) for index, ymin, ymax in lines]
+
+    @staticmethod
+    def rank_result(detection_box, recognise_result):
+        """
+        将检测框转换为水平矩形，并按行从上到下、行内从左到右排列识别结果，见postprocess.rank_result
+        """
+        return rank_result(detection_box, recognise_result)
 
     def init_model(self):
-        model_config = PaddleModelConfig(self.hardware_accelerator)
-        onnx_providers = self.hardware_accelerator.onnx_providers
-        return PaddleOCR(
-            use_gpu=self.hardware_accelerator.has_cuda(),
-            gpu_mem=500,
-            det_algorithm='DB',
-            # 设置文本检测模型路径
-            det_model_dir=model_config.convertToOnnxModelIfNeeded(model_config.DET_MODEL_PATH),
-            rec_algorithm='CRNN',
-            # 设置每张图文本框批处理数量
-            rec_batch_num=config.recBatchNumber.value,
-            # 设置文本识别模型路径
-            rec_model_dir=model_config.convertToOnnxModelIfNeeded(model_config.REC_MODEL_PATH),
-            max_batch_size=config.maxBatchSize.value,
-            det=True,
-            use_angle_cls=False,
-            drop_score=0,
-            lang=model_config.REC_CHAR_TYPE,
-            ocr_version=f'PP-OCR{model_config.MODEL_VERSION.lower()}',
-            rec_image_shape=model_config.REC_IMAGE_SHAPE,
-            use_onnx=len(onnx_providers) > 0,
-            onnx_providers=onnx_providers,
-            debug=False, 
-            show_log=False,
-        )
-    
-def get_coordinates(dt_box):
-    """
-    从返回的检测框中获取坐标
-    :param dt_box 检测框返回结果
-    :return list 坐标点列表
-    """
-    coordinate_list = list()
-    if isinstance(dt_box, list):
-        for i in dt_box:
-            i = list(i)
-            (x1, y1) = int(i[0][0]), int(i[0][1])
-            (x2, y2) = int(i[1][0]), int(i[1][1])
-            (x3, y3) = int(i[2][0]), int(i[2][1])
-            (x4, y4) = int(i[3][0]), int(i[3][1])
-            xmin = max(x1, x4)
-            xmax = min(x2, x3)
-            ymin = max(y1, y2)
-            ymax = min(y3, y4)
-            coordinate_list.append((xmin, xmax, ymin, ymax))
-    return coordinate_list
+        # 同一进程中的检测与识别模型由模型注册表共享，只加载一次
+        self.load(model_registry.model_spec(self.hardware_accelerator))
+        return self.recogniser
+
+    def load(self, spec):
+        """
+        加载模型规格对应的模型
+        :param spec model_registry.ModelSpec
+        """
+        self.spec = spec
+        self.recogniser = model_registry.get_text_system_by_spec(spec)
+        self.cascade_recognizer = model_registry.get_cascade_recognizer_by_spec(spec)
+        self.extra_recognizers = model_registry.get_extra_recognizers_by_spec(spec)
+
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 在相同的视频帧上比较paddle推理与CPU上ONNX Runtime推理的速度与识别结果
+用法: python -m backend.tools.ocr_benchmark 视频路径 [--frames 100] [--intra-op-threads N] ...
+"""
+import argparse
+import time
+from backend.config import config
+from backend.tools import model_registry, subtitle_ocr
+from backend.tools.constant import SubtitleArea, OnnxGraphOptimization
+from backend.tools.frame_source import OpenCVFrameSource
+from backend.tools.hardware_accelerator import HardwareAccelerator
+from backend.tools.ocr import OcrRecogniser
+
+
+def read_frames(video_path, frame_count):
+    """
+    从视频中均匀取frame_count帧，裁剪为默认字幕区域(下半部分)
+    """
+    video_cap = OpenCVFrameSource(video_path)
+    # CAP_PROP_FRAME_COUNT为浮点数
+    total = int(video_cap.frame_count)
+    step = max(total // frame_count, 1)
+    roi = subtitle_ocr.frame_preprocess_rect(SubtitleArea.LOWER_PART, video_cap.frame_width, video_cap.frame_height)
+    frames = []
+    for frame_no in range(0, total, step):
+        video_cap.seek(frame_no)
+        ret, frame = video_cap.read()
+        if not ret:
+            break
+        frames.append(subtitle_ocr.crop_frame(frame, roi).copy())
+        if len(frames) >= frame_count:
+            break
+    video_cap.release()
+    return frames
+
+
+def benchmark(spec, frames):
+    """
+    分别统计检测与识别的耗时
+    :return (检测毫秒/帧, 识别毫秒/帧, 每帧识别的文本)
+    """
+    recogniser = OcrRecogniser()
+    recogniser.box_tracker = None
+    recogniser.load(spec)
+    # 预热，排除首次推理时的初始化开销
+    recogniser.predict(frames[0])
+    start = time.perf_counter()
+    boxes_list = [recogniser.detect(frame) for frame in frames]
+    det_ms = (time.perf_counter() - start) * 1000 / len(frames)
+    start = time.perf_counter()
+    results = recogniser.predict_batch(frames, boxes_list)
+    rec_ms = (time.perf_counter() - start) * 1000 / len(frames)
+    texts = [''.join(text for text, _ in rec_res) for _, rec_res in results]
+    return det_ms, rec_ms, texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='paddle / ONNX Runtime CPU OCR benchmark')
+    parser.add_argument('video_path')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--intra-op-threads', type=int, default=config.onnxIntraOpThreads.value)
+    parser.add_argument('--inter-op-threads', type=int, default=config.onnxInterOpThreads.value)
+    parser.add_argument('--graph-optimization', choices=[item.value for item in OnnxGraphOptimization],
+                        default=config.onnxGraphOptimization.value.value)
+    parser.add_argument('--no-mem-arena', action='store_true')
+    args = parser.parse_args()
+
+    hardware_accelerator = HardwareAccelerator.instance()
+    # 两种引擎都在CPU上运行
+    hardware_accelerator.set_cpu_only(True)
+    config.onnxCpu.value = False
+    paddle_spec = model_registry.model_spec(hardware_accelerator)
+    config.onnxCpu.value = True
+    config.onnxIntraOpThreads.value = args.intra_op_threads
+    config.onnxInterOpThreads.value = args.inter_op_threads
+    config.onnxGraphOptimization.value = OnnxGraphOptimization(args.graph_optimization)
+    config.onnxMemArena.value = not args.no_mem_arena
+    onnx_spec = model_registry.model_spec(hardware_accelerator)
+    if onnx_spec.onnx_cpu_options is None:
+        print('onnxruntime CPUExecutionProvider is not available')
+        return
+
+    frames = read_frames(args.video_path, args.frames)
+    if not frames:
+        print(f'no frames read from {args.video_path}')
+        return
+    print(f'frames: {len(frames)}, onnx options: {onnx_spec.onnx_cpu_options}')
+    paddle_det_ms, paddle_rec_ms, paddle_texts = benchmark(paddle_spec, frames)
+    onnx_det_ms, onnx_rec_ms, onnx_texts = benchmark(onnx_spec, frames)
+    same = sum(1 for a, b in zip(paddle_texts, onnx_texts) if a == b)
+    print(f'{"engine":<10}{"det ms/frame":>14}{"rec ms/frame":>14}{"total ms/frame":>16}')
+    print(f'{"paddle":<10}{paddle_det_ms:>14.2f}{paddle_rec_ms:>14.2f}{paddle_det_ms + paddle_rec_ms:>16.2f}')
+    print(f'{"onnx-cpu":<10}{onnx_det_ms:>14.2f}{onnx_rec_ms:>14.2f}{onnx_det_ms + onnx_rec_ms:>16.2f}')
+    print(f'identical text: {same}/{len(frames)} frames')
+
+
+if __name__ == '__main__':
+    main()
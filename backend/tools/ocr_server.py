@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 常驻OCR推理服务，模型只在服务进程中加载一次，由所有字幕提取任务共享，不同任务的识别请求合并后批量推理
+"""
+import os
+import queue
+import threading
+import traceback
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Client, Listener
+import numpy as np
+from backend.tools import model_registry
+from backend.tools.box_tracker import create_box_tracker
+from backend.tools.ocr_types import CascadeState
+from backend.tools.shared_frame_buffer import SharedFrameBuffer
+
+# 服务只监听本机
+SERVER_HOST = '127.0.0.1'
+# 一次合并推理的最大帧数
+MAX_BATCH_FRAMES = 32
+# 等待接受的连接数，多个OCR进程同时连接时超出的连接要等待重传才能被接受
+LISTEN_BACKLOG = 64
+# 等待服务进程退出的秒数，超时后强制结束
+SHUTDOWN_TIMEOUT = 5
+
+
+class _Request:
+    """
+    一次识别请求，由连接线程提交，模型线程识别完成后通知
+    """
+
+    def __init__(self, images, boxes_list, box_tracker, cascade_state):
+        self.images = images
+        self.boxes_list = boxes_list
+        # 请求所属连接的检测框跟踪器
+        self.box_tracker = box_tracker
+        # 请求所属视频流的级联识别状态，识别后连同结果返回给客户端
+        self.cascade_state = cascade_state
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _ModelWorker:
+    """
+    一份模型对应一个推理线程，从所有连接提交的请求中取出已就绪的请求，合并后批量识别
+    """
+
+    def __init__(self, spec, max_batch_frames):
+        from backend.tools.ocr import OcrRecogniser
+        self.spec = spec
+        self.max_batch_frames = max_batch_frames
+        self.recogniser = OcrRecogniser()
+        # 检测框跟踪按连接进行，不同任务的视频帧不能互相沿用检测框
+        self.recogniser.box_tracker = None
+        self.requests = queue.Queue()
+        threading.Thread(target=self.__run, daemon=True).start()
+
+    def submit(self, request):
+        self.requests.put(request)
+
+    def __run(self):
+        while True:
+            batch = [self.requests.get(block=True)]
+            frame_count = len(batch[0].images)
+            while frame_count < self.max_batch_frames:
+                try:
+                    request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                frame_count += len(request.images)
+            try:
+                if not self.recogniser.recogniser:
+                    self.recogniser.load(self.spec)
+                images = []
+                boxes_list = []
+                cascade_states = []
+                for request in batch:
+                    for index, image in enumerate(request.images):
+                        dt_boxes = request.boxes_list[index] if request.boxes_list is not None else None
+                        if dt_boxes is None:
+                            dt_boxes = self.recogniser.detect(image, request.box_tracker)
+                        images.append(image)
+                        boxes_list.append(dt_boxes)
+                        cascade_states.append(request.cascade_state)
+                # 不同任务的帧合并识别，级联识别只与同一视频流的上一帧比较
+                results = self.recogniser.predict_batch(images, boxes_list, cascade_states)
+                start = 0
+                for request in batch:
+                    request.results = results[start:start + len(request.images)]
+                    start += len(request.images)
+            except Exception:
+                error = traceback.format_exc()
+                for request in batch:
+                    request.error = error
+            finally:
+                for request in batch:
+                    request.done.set()
+
+
+class OcrServer:
+    """
+    OCR推理服务
+    每个客户端连接由一个线程处理，同一模型规格的请求交给同一个推理线程
+    """
+
+    def __init__(self, authkey, max_batch_frames=MAX_BATCH_FRAMES):
+        self.listener = Listener((SERVER_HOST, 0), backlog=LISTEN_BACKLOG, authkey=authkey)
+        self.max_batch_frames = max_batch_frames
+        self.lock = threading.Lock()
+        # 模型规格 -> _ModelWorker
+        self.workers = {}
+        # 收到shutdown命令后设置
+        self.stopped = threading.Event()
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def serve_forever(self):
+        """
+        在后台线程中接受连接，直到收到shutdown命令
+        """
+        threading.Thread(target=self.__accept, daemon=True).start()
+        self.stopped.wait()
+        self.listener.close()
+
+    def __accept(self):
+        while not self.stopped.is_set():
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                if self.stopped.is_set():
+                    break
+                # 认证失败等错误只影响该连接
+                print(e)
+                continue
+            threading.Thread(target=self.__handle, args=(conn,), daemon=True).start()
+
+    def __get_worker(self, spec):
+        with self.lock:
+            if spec not in self.workers:
+                self.workers[spec] = _ModelWorker(spec, self.max_batch_frames)
+            return self.workers[spec]
+
+    def __handle(self, conn):
+        box_tracker = create_box_tracker()
+        # 客户端传递视频帧的共享内存
+        frame_buffer = None
+        try:
+            while True:
+                command, *args = conn.recv()
+                if command == 'buffer':
+                    if frame_buffer is not None:
+                        frame_buffer.close()
+                    frame_buffer = args[0]
+                elif command == 'predict':
+                    spec, slots, boxes_list, cascade_state = args
+                    images = [frame_buffer.read(slot) for slot in slots]
+                    request = _Request(images, boxes_list, box_tracker, cascade_state)
+                    self.__get_worker(spec).submit(request)
+                    request.done.wait()
+                    if request.error is not None:
+                        conn.send(('error', request.error))
+                    else:
+                        conn.send(('ok', (request.results, request.cascade_state)))
+                elif command == 'close':
+                    break
+                elif command == 'shutdown':
+                    self.stopped.set()
+                    break
+        except (EOFError, OSError):
+            # 客户端进程已退出
+            pass
+        finally:
+            conn.close()
+            if frame_buffer is not None:
+                frame_buffer.close()
+
+
+class OcrClient:
+    """
+    OCR推理服务的客户端，predict与predict_batch的用法与OcrRecogniser相同
+    视频帧写入本连接的共享内存，请求中只发送槽位索引，收到结果后槽位即可复用
+    """
+
+    def __init__(self, server, spec):
+        """
+        :param server 服务地址与认证密钥(address, authkey)
+        :param spec 使用的模型规格，model_registry.ModelSpec
+        """
+        address, authkey = server
+        self.conn = Client(address, authkey=authkey)
+        self.spec = spec
+        # 未指定视频流时使用的级联识别状态
+        self.cascade_state = CascadeState()
+        self.frame_buffer = None
+
+    def predict(self, image, dt_boxes=None, cascade_state=None):
+        return self.predict_batch([image], None if dt_boxes is None else [dt_boxes],
+                                  None if cascade_state is None else [cascade_state])[0]
+
+    def predict_batch(self, images, boxes_list=None, cascade_states=None):
+        """
+        :param cascade_states 各帧的级联识别状态，一次请求中的帧属于同一视频流，状态随请求发送，识别后更新
+        """
+        if len(images) == 0:
+            return []
+        cascade_state = cascade_states[0] if cascade_states else self.cascade_state
+        images = [np.ascontiguousarray(image) for image in images]
+        self.__prepare_frame_buffer(images)
+        for slot, image in enumerate(images):
+            self.frame_buffer.write(slot, image)
+        self.conn.send(('predict', self.spec, list(range(len(images))), boxes_list, cascade_state))
+        status, result = self.conn.recv()
+        if status == 'error':
+            raise RuntimeError(result)
+        results, state = result
+        cascade_state.previous_lines = state.previous_lines
+        return results
+
+    def __prepare_frame_buffer(self, images):
+        """
+        共享内存的槽位数或尺寸不足时重新创建，并发送给服务
+        """
+        frame_buffer = self.frame_buffer
+        if frame_buffer is not None and len(images) <= frame_buffer.slot_count and \
+                all(frame_buffer.fits(image) and image.dtype == frame_buffer.dtype for image in images):
+            return
+        frame_shape = np.max([image.shape for image in images], axis=0)
+        slot_count = len(images)
+        if frame_buffer is not None and len(frame_buffer.frame_shape) == len(frame_shape):
+            # 不小于原有的尺寸与槽位数，避免交替变化时反复创建
+            frame_shape = np.maximum(frame_shape, frame_buffer.frame_shape)
+            slot_count = max(slot_count, frame_buffer.slot_count)
+        self.__release_frame_buffer()
+        self.frame_buffer = SharedFrameBuffer(frame_shape, slot_count, images[0].dtype, slot_queue=False)
+        self.conn.send(('buffer', self.frame_buffer))
+
+    def __release_frame_buffer(self):
+        if self.frame_buffer is not None:
+            self.frame_buffer.close()
+            self.frame_buffer.unlink()
+            self.frame_buffer = None
+
+    def close(self):
+        try:
+            self.conn.send(('close',))
+        except OSError:
+            pass
+        self.conn.close()
+        self.__release_frame_buffer()
+
+
+def serve(address_conn, authkey, max_batch_frames=MAX_BATCH_FRAMES):
+    """
+    服务进程入口，开始监听后通过address_conn返回监听地址
+    """
+    server = OcrServer(authkey, max_batch_frames)
+    address_conn.send(server.address)
+    address_conn.close()
+    server.serve_forever()
+
+
+def start_server(max_batch_frames=MAX_BATCH_FRAMES):
+    """
+    启动OCR推理服务进程
+    服务进程不是守护进程，推理时可以创建子进程，不再使用时需要调用stop_server
+    :return (process, server)，server为服务地址与认证密钥(address, authkey)，传给create_recogniser
+    """
+    authkey = os.urandom(16)
+    address_reader, address_writer = Pipe(duplex=False)
+    process = Process(target=serve, args=(address_writer, authkey, max_batch_frames))
+    process.start()
+    # 关闭本进程中的写端，服务进程启动失败时读取会抛出EOFError
+    address_writer.close()
+    try:
+        address = address_reader.recv()
+    finally:
+        address_reader.close()
+    return process, (address, authkey)
+
+
+def stop_server(process, server, timeout=SHUTDOWN_TIMEOUT):
+    """
+    通知OCR推理服务进程退出并等待结束，超时未退出时强制结束
+    :param process start_server返回的服务进程
+    :param server 服务地址与认证密钥(address, authkey)
+    """
+    if process is None:
+        return
+    if process.is_alive() and server is not None:
+        address, authkey = server
+        try:
+            conn = Client(address, authkey=authkey)
+            conn.send(('shutdown',))
+            conn.close()
+        except (OSError, EOFError) as e:
+            print(e)
+        process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join(timeout)
+
+
+def create_recogniser(server, hardware_accelerator):
+    """
+    创建文本识别对象
+    指定了OCR推理服务时连接服务，使用服务中已经加载的模型，连接失败时在本进程加载模型
+    :param server 服务地址与认证密钥(address, authkey)，None为不使用服务
+    :param hardware_accelerator HardwareAccelerator
+    """
+    if server is not None:
+        try:
+            return OcrClient(server, model_registry.model_spec(hardware_accelerator))
+        except (OSError, EOFError) as e:
+            print(e)
+    # 只有在本进程加载模型时才导入PaddleOCR
+    from backend.tools.ocr import OcrRecogniser
+    recogniser = OcrRecogniser()
+    recogniser.hardware_accelerator = hardware_accelerator
+    return recogniser
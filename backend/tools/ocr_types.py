@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 文本识别结果与级联识别状态，不依赖PaddleOCR，OCR进程与推理服务的客户端可以直接使用
+"""
+
+
+class RecResult(tuple):
+    """
+    文本行识别结果(text, score)，lang为识别出该文本的语言
+    """
+
+    def __new__(cls, text, score, lang=None):
+        result = super().__new__(cls, (text, score))
+        result.lang = lang
+        return result
+
+    def __getnewargs__(self):
+        return self[0], self[1], self.lang
+
+
+class CascadeState:
+    """
+    级联识别中一个视频流的状态，记录该视频流上一帧的文本行，用于与下一帧比较
+    每个视频流(字幕提取任务)单独使用一份，开始识别新的视频流时新建，随识别请求传入
+    """
+
+    def __init__(self, compare_neighbours=True):
+        """
+        :param compare_neighbours 依次传入的帧是否为视频中相邻的帧，不相邻时(如多个OCR进程轮流分配视频帧)不与上一帧比较
+        """
+        self.compare_neighbours = compare_neighbours
+        # 上一帧的文本行(None, ymin, ymax, text)
+        self.previous_lines = []
@@ -4,11 +4,17 @@ from pathlib import Path
 from fsplit.filesplit import Filesplit
 from backend.config import BASE_DIR, config
 
+# 量化后的INT8 ONNX模型文件名，与model.onnx在同一目录
+QUANTIZED_MODEL_FILENAME = 'model_int8.onnx'
+
 class PaddleModelConfig:
-    def __init__(self, hardware_accelerator):
+    def __init__(self, hardware_accelerator, language=None):
+        """
+        :param language 识别语言，None为配置中的字幕语言
+        """
         self.hardware_accelerator = hardware_accelerator
         # 设置识别语言
-        self.REC_CHAR_TYPE = config.language.value
+        self.REC_CHAR_TYPE = language or config.language.value
 
         # 模型文件目录
         # 默认模型版本 V4
@@ -21,6 +27,8 @@ class PaddleModelConfig:
         self.REC_IMAGE_SHAPE = '3,48,320'
         self.REC_MODEL_PATH = os.path.join(self.REC_MODEL_BASE, self.MODEL_VERSION, f'{self.REC_CHAR_TYPE}_rec')
         self.DET_MODEL_PATH = os.path.join(self.DET_MODEL_BASE, self.MODEL_VERSION, f'{self.REC_CHAR_TYPE}_det')
+        # 级联模式下，快速模型置信度低的文本行使用的精准识别模型，不可用时为None
+        self.CASCADE_REC_MODEL_PATH = None
 
         self.LATIN_LANG = [
             'af', 'az', 'bs', 'cs', 'cy', 'da', 'de', 'es', 'et', 'fr', 'ga', 'hr',
@@ -49,8 +57,8 @@ class PaddleModelConfig:
         # 如果设置了识别文本语言类型，则设置为对应的语言
         if self.REC_CHAR_TYPE in self.MULTI_LANG:
             # 定义文本检测与识别模型
-            # 使用快速模式时，调用轻量级模型
-            if config.mode.value == 'fast':
+            # 使用快速模式时，调用轻量级模型，级联模式先使用轻量级模型识别
+            if config.mode.value in ('fast', 'cascade'):
                 self.DET_MODEL_PATH = os.path.join(self.DET_MODEL_BASE, self.MODEL_VERSION, 'ch_det_fast')
                 self.REC_MODEL_PATH = os.path.join(self.REC_MODEL_BASE, self.MODEL_VERSION, f'{self.REC_CHAR_TYPE}_rec_fast')
             # 使用自动模式时，检测有没有使用GPU，根据GPU判断模型
@@ -90,6 +98,12 @@ class PaddleModelConfig:
             elif self.REC_CHAR_TYPE in self.DEVANAGARI_LANG:
                 self.REC_MODEL_PATH = os.path.join(self.REC_MODEL_BASE, self.MODEL_VERSION, f'devanagari_rec_fast')
 
+            # 级联模式使用同一语言、同一版本的大模型作为精准识别模型，字典与轻量级模型一致
+            if config.mode.value == 'cascade':
+                accurate_rec_model_path = os.path.join(self.REC_MODEL_BASE, self.MODEL_VERSION, f'{self.REC_CHAR_TYPE}_rec')
+                if os.path.exists(accurate_rec_model_path) and accurate_rec_model_path != self.REC_MODEL_PATH:
+                    self.CASCADE_REC_MODEL_PATH = accurate_rec_model_path
+
             # 定义图像识别shape
             if self.MODEL_VERSION == 'V2':
                 self.REC_IMAGE_SHAPE = '3,32,320'
@@ -104,15 +118,28 @@ class PaddleModelConfig:
             if 'inference.pdiparams' not in (os.listdir(self.DET_MODEL_PATH)):
                 fs = Filesplit()
                 fs.merge(input_dir=self.DET_MODEL_PATH)
+            if self.CASCADE_REC_MODEL_PATH is not None and 'inference.pdiparams' not in (os.listdir(self.CASCADE_REC_MODEL_PATH)):
+                fs = Filesplit()
+                fs.merge(input_dir=self.CASCADE_REC_MODEL_PATH)
    
     def convertToOnnxModelIfNeeded(self, model_dir, model_filename="inference.pdmodel", params_filename="inference.pdiparams", opset_version=14):
         """Converts a Paddle model to ONNX if ONNX providers are available and the model does not already exist."""
         
         if not self.hardware_accelerator.onnx_providers:
+            if config.mode.value == 'quantized':
+                print(f"Quantized mode needs onnxruntime with CPUExecutionProvider and hardware acceleration enabled, "
+                      f"using the FP32 paddle model: {model_dir}")
             return model_dir
         
         onnx_model_path = os.path.join(model_dir, "model.onnx")
 
+        # 量化模式使用backend/tools/quantize_models.py生成的INT8模型
+        if config.mode.value == 'quantized':
+            quantized_model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILENAME)
+            if os.path.exists(quantized_model_path):
+                return quantized_model_path
+            print(f"INT8 model not found: {quantized_model_path}. Run python -m backend.tools.quantize_models first, using the FP32 model.")
+
         if os.path.exists(onnx_model_path):
             print(f"ONNX model already exists: {onnx_model_path}. Skipping conversion.")
             return onnx_model_path
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: OCR结果的后处理，只依赖NumPy，不加载模型与界面配置，可以单独测试与基准测试
+"""
+import numpy as np
+
+
+def y_round(y):
+    """
+    将纵坐标四舍五入到10的倍数，个位数为5时向下取整
+    :param y 纵坐标，可以是整数或整数数组
+    """
+    remainder = y % 10
+    return np.where(remainder > 5, y - remainder + 10, y - remainder)
+
+
+def get_coordinates(dt_box):
+    """
+    从返回的检测框中获取坐标
+    :param dt_box 检测框返回结果，检测框列表或形状为(n, 4, 2)的数组
+    :return list 坐标点列表
+    """
+    if dt_box is None or len(dt_box) == 0:
+        return []
+    boxes = np.asarray(dt_box, dtype=np.float64).reshape(-1, 4, 2).astype(np.int64)
+    x, y = boxes[:, :, 0], boxes[:, :, 1]
+    xmin = np.maximum(x[:, 0], x[:, 3])
+    xmax = np.minimum(x[:, 1], x[:, 2])
+    ymin = np.maximum(y[:, 0], y[:, 1])
+    ymax = np.minimum(y[:, 2], y[:, 3])
+    return [tuple(coordinate) for coordinate in np.stack([xmin, xmax, ymin, ymax], axis=1).tolist()]
+
+
+def rank_result(detection_box, recognise_result):
+    """
+    将检测框转换为水平矩形，并按行从上到下、行内从左到右排列识别结果
+    纵坐标相差不超过10像素的检测框归为同一行，检测框的ymin统一为所在行的纵坐标
+    :return (dt_box, rec_res)，dt_box为形状(n, 4, 2)的int32数组
+    """
+    if len(detection_box) == 0:
+        return np.empty((0, 4, 2), dtype=np.int32), []
+    xmin, xmax, ymin, ymax = np.asarray(get_coordinates(detection_box), dtype=np.int64).T
+    y_rounds = y_round(ymin)
+    # 按检测框出现的顺序确定每一行的纵坐标，与已有行相差10以内的不再作为新行
+    _, first_index = np.unique(y_rounds, return_index=True)
+    lines = set()
+    for y in y_rounds[np.sort(first_index)].tolist():
+        if y not in lines and y + 10 not in lines and y - 10 not in lines:
+            lines.add(y)
+    lines = np.array(sorted(lines), dtype=np.int64)
+    # 每个检测框归入与其相差10以内的第一行
+    ymin = lines[np.searchsorted(lines, y_rounds - 10)]
+    # 先按行，再按横坐标排序，lexsort是稳定排序，横坐标相同时保持原有顺序
+    order = np.lexsort((xmin, ymin))
+    xmin, xmax, ymin, ymax = xmin[order], xmax[order], ymin[order], ymax[order]
+    dt_box = np.stack([np.stack([xmin, ymin], axis=1), np.stack([xmax, ymin], axis=1),
+                       np.stack([xmax, ymax], axis=1), np.stack([xmin, ymax], axis=1)], axis=1).astype(np.int32)
+    res = [recognise_result[i] for i in order.tolist()]
+    return dt_box, res
+
+
+def is_coordinate_similar(coordinate1, coordinate2, tolerant_x, tolerant_y):
+    """
+    计算两个坐标是否相似，如果两个坐标点的xmin,xmax,ymin,ymax的差值都在像素点容忍度内
+    则认为这两个坐标点相似
+    坐标也可以是可以广播的坐标数组(..., 4)，此时逐个比较，返回布尔数组
+    """
+    tolerance = np.array([tolerant_x, tolerant_x, tolerant_y, tolerant_y])
+    return np.all(np.abs(np.asarray(coordinate1) - np.asarray(coordinate2)) < tolerance, axis=-1)
+
+
+def unite_coordinates(coordinates_list, tolerant_x, tolerant_y):
+    """
+    给定一个坐标列表，将这个列表中相似的坐标统一为一个值
+    e.g. 由于检测框检测的结果不是一致的，相同位置文字的坐标可能一次检测为(255,123,456,789)，另一次检测为(253,122,456,799)
+    因此要对相似的坐标进行值的统一，结果与原来逐个比较并原地替换的实现相同:
+    每个坐标统一为在其之后出现的相似坐标中最后的一个；之后没有相似的坐标时，统一为之前已统一的值中最后一个与之相似的值
+    相同的坐标只处理一次；坐标按(xmin, ymin)放入边长为像素容忍度的网格，相似的坐标只可能在相邻的网格中，
+    每个网格中的坐标只与相邻9个网格中的坐标比较
+    :param coordinates_list 包含坐标点(xmin, xmax, ymin, ymax)的列表或(n, 4)数组
+    :param tolerant_x 横坐标的像素容忍度
+    :param tolerant_y 纵坐标的像素容忍度
+    :return: 返回一个统一值后的坐标数组(n, 4)
+    """
+    coordinates = np.asarray(coordinates_list, dtype=np.int64).reshape(-1, 4)
+    if len(coordinates) == 0:
+        return coordinates
+    unique, inverse = np.unique(coordinates, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    positions = np.arange(len(coordinates))
+    # 每个坐标最后出现的位置
+    last_index = np.full(len(unique), -1, dtype=np.int64)
+    np.maximum.at(last_index, inverse, positions)
+    cells = np.stack([unique[:, 0] // tolerant_x, unique[:, 2] // tolerant_y], axis=1)
+    grid = {}
+    for i, cell in enumerate(map(tuple, cells.tolist())):
+        grid.setdefault(cell, []).append(i)
+    grid = {cell: np.asarray(members, dtype=np.int64) for cell, members in grid.items()}
+
+    def neighbours_of(cell_x, cell_y):
+        return np.concatenate([grid[(cell_x + dx, cell_y + dy)] for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                               if (cell_x + dx, cell_y + dy) in grid])
+
+    target = np.arange(len(unique))
+    for (cell_x, cell_y), members in grid.items():
+        # 相邻的坐标按最后出现的位置从后往前排列，每个坐标统一为其中第一个与之相似的坐标
+        # 坐标与自身相似，一定能找到；分块比较，大多数坐标在第一块中就能找到
+        neighbours = neighbours_of(cell_x, cell_y)
+        neighbours = neighbours[np.argsort(-last_index[neighbours], kind='stable')]
+        pending = members
+        for start in range(0, len(neighbours), 64):
+            candidates = neighbours[start:start + 64]
+            similar = is_coordinate_similar(unique[pending][:, None, :], unique[candidates][None, :, :], tolerant_x, tolerant_y)
+            found = similar.any(axis=1)
+            target[pending[found]] = candidates[np.argmax(similar[found], axis=1)]
+            pending = pending[~found]
+            if len(pending) == 0:
+                break
+    result = target[inverse]
+    # 坐标最后一次出现且之后没有相似的坐标时，统一为之前的坐标统一后的值中最后一个与之相似的值
+    # 这些位置的结果依赖之前同类位置的结果，按出现顺序逐个处理，其余位置的结果只与原坐标有关
+    fallback = np.flatnonzero((result == inverse) & (last_index[inverse] == positions))
+    settled = np.ones(len(coordinates), dtype=bool)
+    settled[fallback] = False
+    order = np.argsort(result[settled], kind='stable')
+    # 其余位置按统一后的值分组，组内按位置排列
+    settled_values = result[settled][order]
+    settled_positions = positions[settled][order]
+    # 已处理的位置中，统一后的值 -> 最后的位置
+    latest = {}
+    for position in fallback.tolist():
+        value = inverse[position]
+        neighbours = neighbours_of(*cells[value].tolist())
+        best_position, best_value = -1, value
+        for candidate in neighbours[is_coordinate_similar(unique[value], unique[neighbours], tolerant_x, tolerant_y)].tolist():
+            start, end = np.searchsorted(settled_values, [candidate, candidate + 1])
+            before = np.searchsorted(settled_positions[start:end], position)
+            if before > 0 and settled_positions[start + before - 1] > best_position:
+                best_position, best_value = settled_positions[start + before - 1], candidate
+            if latest.get(candidate, -1) > best_position:
+                best_position, best_value = latest[candidate], candidate
+        result[position] = best_value
+        latest[best_value] = position
+    return unique[result]
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 在合成的原始字幕上测试后处理中同帧合并与坐标统一的耗时，并与原来的逐行比较实现对比结果与速度
+用法: python -m backend.tools.postprocess_benchmark [--lines 200000] [--baseline-lines 5000] [--boxes 3 30 200 1000]
+原来的实现耗时与行数的平方成正比，只在前baseline-lines行上运行，再按平方推算全部行数的耗时
+另外在文本框很多的合成帧上比较识别结果排序与原来的冒泡排序实现
+只依赖NumPy与后处理模块，不加载模型与界面，像素容忍度默认与设置中的默认值相同
+"""
+import argparse
+import random
+import time
+import unicodedata
+from collections import Counter
+import numpy as np
+from backend.tools import postprocess
+from backend.tools.subtitle_store import SubtitleStore
+
+
+def synthesize(line_count, seed=0):
+    """
+    生成合成的原始字幕：每帧一至两行字幕(检测框有几个像素的抖动)、固定位置的台标，以及偶尔出现的场景文本
+    """
+    rng = random.Random(seed)
+    store = SubtitleStore()
+    frame_no = 0
+    while len(store) < line_count:
+        frame_no += 1
+        text = f'subtitle {frame_no // 50}'
+        width = 200 + (frame_no // 50) % 7 * 40
+        store.append(frame_no, (640 - width + rng.randint(-3, 3), 640 + width + rng.randint(-3, 3),
+                                600 + rng.randint(-2, 2), 640 + rng.randint(-2, 2)), text, 0.95)
+        if frame_no % 3 == 0:
+            store.append(frame_no, (600 + rng.randint(-3, 3), 680 + rng.randint(-3, 3), 650, 690), f'line {frame_no // 50}', 0.9)
+        store.append(frame_no, (20, 120, 20, 50), 'LOGO', 0.99)
+        if frame_no % 11 == 0:
+            x, y = rng.randint(0, 1100), rng.randint(0, 500)
+            store.append(frame_no, (x, x + 80, y, y + 30), f'scene {rng.randint(0, 999)}', 0.6)
+    store.replace(store.records[:line_count])
+    return store
+
+
+def synthesize_boxes(box_count, rng):
+    """
+    生成一帧的检测框与识别结果，模拟片尾字幕、路牌等文本框很多的帧
+    """
+    boxes = []
+    for _ in range(box_count):
+        x, y = int(rng.integers(0, 1800)), int(rng.integers(0, 1000))
+        w, h = int(rng.integers(20, 300)), int(rng.integers(20, 50))
+        boxes.append([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])
+    return boxes, [(str(i), 0.99) for i in range(box_count)]
+
+
+def legacy_y_round(y):
+    """
+    原来的纵坐标取整实现，只处理单个整数
+    """
+    y_min = y + 10 - y % 10
+    y_max = y - y % 10
+    if abs(y - y_min) < abs(y - y_max):
+        return y_min
+    else:
+        return y_max
+
+
+def legacy_rank_result(detection_box, recognise_result):
+    """
+    原来的识别结果排序实现，逐个检测框查找所在的行，行内冒泡排序
+    """
+    coordinate_list = [list(coordinate) for coordinate in postprocess.get_coordinates(detection_box)]
+    lines = []
+    for i in coordinate_list:
+        y = legacy_y_round(i[2])
+        if y not in lines and y + 10 not in lines and y - 10 not in lines:
+            lines.append(y)
+    lines = sorted(lines)
+    for i in coordinate_list:
+        for j in lines:
+            if abs(j - legacy_y_round(i[2])) <= 10:
+                i[2] = j
+    to_rank_res = list(zip(coordinate_list, recognise_result))
+    ranked_res = []
+    for line in lines:
+        tmp_list = [i for i in to_rank_res if i[0][2] == line]
+        for k in range(1, len(tmp_list)):
+            for j in range(0, len(tmp_list) - k):
+                if tmp_list[j][0][0] > tmp_list[j + 1][0][0]:
+                    tmp_list[j], tmp_list[j + 1] = tmp_list[j + 1], tmp_list[j]
+        ranked_res.extend(tmp_list)
+    dt_box = [[(i[0], i[2]), (i[1], i[2]), (i[1], i[3]), (i[0], i[3])] for i, _ in ranked_res]
+    return dt_box, [i[1] for i in ranked_res]
+
+
+def legacy_concat_content_with_same_frameno(store):
+    """
+    原来的同帧合并实现，对每个重复的帧号遍历全部行，并逐个从列表中删除
+    """
+    records = store.records
+    content_list = [[frame_no, index, text] for index, (frame_no, text) in
+                    enumerate(zip(records['frame_no'].tolist(), store.text_list(records)))]
+    frame_no_list = [i[0] for i in Counter(i[0] for i in content_list).most_common() if i[1] > 1]
+    concatenation_list = []
+    for frame_no in frame_no_list:
+        position = [i for i, x in enumerate(content_list) if x[0] == frame_no]
+        concatenation_list.append((frame_no, position))
+    for i in concatenation_list:
+        content = ' '.join(content_list[j][2] for j in i[1])
+        for k in i[1]:
+            content_list[k][2] = content
+    to_delete = []
+    for i in concatenation_list:
+        for j in i[1][1:]:
+            to_delete.append(content_list[j])
+    for i in to_delete:
+        if i in content_list:
+            content_list.remove(i)
+    return [index for _, index, _ in content_list], [unicodedata.normalize('NFKC', content) for _, _, content in content_list]
+
+
+def legacy_unite_coordinates(coordinates_list, tolerant_x, tolerant_y):
+    """
+    原来的坐标统一实现，每个坐标与全部坐标比较
+    """
+    index = 0
+    for coordinate in coordinates_list:
+        for i in coordinates_list:
+            if abs(coordinate[0] - i[0]) < tolerant_x and abs(coordinate[1] - i[1]) < tolerant_x and \
+                    abs(coordinate[2] - i[2]) < tolerant_y and abs(coordinate[3] - i[3]) < tolerant_y:
+                coordinates_list[index] = i
+        index += 1
+    return coordinates_list
+
+
+def concat_content_with_same_frameno(store):
+    """
+    与SubtitleExtractor._concat_content_with_same_frameno相同的合并，返回合并后各帧第一行的位置与文本
+    """
+    records, texts = store.group_by_frame()
+    return records, [unicodedata.normalize('NFKC', ' '.join(content)) for content in texts]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark_rank(box_counts, seed=0):
+    """
+    比较每帧识别结果排序的耗时
+    """
+    rng = np.random.default_rng(seed)
+    print(f'{"boxes":<10}{"ms/frame":>12}{"previous":>12}')
+    for box_count in box_counts:
+        boxes, rec_res = synthesize_boxes(box_count, rng)
+        repeat = max(10000 // box_count, 10)
+        (dt_box, res), seconds = timed(lambda: [postprocess.rank_result(boxes, rec_res) for _ in range(repeat)][-1])
+        (legacy_dt_box, legacy_res), legacy_seconds = timed(lambda: [legacy_rank_result(boxes, rec_res) for _ in range(repeat)][-1])
+        same = res == legacy_res and dt_box.tolist() == [[list(point) for point in box] for box in legacy_dt_box]
+        print(f'{box_count:<10}{seconds / repeat * 1000:>12.3f}{legacy_seconds / repeat * 1000:>12.3f}  same result: {same}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark OCR result ranking, same-frame concatenation and coordinate unification')
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--baseline-lines', type=int, default=5000, help='lines used to time the previous O(n^2) implementation')
+    parser.add_argument('--tolerant-x', type=int, default=100, help='horizontal pixel tolerance (TolerantPixelX)')
+    parser.add_argument('--tolerant-y', type=int, default=50, help='vertical pixel tolerance (TolerantPixelY)')
+    parser.add_argument('--boxes', type=int, nargs='*', default=[3, 30, 200, 1000], help='boxes per frame when ranking OCR results')
+    args = parser.parse_args()
+
+    benchmark_rank(args.boxes)
+
+    store = synthesize(args.lines)
+    print(f'lines: {len(store)}, frames: {len(np.unique(store.records["frame_no"]))}, '
+          f'unique boxes: {len(np.unique(store.coordinates(), axis=0))}, '
+          f'tolerance: {args.tolerant_x}x{args.tolerant_y}')
+    _, concat_seconds = timed(concat_content_with_same_frameno, store)
+    _, unite_seconds = timed(postprocess.unite_coordinates, store.coordinates(), args.tolerant_x, args.tolerant_y)
+    print(f'{"stage":<10}{"lines":>10}{"seconds":>12}')
+    print(f'{"concat":<10}{len(store):>10}{concat_seconds:>12.3f}')
+    print(f'{"unite":<10}{len(store):>10}{unite_seconds:>12.3f}')
+
+    baseline_lines = min(args.baseline_lines, len(store))
+    if baseline_lines <= 0:
+        return
+    baseline = SubtitleStore(store.records[:baseline_lines], store.texts)
+    (legacy_indices, legacy_texts), legacy_concat_seconds = timed(legacy_concat_content_with_same_frameno, baseline)
+    records, texts = concat_content_with_same_frameno(baseline)
+    concat_same = legacy_texts == texts and np.array_equal(baseline.records[legacy_indices], records)
+    coordinates = [tuple(coordinate) for coordinate in baseline.coordinates().tolist()]
+    legacy_united, legacy_unite_seconds = timed(legacy_unite_coordinates, coordinates, args.tolerant_x, args.tolerant_y)
+    united = postprocess.unite_coordinates(baseline.coordinates(), args.tolerant_x, args.tolerant_y)
+    unite_same = [tuple(coordinate) for coordinate in united.tolist()] == legacy_united
+    # 原来的实现耗时与行数的平方成正比
+    scale = (len(store) / baseline_lines) ** 2
+    print(f'previous implementation on {baseline_lines} lines, estimated for {len(store)} lines:')
+    print(f'{"concat":<10}{legacy_concat_seconds:>12.3f}{legacy_concat_seconds * scale:>14.1f}  same result: {concat_same}')
+    print(f'{"unite":<10}{legacy_unite_seconds:>12.3f}{legacy_unite_seconds * scale:>14.1f}  same result: {unite_same}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 离线生成INT8量化的文本检测与识别ONNX模型，并在相同的字幕图像上与FP32模型比较速度与字符准确率
+用法: python -m backend.tools.quantize_models 字幕区域图像目录 [--lang ch] [--method static|dynamic] [--eval-dir 目录] [--labels 标注文件]
+量化模型保存为模型目录下的model_int8.onnx，识别模式选择quantized时使用
+"""
+import argparse
+import os
+import tempfile
+import cv2
+import numpy as np
+from Levenshtein import distance
+from backend.config import config
+from backend.tools import model_registry
+from backend.tools.hardware_accelerator import HardwareAccelerator
+from backend.tools.ocr import OcrRecogniser
+from backend.tools.ocr_benchmark import benchmark
+from backend.tools.paddle_model_config import PaddleModelConfig, QUANTIZED_MODEL_FILENAME
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+class _InputRecorder:
+    """
+    代理onnxruntime.InferenceSession，记录每次推理的输入，作为静态量化的校准数据
+    """
+
+    def __init__(self, session, inputs):
+        self.session = session
+        self.inputs = inputs
+
+    def run(self, output_names, input_feed, *args, **kwargs):
+        self.inputs.append({name: np.array(value, copy=True) for name, value in input_feed.items()})
+        return self.session.run(output_names, input_feed, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+class _CalibrationDataReader:
+    """
+    按顺序提供记录的模型输入
+    """
+
+    def __init__(self, inputs):
+        self.iterator = iter(inputs)
+
+    def get_next(self):
+        return next(self.iterator, None)
+
+
+def read_images(image_dir, limit=None):
+    """
+    读取目录中的字幕区域图像
+    """
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imdecode(np.fromfile(os.path.join(image_dir, name), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is not None:
+            images.append((name, image))
+        if limit is not None and len(images) >= limit:
+            break
+    return images
+
+
+def record_calibration_inputs(spec, images):
+    """
+    用FP32模型识别校准图像，记录检测与识别模型经过预处理后的实际输入
+    :return (检测模型输入列表, 识别模型输入列表)
+    """
+    text_system = model_registry.get_text_system_by_spec(spec)
+    det_inputs = []
+    rec_inputs = []
+    text_detector = text_system.text_detector
+    text_recognizer = text_system.text_recognizer
+    det_predictor = text_detector.predictor
+    rec_predictor = text_recognizer.predictor
+    text_detector.predictor = _InputRecorder(det_predictor, det_inputs)
+    text_recognizer.predictor = _InputRecorder(rec_predictor, rec_inputs)
+    try:
+        recogniser = OcrRecogniser()
+        recogniser.box_tracker = None
+        recogniser.recogniser = text_system
+        for image in images:
+            recogniser.predict(image)
+    finally:
+        text_detector.predictor = det_predictor
+        text_recognizer.predictor = rec_predictor
+    return det_inputs, rec_inputs
+
+
+def quantize_model(fp32_model_path, output_path, method, calibration_inputs):
+    """
+    量化一个ONNX模型
+    :param method static为静态量化(权重与激活均为INT8，需要校准数据)，dynamic为动态量化(只量化权重)
+    """
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    if method == 'dynamic':
+        # CPU上的ConvInteger只支持uint8权重
+        quantize_dynamic(fp32_model_path, output_path, weight_type=QuantType.QUInt8)
+        return
+    with tempfile.TemporaryDirectory() as temp_dir:
+        model_path = fp32_model_path
+        try:
+            # 量化前先做形状推断与图优化，失败时直接量化原模型
+            from onnxruntime.quantization.shape_inference import quant_pre_process
+            model_path = os.path.join(temp_dir, 'model_preprocessed.onnx')
+            quant_pre_process(fp32_model_path, model_path)
+        except Exception as e:
+            print(f'quant_pre_process skipped: {e}')
+            model_path = fp32_model_path
+        quantize_static(model_path, output_path, _CalibrationDataReader(calibration_inputs),
+                        quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+
+def char_accuracy(references, hypotheses):
+    """
+    字符准确率，1 - 编辑距离之和 / 参考文本字符数之和
+    """
+    total = sum(len(text) for text in references)
+    if total == 0:
+        return 1.0
+    errors = sum(distance(reference, hypothesis) for reference, hypothesis in zip(references, hypotheses))
+    return max(1 - errors / total, 0.0)
+
+
+def read_labels(labels_path):
+    """
+    读取标注文件，每行为: 文件名\\t字幕文本
+    """
+    labels = {}
+    with open(labels_path, encoding='utf-8') as f:
+        for line in f:
+            name, _, text = line.rstrip('\n').partition('\t')
+            if name:
+                labels[name] = text
+    return labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize det/rec ONNX models to INT8 and compare them with FP32')
+    parser.add_argument('calibration_dir', help='directory of subtitle area images used for calibration')
+    parser.add_argument('--lang', default=config.language.value)
+    parser.add_argument('--method', choices=['static', 'dynamic'], default='static')
+    parser.add_argument('--eval-dir', default=None, help='directory of images used for comparison, default is calibration_dir')
+    parser.add_argument('--labels', default=None, help='ground truth file of the eval images, one "filename\\ttext" per line')
+    parser.add_argument('--max-calibration', type=int, default=200)
+    args = parser.parse_args()
+
+    hardware_accelerator = HardwareAccelerator.instance()
+    hardware_accelerator.set_cpu_only(True)
+    # 以精准模式的FP32模型为基准，在CPU上使用ONNX Runtime推理
+    config.language.value = args.lang
+    config.mode.value = 'accurate'
+    config.onnxCpu.value = True
+    fp32_spec = model_registry.model_spec(hardware_accelerator)
+    if not fp32_spec.det_model_dir.endswith('.onnx') or not fp32_spec.rec_model_dir.endswith('.onnx'):
+        print('FP32 ONNX models are not available, check that onnxruntime and paddle2onnx are installed')
+        return
+    model_config = PaddleModelConfig(hardware_accelerator)
+    det_int8_path = os.path.join(model_config.DET_MODEL_PATH, QUANTIZED_MODEL_FILENAME)
+    rec_int8_path = os.path.join(model_config.REC_MODEL_PATH, QUANTIZED_MODEL_FILENAME)
+
+    calibration_images = [image for _, image in read_images(args.calibration_dir, args.max_calibration)]
+    if not calibration_images:
+        print(f'no images in {args.calibration_dir}')
+        return
+    det_inputs, rec_inputs = record_calibration_inputs(fp32_spec, calibration_images)
+    print(f'calibration: {len(calibration_images)} images, {len(det_inputs)} det batches, {len(rec_inputs)} rec batches')
+    quantize_model(fp32_spec.det_model_dir, det_int8_path, args.method, det_inputs)
+    print(f'det model saved to: {det_int8_path}')
+    quantize_model(fp32_spec.rec_model_dir, rec_int8_path, args.method, rec_inputs)
+    print(f'rec model saved to: {rec_int8_path}')
+
+    eval_images = read_images(args.eval_dir or args.calibration_dir)
+    names = [name for name, _ in eval_images]
+    frames = [image for _, image in eval_images]
+    int8_spec = fp32_spec._replace(det_model_dir=det_int8_path, rec_model_dir=rec_int8_path)
+    fp32_det_ms, fp32_rec_ms, fp32_texts = benchmark(fp32_spec, frames)
+    int8_det_ms, int8_rec_ms, int8_texts = benchmark(int8_spec, frames)
+    fp32_ms = fp32_det_ms + fp32_rec_ms
+    int8_ms = int8_det_ms + int8_rec_ms
+    print(f'lang: {args.lang}, method: {args.method}, eval images: {len(frames)}')
+    print(f'{"model":<8}{"det ms/img":>12}{"rec ms/img":>12}{"img/s":>10}')
+    print(f'{"fp32":<8}{fp32_det_ms:>12.2f}{fp32_rec_ms:>12.2f}{1000 / max(fp32_ms, 1e-6):>10.2f}')
+    print(f'{"int8":<8}{int8_det_ms:>12.2f}{int8_rec_ms:>12.2f}{1000 / max(int8_ms, 1e-6):>10.2f}')
+    print(f'throughput delta: {fp32_ms / max(int8_ms, 1e-6) - 1:+.1%}')
+    # 以FP32的识别结果为参考的字符准确率
+    print(f'char accuracy vs fp32: {char_accuracy(fp32_texts, int8_texts):.2%}')
+    if args.labels:
+        labels = read_labels(args.labels)
+        indices = [i for i, name in enumerate(names) if name in labels]
+        references = [labels[names[i]] for i in indices]
+        fp32_accuracy = char_accuracy(references, [fp32_texts[i] for i in indices])
+        int8_accuracy = char_accuracy(references, [int8_texts[i] for i in indices])
+        print(f'char accuracy vs labels ({len(indices)} images): fp32 {fp32_accuracy:.2%}, int8 {int8_accuracy:.2%}, '
+              f'delta {(int8_accuracy - fp32_accuracy) * 100:+.2f} pt')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 基于共享内存的视频帧环形缓冲区
+主进程解码得到的帧写入共享内存槽位，OCR进程按槽位索引读取，避免OCR进程重新打开视频并随机seek解码
+"""
+from multiprocessing import Queue, shared_memory
+import numpy as np
+
+
+class SharedFrameBuffer:
+    """
+    共享内存环形缓冲区
+    每个槽位可存放一张尺寸不超过frame_shape的图像，空闲槽位由free_slots队列管理：
+    写入方取出一个空闲槽位写入图像，读取方读取后归还槽位。槽位用完时写入方阻塞，从而对解码形成背压
+    不使用空闲槽位队列时，由写入方指定槽位(write/read)，此时可以通过socket连接传给其他进程
+    """
+
+    def __init__(self, frame_shape, slot_count=16, dtype=np.uint8, slot_queue=True):
+        """
+        :param frame_shape 单个槽位可容纳的最大图像尺寸，如(h, w, 3)
+        :param slot_count 槽位数量
+        :param dtype 图像数据类型
+        :param slot_queue 是否使用空闲槽位队列，为False时只能使用write/read
+        """
+        self.frame_shape = tuple(int(i) for i in frame_shape)
+        self.slot_count = int(slot_count)
+        self.dtype = np.dtype(dtype)
+        self.slot_size = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        # 每个槽位的头部记录图像实际的shape
+        self.header_size = len(self.frame_shape) * np.dtype(np.int32).itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=(self.header_size + self.slot_size) * self.slot_count)
+        # multiprocessing.Queue只能在创建子进程时传递
+        self.free_slots = Queue() if slot_queue else None
+        for slot in range(self.slot_count if slot_queue else 0):
+            self.free_slots.put(slot)
+        self.__attach_views()
+
+    def __attach_views(self):
+        self.headers = np.ndarray((self.slot_count, len(self.frame_shape)), dtype=np.int32, buffer=self.shm.buf)
+        self.slots = np.ndarray((self.slot_count, self.slot_size), dtype=np.uint8, buffer=self.shm.buf,
+                                offset=self.header_size * self.slot_count)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # 共享内存只传递名字，在子进程中重新挂载
+        state['shm'] = self.shm.name
+        del state['headers']
+        del state['slots']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=state['shm'])
+        self.__attach_views()
+
+    def fits(self, frame):
+        """
+        图像能否放入槽位
+        """
+        return frame.ndim == len(self.frame_shape) and all(a <= b for a, b in zip(frame.shape, self.frame_shape))
+
+    def put(self, frame, timeout=None):
+        """
+        将图像写入一个空闲槽位
+        :param frame 图像
+        :param timeout 等待空闲槽位的超时时间，超时抛出queue.Empty
+        :return 槽位索引
+        """
+        frame = np.ascontiguousarray(frame, dtype=self.dtype)
+        if not self.fits(frame):
+            raise ValueError(f"frame shape {frame.shape} exceeds slot shape {self.frame_shape}")
+        slot = self.free_slots.get(block=True, timeout=timeout)
+        self.write(slot, frame)
+        return slot
+
+    def get(self, slot):
+        """
+        读取槽位中的图像并归还槽位
+        :param slot 槽位索引
+        :return 图像副本
+        """
+        try:
+            return self.read(slot)
+        finally:
+            self.release(slot)
+
+    def release(self, slot):
+        """
+        不读取图像，直接归还槽位
+        """
+        self.free_slots.put(slot)
+
+    def write(self, slot, frame):
+        """
+        将图像写入指定槽位
+        """
+        frame = np.ascontiguousarray(frame, dtype=self.dtype)
+        if not self.fits(frame):
+            raise ValueError(f"frame shape {frame.shape} exceeds slot shape {self.frame_shape}")
+        self.headers[slot] = frame.shape
+        self.slots[slot, :frame.nbytes] = frame.reshape(-1).view(np.uint8)
+
+    def read(self, slot):
+        """
+        读取指定槽位中的图像
+        :return 图像副本
+        """
+        shape = tuple(int(i) for i in self.headers[slot])
+        nbytes = int(np.prod(shape)) * self.dtype.itemsize
+        return self.slots[slot, :nbytes].view(self.dtype).reshape(shape).copy()
+
+    def close(self):
+        """
+        断开当前进程与共享内存的连接
+        """
+        self.headers = None
+        self.slots = None
+        self.shm.close()
+
+    def unlink(self):
+        """
+        释放共享内存，只应由创建方调用
+        """
+        self.shm.unlink()
@@ -1,6 +1,7 @@
 
-from .paddle_model_config import PaddleModelConfig
 from .hardware_accelerator import HardwareAccelerator
+from .box_tracker import create_box_tracker
+from . import model_registry
 
 class SubtitleDetect:
     """
@@ -8,19 +9,19 @@ class SubtitleDetect:
     """
 
     def __init__(self):
-        from paddleocr.tools.infer import utility
-        from paddleocr.tools.infer.predict_det import TextDetector
-        hardware_accelerator = HardwareAccelerator.instance()
-        onnx_providers = hardware_accelerator.onnx_providers
-        model_config = PaddleModelConfig(hardware_accelerator)
-        args = utility.parse_args()
-        args.det_algorithm = 'DB'
-        args.det_model_dir = model_config.convertToOnnxModelIfNeeded(model_config.DET_MODEL_PATH)
-        args.use_gpu=hardware_accelerator.has_cuda()
-        args.use_onnx=len(onnx_providers) > 0
-        args.onnx_providers=onnx_providers
-        self.text_detector = TextDetector(args)
+        # 文本检测模型由模型注册表共享，与文本识别使用同一份，首次检测时加载
+        self.text_detector = None
+        # 检测框跟踪，字幕未变化时沿用上一帧的检测框
+        self.box_tracker = create_box_tracker()
 
     def detect_subtitle(self, img):
+        if self.box_tracker is not None:
+            dt_boxes = self.box_tracker.track(img)
+            if dt_boxes is not None:
+                return dt_boxes, 0
+        if self.text_detector is None:
+            self.text_detector = model_registry.get_text_detector(HardwareAccelerator.instance())
         dt_boxes, elapse = self.text_detector(img)
+        if self.box_tracker is not None:
+            self.box_tracker.update(img, dt_boxes)
         return dt_boxes, elapse
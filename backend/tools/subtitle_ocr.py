@@ -4,10 +4,15 @@ from multiprocessing import Queue, Process
 import cv2
 from PIL import ImageFont, ImageDraw, Image
 from tqdm import tqdm
-from backend.tools.ocr import OcrRecogniser, get_coordinates
+from backend.tools.ocr_types import CascadeState
+from backend.tools.postprocess import get_coordinates
+from backend.tools.ocr_server import create_recogniser
 from backend.tools.constant import SubtitleArea
+from backend.tools.frame_source import OpenCVFrameSource
+from backend.tools.subtitle_store import SubtitleStore
+from backend.tools.subtitle_stream import SubtitleStream
 from backend.tools import constant
-from threading import Thread
+from threading import Thread, Event
 import queue
 from shapely.geometry import Polygon
 from types import SimpleNamespace
@@ -16,11 +21,27 @@ import numpy as np
 from collections import namedtuple
 from backend.config import tr
 
+# OCR识别任务
+# total_frame_count总帧数, frame_no当前帧, dt_box检测框, rec_res识别结果, total_ms当前帧时间, roi识别区域(x, y, w, h), slot共享内存槽位
+# end_frame_no字幕不变区间的结束帧，不为空时识别结果同时记录在frame_no与end_frame_no两帧
+# 检测框与共享内存中的图像都是roi内的坐标与图像
+OcrTask = namedtuple('OcrTask', 'total_frame_count frame_no dt_box rec_res total_ms roi slot end_frame_no', defaults=(None, None))
+# OCR识别进程
+# process进程, task_queue任务队列, progress_queue进度队列, frame_buffer视频帧共享内存缓冲区
+OcrWorker = namedtuple('OcrWorker', 'process task_queue progress_queue frame_buffer')
+# OCR流水线各阶段之间传递的结束标志
+OCR_STAGE_END = (-1, None, None, None, None, None)
+# OCR进程保存识别结果后放入进度队列的标志，之后进程响应主进程的识别请求，直到任务队列中收到None
+OCR_RESULTS_SAVED = -2
+
 
 def extract_subtitles(data, text_recogniser, img, raw_subtitles,
-                      sub_area, options, dt_box_arg, rec_res_arg, ocr_loss_debug_path):
+                      sub_area, options, dt_box_arg, rec_res_arg, ocr_loss_debug_path, roi=None):
     """
     提取视频帧中的字幕信息
+    :param img 识别区域的图像
+    :param raw_subtitles 原始字幕存储SubtitleStore，保留的识别结果追加到其中
+    :param roi 识别区域在视频帧中的位置(x, y, w, h)，识别结果的坐标会还原为视频帧中的坐标
     """
     # 从参数中获取检测框与检测结果
     dt_box = dt_box_arg
@@ -29,8 +50,8 @@ def extract_subtitles(data, text_recogniser, img, raw_subtitles,
     if dt_box is None or rec_res is None:
         dt_box, rec_res = text_recogniser.predict(img)
         # rec_res格式为： ("hello", 0.997)
-    # 获取文本坐标
-    coordinates = get_coordinates(dt_box)
+    # 获取文本坐标，并还原为视频帧中的坐标
+    coordinates = offset_coordinates(get_coordinates(dt_box), roi)
     # 将结果写入txt文本中
     if options.REC_CHAR_TYPE == 'en':
         # 如果识别语言为英文，则去除中文
@@ -63,8 +84,10 @@ def extract_subtitles(data, text_recogniser, img, raw_subtitles,
                 if not_overflow and confident:
                     # 保留该帧
                     selected = True
-                    line += f'{str(data["i"]).zfill(8)}\t{coordinate}\t{text}\n'
-                    raw_subtitles.append(f'{str(data["i"]).zfill(8)}\t{coordinate}\t{text}\n')
+                    if options.DEBUG_OCR_LOSS:
+                        # 只有输出丢失字幕的调试信息时才需要
+                        line += f'{str(data["i"]).zfill(8)}\t{coordinate}\t{text}\n'
+                    raw_subtitles.append(data["i"], coordinate, text, prob)
                 else:
                     if not not_overflow:
                         drop_reason = tr['Main']['OcrDropOutOfBoxRate'].format(int(options.SUB_AREA_DEVIATION_RATE * 100), int(overflow_area_rate * 100))
@@ -80,21 +103,48 @@ def extract_subtitles(data, text_recogniser, img, raw_subtitles,
             loss_info = namedtuple('loss_info', 'text prob overflow_area_rate coordinate selected')
             loss_list.append(loss_info(text, prob, overflow_area_rate, coordinate, selected))
         else:
-            raw_subtitles.append(f'{str(data["i"]).zfill(8)}\t{coordinate}\t{text}\n')
+            raw_subtitles.append(data["i"], coordinate, text, prob)
     # 输出调试信息
-    dump_debug_info(options, line, img, loss_list, ocr_loss_debug_path, sub_area, data)
+    dump_debug_info(options, line, img, loss_list, ocr_loss_debug_path, sub_area, data, roi)
+
+
+def split_by_language(dt_box, rec_res, languages):
+    """
+    双语字幕分别输出时，按识别语言拆分一帧的检测框与识别结果
+    :param languages 单独输出的语言，识别结果的语言不在其中时归入字幕语言
+    :return {语言: (dt_box, rec_res)}，字幕语言的键为None
+    """
+    groups = {None: ([], [])}
+    for lang in languages:
+        groups[lang] = ([], [])
+    for box, res in zip(dt_box, rec_res):
+        lang = getattr(res, 'lang', None)
+        boxes, results = groups[lang if lang in groups else None]
+        boxes.append(box)
+        results.append(res)
+    return groups
 
 
-def dump_debug_info(options, line, img, loss_list, ocr_loss_debug_path, sub_area, data):
+def language_raw_subtitle_path(raw_subtitle_path, lang):
+    """
+    双语字幕分别输出时，其他语言的原始字幕文件路径
+    """
+    root, ext = os.path.splitext(raw_subtitle_path)
+    return f'{root}.{lang}{ext}'
+
+
+def dump_debug_info(options, line, img, loss_list, ocr_loss_debug_path, sub_area, data, roi=None):
     loss = False
     if options.DEBUG_OCR_LOSS and options.REC_CHAR_TYPE in ('ch', 'japan ', 'korea', 'ch_tra'):
         loss = len(line) > 0 and re.search(r'[\u4e00-\u9fa5\u3400-\u4db5\u3130-\u318F\uAC00-\uD7A3\u0800-\u4e00]', line) is None
     if loss:
         if not os.path.exists(ocr_loss_debug_path):
             os.makedirs(ocr_loss_debug_path, mode=0o777, exist_ok=True)
-        img = cv2.rectangle(img, (sub_area.xmin, sub_area.ymin), (sub_area.xmax, sub_area.ymax), constant.BGR_COLOR_BLUE, 2)
+        # 图像为识别区域，绘制时将视频帧中的坐标转换为识别区域中的坐标
+        x0, y0 = (roi[0], roi[1]) if roi is not None else (0, 0)
+        img = cv2.rectangle(img, (sub_area.xmin - x0, sub_area.ymin - y0), (sub_area.xmax - x0, sub_area.ymax - y0), constant.BGR_COLOR_BLUE, 2)
         for loss_info in loss_list:
-            coordinate = loss_info.coordinate
+            coordinate = offset_coordinates([loss_info.coordinate], (-x0, -y0))[0]
             color = constant.BGR_COLOR_GREEN if loss_info.selected else constant.BGR_COLOR_RED
             text = f"[{loss_info.text}] prob:{loss_info.prob:.4f} or:{loss_info.overflow_area_rate:.2f}"
             img = paint_chinese_opencv(img, text, pos=(coordinate[0], coordinate[2] - 30), color=color)
@@ -123,113 +173,322 @@ def paint_chinese_opencv(im, chinese, pos, color):
     return img
 
 
-def ocr_task_consumer(ocr_queue, raw_subtitle_path, sub_area, video_path, options):
+class StageQueueMonitor:
+    """
+    定时采样OCR流水线各阶段输入队列的长度
+    某个阶段的输入队列经常是满的，说明该阶段是瓶颈
+    """
+
+    def __init__(self, stage_queues, interval=0.5):
+        """
+        :param stage_queues {阶段名: 该阶段的输入队列}
+        :param interval 采样间隔(秒)
+        """
+        self.stage_queues = stage_queues
+        self.interval = interval
+        self.sample_count = 0
+        # 阶段名 -> [队列长度之和, 最大队列长度]
+        self.depths = {name: [0, 0] for name in stage_queues}
+        self.stopped = Event()
+        self.thread = Thread(target=self.__run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def __run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample_count += 1
+            for name, stage_queue in self.stage_queues.items():
+                depth = stage_queue.qsize()
+                self.depths[name][0] += depth
+                self.depths[name][1] = max(self.depths[name][1], depth)
+
+    def summary(self):
+        """
+        :return 各阶段输入队列的平均长度/最大长度/队列容量
+        """
+        return ', '.join(f'{name} {total / max(self.sample_count, 1):.1f}/{max_depth}/{self.stage_queues[name].maxsize}'
+                         for name, (total, max_depth) in self.depths.items())
+
+
+def drain_stage_queue(stage_queue):
+    """
+    某个阶段出错退出时，丢弃其输入队列中剩余的任务直到结束标志，避免上游阶段阻塞
+    """
+    while stage_queue.get(block=True)[0] != -1:
+        pass
+
+
+def ocr_detect_stage(ocr_queue, detected_queue, text_recogniser):
+    """
+    检测阶段：检测视频帧中的文本框，与识别阶段在不同线程中运行，识别前一批帧的同时检测后面的帧
+    使用OCR推理服务时由服务检测，直接交给识别阶段
+    :param ocr_queue 输入队列，解码后的视频帧
+    :param detected_queue 输出队列，已检测文本框的视频帧
+    """
+    detect = getattr(text_recogniser, 'detect', None)
+    try:
+        while True:
+            frame_no, frame, dt_box, rec_res, roi, end_frame_no = ocr_queue.get(block=True)
+            if frame_no == -1:
+                break
+            if detect is not None and dt_box is None and rec_res is None:
+                dt_box = detect(frame, text_recogniser.box_tracker)
+                if len(dt_box) == 0:
+                    # 没有文本框的帧不需要识别
+                    rec_res = []
+            detected_queue.put((frame_no, frame, dt_box, rec_res, roi, end_frame_no))
+    except Exception as e:
+        print(e)
+        drain_stage_queue(ocr_queue)
+    finally:
+        detected_queue.put(OCR_STAGE_END)
+
+
+def ocr_recognize_stage(detected_queue, recognized_queue, text_recogniser, batch_size, cascade_state):
+    """
+    识别阶段：取出已经就绪的多帧，文本行合并后批量识别
+    :param detected_queue 输入队列，已检测文本框的视频帧
+    :param recognized_queue 输出队列，已识别的视频帧
+    :param batch_size 每次批量识别的最大帧数
+    :param cascade_state 本次识别的视频流的级联识别状态CascadeState
+    """
+    finished = False
+    try:
+        while not finished:
+            items = [detected_queue.get(block=True)]
+            while len(items) < batch_size and items[-1][0] != -1:
+                try:
+                    items.append(detected_queue.get_nowait())
+                except queue.Empty:
+                    break
+            finished = items[-1][0] == -1
+            if finished:
+                items.pop()
+            # 没有识别结果的帧需要识别，已检测的文本框一并传入，未检测的帧由识别对象检测
+            pending = [i for i, item in enumerate(items) if item[3] is None]
+            if pending:
+                results = text_recogniser.predict_batch([items[i][1] for i in pending], [items[i][2] for i in pending],
+                                                        [cascade_state] * len(pending))
+                for i, (dt_box, rec_res) in zip(pending, results):
+                    frame_no, frame, _, _, roi, end_frame_no = items[i]
+                    items[i] = (frame_no, frame, dt_box, rec_res, roi, end_frame_no)
+            for item in items:
+                recognized_queue.put(item)
+    except Exception as e:
+        print(e)
+        if not finished:
+            drain_stage_queue(detected_queue)
+    finally:
+        recognized_queue.put(OCR_STAGE_END)
+
+
+def create_subtitle_stream(options):
+    """
+    开启了流式输出时，创建去重后逐条写入字幕文件的SubtitleStream，指定了EVENT_QUEUE时字幕同时传回主进程
+    """
+    if options.STREAM_SUBTITLE_PATH is None:
+        return None
+    return SubtitleStream(options.STREAM_SUBTITLE_PATH, options.TEXT_SIMILARITY,
+                          options.FRAME_TIMESTAMP_INDEX.milliseconds, options.FPS, options.EVENT_QUEUE)
+
+
+def ocr_task_consumer(ocr_queue, raw_subtitle_path, sub_area, video_path, options, text_recogniser):
     """
     消费者： 消费ocr_queue，将ocr队列中的数据取出，进行ocr识别，写入字幕文件中
-    :param ocr_queue (current_frame_no当前帧帧号, frame 视频帧, dt_box检测框, rec_res识别结果)
+    检测、识别与过滤分别在不同线程中运行，各阶段之间通过有界队列连接
+    开启了流式输出时，过滤阶段同时将字幕语言的识别结果去重，逐条写入字幕文件
+    :param ocr_queue (current_frame_no当前帧帧号, frame 视频帧, dt_box检测框, rec_res识别结果, roi识别区域, end_frame_no区间结束帧)
     :param raw_subtitle_path
     :param sub_area
     :param video_path
     :param options
+    :param text_recogniser 文本识别对象
     """
     data = {'i': 1}
-    # 初始化文本识别对象
-    text_recogniser = OcrRecogniser()
-    text_recogniser.hardware_accelerator = options.HARDWARD_ACCELERATOR
     # 丢失字幕的存储路径
     ocr_loss_debug_path = os.path.join(os.path.abspath(os.path.splitext(video_path)[0]), 'loss')
     # 删除之前的缓存垃圾
     if os.path.exists(ocr_loss_debug_path):
         shutil.rmtree(ocr_loss_debug_path, True)
 
-    raw_subtitles = []
+    # 检测->识别、识别->过滤的队列，不小于每次批量识别的帧数的两倍，识别一批的同时可以积累下一批
+    stage_queue_size = max(2 * options.OCR_FRAME_BATCH_SIZE, 8)
+    detected_queue = queue.Queue(stage_queue_size)
+    recognized_queue = queue.Queue(stage_queue_size)
+    # 每次识别新的视频流时重新开始级联识别的相邻帧比较，多个OCR进程轮流分配视频帧时收到的帧不相邻
+    cascade_state = CascadeState(options.CASCADE_NEIGHBOUR_FRAMES)
+    stages = [
+        Thread(target=ocr_detect_stage, args=(ocr_queue, detected_queue, text_recogniser,), daemon=True),
+        Thread(target=ocr_recognize_stage, args=(detected_queue, recognized_queue, text_recogniser,
+                                                 options.OCR_FRAME_BATCH_SIZE, cascade_state,), daemon=True),
+    ]
+    monitor = StageQueueMonitor({'detect': ocr_queue, 'recognize': detected_queue, 'filter': recognized_queue})
+    for stage in stages:
+        stage.start()
+    monitor.start()
+
+    # 字幕语言的识别结果键为None，双语字幕分别输出时其他语言的识别结果单独记录
+    separate_languages = options.SEPARATE_LANGUAGES
+    raw_subtitles = {None: SubtitleStore()}
+    for lang in separate_languages:
+        raw_subtitles[lang] = SubtitleStore()
+    subtitle_stream = create_subtitle_stream(options)
+    # 流式写入的字幕即为最终结果时不再保留识别结果，调试时保留缓存，识别结果仍然保存
+    discard_raw_subtitles = subtitle_stream is not None and options.STREAM_SUBTITLE_FINAL and not options.KEEP_RAW_SUBTITLES
     try:
+        # 过滤阶段：按字幕区域与置信度过滤识别结果
         while True:
-            try:
-                frame_no, frame, dt_box, rec_res = ocr_queue.get(block=True)
-                if frame_no == -1:
-                    return
-                data['i'] = frame_no
-                extract_subtitles(data, text_recogniser, frame, raw_subtitles, sub_area, options, dt_box,
-                                    rec_res, ocr_loss_debug_path)
-            except Exception as e:
-                print(e)
+            frame_no, frame, dt_box, rec_res, roi, end_frame_no = recognized_queue.get(block=True)
+            if frame_no == -1:
                 break
+            data['i'] = frame_no
+            if separate_languages:
+                groups = split_by_language(dt_box, rec_res, separate_languages)
+            else:
+                groups = {None: (dt_box, rec_res)}
+            for lang, (lang_dt_box, lang_rec_res) in groups.items():
+                lang_raw_subtitles = raw_subtitles[lang]
+                line_count = len(lang_raw_subtitles)
+                extract_subtitles(data, text_recogniser, frame, lang_raw_subtitles, sub_area, options, lang_dt_box,
+                                  lang_rec_res, ocr_loss_debug_path, roi)
+                if end_frame_no is not None and end_frame_no > frame_no:
+                    # 区间内字幕不变，结束帧使用相同的识别结果，去重后即为准确的起止帧
+                    lang_raw_subtitles.repeat(line_count, end_frame_no)
+                if lang is None and subtitle_stream is not None:
+                    events = subtitle_stream.push(lang_raw_subtitles.lines(line_count))
+                    if events and subtitle_stream.writer.count == len(events):
+                        tqdm.write(tr['Main']['StreamFirstSubtitle'].format(round(subtitle_stream.first_event_seconds, 2)))
+                    if discard_raw_subtitles:
+                        # 不再保留字幕语言的识别结果，内存占用与视频长度无关
+                        raw_subtitles[None] = SubtitleStore()
+    except Exception as e:
+        print(e)
+        drain_stage_queue(recognized_queue)
     finally:
-        with open(raw_subtitle_path, mode='w+', encoding='utf-8') as raw_subtitle_file:
-            for line in raw_subtitles:
-                raw_subtitle_file.write(line)
+        if subtitle_stream is not None:
+            events = subtitle_stream.close()
+            if events and subtitle_stream.writer.count == len(events):
+                tqdm.write(tr['Main']['StreamFirstSubtitle'].format(round(subtitle_stream.first_event_seconds, 2)))
+            tqdm.write(tr['Main']['StreamSubtitleCount'].format(subtitle_stream.writer.count))
+        for stage in stages:
+            stage.join()
+        monitor.stop()
+        tqdm.write(tr['Main']['OcrStageQueueDepth'].format(monitor.summary()))
+        if getattr(text_recogniser, 'cascade_line_count', 0) > 0:
+            tqdm.write(tr['Main']['CascadeRefined'].format(text_recogniser.cascade_refine_count,
+                                                           text_recogniser.cascade_line_count))
+        for lang, store in raw_subtitles.items():
+            if lang is None and discard_raw_subtitles:
+                # 识别结果已经丢弃，不保存看起来有效的空文件
+                continue
+            store.save(raw_subtitle_path if lang is None else language_raw_subtitle_path(raw_subtitle_path, lang))
 
 
-def ocr_task_producer(ocr_queue, task_queue, progress_queue, video_path, raw_subtitle_path):
+def ocr_task_producer(ocr_queue, task_queue, progress_queue, video_path, raw_subtitle_path, frame_buffer):
     """
     生产者：负责生产用于OCR识别的数据，将需要进行ocr识别的数据加入ocr_queue中
-    :param ocr_queue (current_frame_no当前帧帧号, frame 视频帧, dt_box检测框, rec_res识别结果)
-    :param task_queue (total_frame_count总帧数, current_frame_no当前帧帧号, dt_box检测框, rec_res识别结果, subtitle_area字幕区域)
+    :param ocr_queue (current_frame_no当前帧帧号, frame 视频帧, dt_box检测框, rec_res识别结果, roi识别区域, end_frame_no区间结束帧)
+    :param task_queue OcrTask
     :param progress_queue
     :param video_path
     :param raw_subtitle_path
+    :param frame_buffer 主进程已解码视频帧的共享内存缓冲区
     """
-    cap = cv2.VideoCapture(video_path)
+    cap = None
     tbar = None
-    while True:
-        try:
+    # ocr_queue是否已经放入结束标志
+    ended = False
+    try:
+        while True:
             # 从任务队列中提取任务信息
-            total_frame_count, current_frame_no, dt_box, rec_res, total_ms, default_subtitle_area = task_queue.get(block=True)
-            progress_queue.put(current_frame_no)
-            if tbar is None:
-                tbar = tqdm(total=round(total_frame_count), position=1)
-            # current_frame 等于-1说明所有视频帧已经读完
-            if current_frame_no == -1:
-                # ocr识别队列加入结束标志
-                ocr_queue.put((-1, None, None, None))
-                # 更新进度条
-                tbar.update(tbar.total - tbar.n)
-                break
-            tbar.update(round(current_frame_no - tbar.n))
-            # 设置当前视频帧
-            # 如果total_ms不为空，则使用了VSF提取字幕
-            if total_ms is not None:
-                cap.set(cv2.CAP_PROP_POS_MSEC, total_ms)
-            else:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame_no - 1)
-            # 读取视频帧
-            ret, frame = cap.read()
-            # 如果读取成功
-            if ret:
-                # 根据默认字幕位置，则对视频帧进行裁剪，裁剪后处理
-                if default_subtitle_area is not None:
-                    frame = frame_preprocess(default_subtitle_area, frame)
-                # print(f"current_frame_no: {current_frame_no}")
-                ocr_queue.put((current_frame_no, frame, dt_box, rec_res))
-        except Exception as e:
-            print(e)
-            break
-    cap.release()
+            total_frame_count, current_frame_no, dt_box, rec_res, total_ms, roi, slot, end_frame_no = task_queue.get(block=True)
+            # 尚未归还的共享内存槽位
+            pending_slot = slot
+            try:
+                progress_queue.put(current_frame_no)
+                if tbar is None:
+                    tbar = tqdm(total=round(total_frame_count), position=1)
+                # current_frame 等于-1说明所有视频帧已经读完
+                if current_frame_no == -1:
+                    # 更新进度条
+                    tbar.update(tbar.total - tbar.n)
+                    break
+                if ended:
+                    # 识别出错后继续取出剩余的任务并归还槽位，主进程写入视频帧时不会因槽位用完而阻塞
+                    continue
+                tbar.update(round(current_frame_no - tbar.n))
+                # 主进程已经解码并裁剪好的视频帧，直接从共享内存中读取
+                if slot is not None:
+                    # get无论是否成功都会归还槽位
+                    pending_slot = None
+                    ocr_queue.put((current_frame_no, frame_buffer.get(slot), dt_box, rec_res, roi, end_frame_no))
+                    continue
+                if cap is None:
+                    cap = OpenCVFrameSource(video_path)
+                # 设置当前视频帧
+                # 如果total_ms不为空，则使用了VSF提取字幕
+                if total_ms is not None:
+                    cap.seek_ms(total_ms)
+                else:
+                    cap.seek(current_frame_no - 1)
+                # 读取视频帧
+                ret, frame = cap.read()
+                # 如果读取成功
+                if ret:
+                    # 裁剪为识别区域后处理
+                    if roi is not None:
+                        frame = np.ascontiguousarray(crop_frame(frame, roi))
+                    # print(f"current_frame_no: {current_frame_no}")
+                    ocr_queue.put((current_frame_no, frame, dt_box, rec_res, roi, end_frame_no))
+            except Exception as e:
+                print(e)
+                if not ended:
+                    # 识别阶段收到结束标志后保存已有的识别结果
+                    ended = True
+                    ocr_queue.put(OCR_STAGE_END)
+            finally:
+                if pending_slot is not None:
+                    frame_buffer.release(pending_slot)
+    finally:
+        # ocr识别队列加入结束标志，任务队列读取失败时也要放入，否则识别各阶段一直等待
+        if not ended:
+            ocr_queue.put(OCR_STAGE_END)
+    if cap is not None:
+        cap.release()
+    if frame_buffer is not None:
+        frame_buffer.close()
 
 
-def subtitle_extract_handler(task_queue, progress_queue, video_path, raw_subtitle_path, sub_area, options):
+def subtitle_extract_handler(task_queue, progress_queue, video_path, raw_subtitle_path, sub_area, options, frame_buffer):
     """
-    创建并开启一个视频帧提取线程与一个ocr识别线程
-    :param task_queue 任务队列，(total_frame_count总帧数, current_frame_no当前帧, dt_box检测框, rec_res识别结果, subtitle_area字幕区域)
+    创建并开启一个视频帧提取线程与一个ocr识别线程，识别结束并保存结果后继续响应主进程的识别请求
+    :param task_queue 任务队列，OcrTask
     :param progress_queue 进度队列
     :param video_path 视频路径
     :param raw_subtitle_path 原始字幕文件路径
     :param sub_area 字幕区域
     :param options 选项
+    :param frame_buffer 视频帧共享内存缓冲区
     """
     # 删除缓存
     if os.path.exists(raw_subtitle_path):
         os.remove(raw_subtitle_path)
-    # 创建一个OCR队列，大小建议值8-20
-    ocr_queue = queue.Queue(20)
+    # 创建一个OCR队列，大小建议值8-20，不小于每次批量识别的帧数
+    ocr_queue = queue.Queue(max(20, options.OCR_FRAME_BATCH_SIZE))
     # 创建一个OCR事件生产者线程
     ocr_event_producer_thread = Thread(target=ocr_task_producer,
-                                       args=(ocr_queue, task_queue, progress_queue, video_path, raw_subtitle_path,),
+                                       args=(ocr_queue, task_queue, progress_queue, video_path, raw_subtitle_path, frame_buffer,),
                                        daemon=True)
+    # 初始化文本识别对象，开启了OCR推理服务时使用服务中的模型
+    text_recogniser = create_recogniser(options.OCR_SERVER, options.HARDWARD_ACCELERATOR)
     # 创建一个OCR事件消费者提取线程
     ocr_event_consumer_thread = Thread(target=ocr_task_consumer,
-                                       args=(ocr_queue, raw_subtitle_path, sub_area, video_path, options,),
+                                       args=(ocr_queue, raw_subtitle_path, sub_area, video_path, options, text_recogniser,),
                                        daemon=True)
     # 开启消费者线程
     ocr_event_producer_thread.start()
@@ -238,55 +497,140 @@ def subtitle_extract_handler(task_queue, progress_queue, video_path, raw_subtitl
     # join方法让主线程任务结束之后，进入阻塞状态，一直等待其他的子线程执行结束之后，主线程再终止
     ocr_event_producer_thread.join()
     ocr_event_consumer_thread.join()
+    # 识别结果已经保存，继续使用已加载的模型响应主进程的识别请求
+    progress_queue.put(OCR_RESULTS_SAVED)
+    try:
+        serve_recognize_requests(task_queue, progress_queue, text_recogniser)
+    finally:
+        # 使用OCR推理服务时断开连接，释放传递视频帧的共享内存
+        if hasattr(text_recogniser, 'close'):
+            text_recogniser.close()
 
 
-def async_start(video_path, raw_subtitle_path, sub_area, options):
+def serve_recognize_requests(task_queue, reply_queue, text_recogniser):
+    """
+    识别结束后响应主进程的识别请求，如精确字幕起止位置时识别采样帧之间的视频帧，主进程不需要再加载模型
+    :param task_queue 请求为识别区域的图像，收到None时结束
+    :param reply_queue 每个请求回复一次识别结果[(text, score), ...]
+    :param text_recogniser 文本识别对象
+    """
+    while True:
+        image = task_queue.get(block=True)
+        if image is None:
+            break
+        if isinstance(image, tuple):
+            # 识别中途出错时残留的OcrTask
+            continue
+        try:
+            # 请求之间的图像不是相邻的视频帧，级联识别不与上一次请求比较
+            _, rec_res = text_recogniser.predict(image, cascade_state=CascadeState(compare_neighbours=False))
+            reply_queue.put([(text, score) for text, score in rec_res])
+        except Exception as e:
+            print(e)
+            reply_queue.put([])
+
+def async_start(video_path, raw_subtitle_path, sub_area, options, frame_buffer=None):
     """
     开始进程处理异步任务
+    frame_buffer: 视频帧共享内存缓冲区，任务中带有槽位索引时从中读取视频帧
     options.REC_CHAR_TYPE
     options.DROP_SCORE
     options.SUB_AREA_DEVIATION_RATE
     options.DEBUG_OCR_LOSS
     options.HARDWARD_ACCELERATOR
+    options.OCR_FRAME_BATCH_SIZE
+    options.OCR_SERVER
+    options.SEPARATE_LANGUAGES
+    options.STREAM_SUBTITLE_PATH
+    options.STREAM_SUBTITLE_FINAL
+    options.KEEP_RAW_SUBTITLES
+    options.TEXT_SIMILARITY
+    options.FRAME_TIMESTAMP_INDEX
+    options.FPS
+    options.EVENT_QUEUE
+    options.CASCADE_NEIGHBOUR_FRAMES
     """
     assert 'REC_CHAR_TYPE' in options, "options缺少参数：REC_CHAR_TYPE"
     assert 'DROP_SCORE' in options, "options缺少参数: DROP_SCORE'"
     assert 'SUB_AREA_DEVIATION_RATE' in options, "options缺少参数: SUB_AREA_DEVIATION_RATE"
     assert 'DEBUG_OCR_LOSS' in options, "options缺少参数: DEBUG_OCR_LOSS"
     assert 'HARDWARD_ACCELERATOR' in options, "options缺少参数: HARDWARD_ACCELERATOR"
+    assert 'OCR_FRAME_BATCH_SIZE' in options, "options缺少参数: OCR_FRAME_BATCH_SIZE"
+    assert 'OCR_SERVER' in options, "options缺少参数: OCR_SERVER"
+    assert 'SEPARATE_LANGUAGES' in options, "options缺少参数: SEPARATE_LANGUAGES"
+    assert 'STREAM_SUBTITLE_PATH' in options, "options缺少参数: STREAM_SUBTITLE_PATH"
+    assert 'STREAM_SUBTITLE_FINAL' in options, "options缺少参数: STREAM_SUBTITLE_FINAL"
+    assert 'KEEP_RAW_SUBTITLES' in options, "options缺少参数: KEEP_RAW_SUBTITLES"
+    assert 'TEXT_SIMILARITY' in options, "options缺少参数: TEXT_SIMILARITY"
+    assert 'FRAME_TIMESTAMP_INDEX' in options, "options缺少参数: FRAME_TIMESTAMP_INDEX"
+    assert 'FPS' in options, "options缺少参数: FPS"
+    assert 'EVENT_QUEUE' in options, "options缺少参数: EVENT_QUEUE"
+    assert 'CASCADE_NEIGHBOUR_FRAMES' in options, "options缺少参数: CASCADE_NEIGHBOUR_FRAMES"
     # 创建一个任务队列
-    # 任务格式为：(total_frame_count总帧数, current_frame_no当前帧, dt_box检测框, rec_res识别结果, subtitle_area字幕区域)
+    # 任务格式为：OcrTask
     task_queue = Queue()
     # 创建一个进度更新队列
     progress_queue = Queue()
     # 新建一个进程
     p = Process(target=subtitle_extract_handler,
-                args=(task_queue, progress_queue, video_path, raw_subtitle_path, sub_area, SimpleNamespace(**options),))
+                args=(task_queue, progress_queue, video_path, raw_subtitle_path, sub_area, SimpleNamespace(**options), frame_buffer,))
     # 启动进程
     p.start()
     return p, task_queue, progress_queue
 
 
-def frame_preprocess(subtitle_area, frame):
+def frame_preprocess_rect(subtitle_area, frame_width, frame_height):
     """
-    将视频帧进行裁剪
+    获取按默认字幕区域(上半部分/下半部分)裁剪的区域在原视频帧中的位置
+    :return (x, y, w, h)
     """
-    # 对于分辨率大于1920*1080的视频，将其视频帧进行等比缩放至1280*720进行识别
-    # paddlepaddle会将图像压缩为640*640
-    # if self.frame_width > 1280:
-    #     scale_rate = round(float(1280 / self.frame_width), 2)
-    #     frames = cv2.resize(frames, None, fx=scale_rate, fy=scale_rate, interpolation=cv2.INTER_AREA)
-    # 如果字幕出现的区域在下部分
+    cropped = int(frame_height // 2)
     if subtitle_area == SubtitleArea.LOWER_PART:
-        cropped = int(frame.shape[0] // 2)
-        # 将视频帧切割为下半部分
-        frame = frame[cropped:]
-    # 如果字幕出现的区域在上半部分
+        return 0, cropped, frame_width, frame_height - cropped
     elif subtitle_area == SubtitleArea.UPPER_PART:
-        cropped = int(frame.shape[0] // 2)
-        # 将视频帧切割为下半部分
-        frame = frame[:cropped]
-    return frame
+        return 0, 0, frame_width, cropped
+    return 0, 0, frame_width, frame_height
+
+
+def get_frame_roi(default_subtitle_area, sub_area, frame_width, frame_height, margin=0):
+    """
+    获取视频帧中需要检测与识别的区域
+    用户指定了字幕区域时，识别区域为字幕区域向外扩展margin像素，否则按默认字幕区域裁剪
+    :param default_subtitle_area 默认字幕区域，constant.SubtitleArea
+    :param sub_area 用户指定的字幕区域
+    :param frame_width 视频帧宽度
+    :param frame_height 视频帧高度
+    :param margin 字幕区域向外扩展的像素
+    :return (x, y, w, h)
+    """
+    if sub_area is None:
+        return frame_preprocess_rect(default_subtitle_area, frame_width, frame_height)
+    xmin = max(int(min(sub_area.xmin, sub_area.xmax)) - margin, 0)
+    xmax = min(int(max(sub_area.xmin, sub_area.xmax)) + margin, frame_width)
+    ymin = max(int(min(sub_area.ymin, sub_area.ymax)) - margin, 0)
+    ymax = min(int(max(sub_area.ymin, sub_area.ymax)) + margin, frame_height)
+    if xmax <= xmin or ymax <= ymin:
+        return 0, 0, frame_width, frame_height
+    return xmin, ymin, xmax - xmin, ymax - ymin
+
+
+def crop_frame(frame, roi):
+    """
+    将视频帧裁剪为识别区域
+    """
+    x, y, w, h = roi
+    return frame[y:y + h, x:x + w]
+
+
+def offset_coordinates(coordinates, roi):
+    """
+    将识别区域中的坐标(xmin, xmax, ymin, ymax)还原为视频帧中的坐标
+    :param roi 识别区域(x, y, ...)，None为不偏移
+    """
+    if roi is None or (roi[0] == 0 and roi[1] == 0):
+        return coordinates
+    x, y = roi[0], roi[1]
+    return [(xmin + x, xmax + x, ymin + y, ymax + y) for xmin, xmax, ymin, ymax in coordinates]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 原始字幕的列式存储
+识别结果的帧号、坐标与置信度按列保存在NumPy结构化数组中，文本保存在去重的字符串表中，记录中只保存文本的编号
+OCR进程识别时追加记录，识别结束后保存为二进制文件，主进程合并后在内存中查询与过滤，不再反复读写与解析文本文件
+"""
+import os
+import numpy as np
+
+# 一条识别结果: 帧号(从1开始), 文本框坐标(xmin, xmax, ymin, ymax), 置信度, 文本在字符串表中的编号
+RECORD_DTYPE = np.dtype([('frame_no', np.int64),
+                         ('xmin', np.int32), ('xmax', np.int32), ('ymin', np.int32), ('ymax', np.int32),
+                         ('score', np.float32), ('text', np.int32)])
+COORDINATE_FIELDS = ('xmin', 'xmax', 'ymin', 'ymax')
+# 追加的记录先缓存在列表中，达到该数量后再转换为数组
+CHUNK_SIZE = 4096
+
+
+class SubtitleStore:
+    """
+    原始字幕存储，记录只能追加，或者整体替换为查询、过滤后的结果
+    """
+
+    def __init__(self, records=None, texts=None):
+        """
+        :param records RECORD_DTYPE结构化数组
+        :param texts 字符串表，records中的text为其中的下标
+        """
+        self.texts = list(texts) if texts is not None else []
+        self.text_ids = {text: i for i, text in enumerate(self.texts)}
+        self.__records = np.asarray(records, dtype=RECORD_DTYPE) if records is not None else np.empty(0, dtype=RECORD_DTYPE)
+        # 尚未转换为数组的记录
+        self.__pending = []
+
+    def __len__(self):
+        return len(self.__records) + len(self.__pending)
+
+    @property
+    def records(self):
+        """
+        全部记录，RECORD_DTYPE结构化数组
+        """
+        self.__flush()
+        return self.__records
+
+    def __flush(self):
+        if self.__pending:
+            self.__records = np.concatenate([self.__records, np.array(self.__pending, dtype=RECORD_DTYPE)])
+            self.__pending = []
+
+    def intern(self, text):
+        """
+        获取文本在字符串表中的编号，相同的文本只保存一份
+        """
+        text_id = self.text_ids.get(text)
+        if text_id is None:
+            text_id = len(self.texts)
+            self.texts.append(text)
+            self.text_ids[text] = text_id
+        return text_id
+
+    def append(self, frame_no, coordinate, text, score=1.0):
+        """
+        追加一条识别结果
+        :param coordinate (xmin, xmax, ymin, ymax)
+        """
+        xmin, xmax, ymin, ymax = coordinate
+        self.__pending.append((frame_no, xmin, xmax, ymin, ymax, score, self.intern(text)))
+        if len(self.__pending) >= CHUNK_SIZE:
+            self.__flush()
+
+    def repeat(self, start, frame_no):
+        """
+        将第start条及之后的记录复制一份追加到末尾，帧号改为frame_no
+        """
+        flushed = len(self.__records)
+        if start >= flushed:
+            rows = self.__pending[start - flushed:]
+        else:
+            rows = self.records[start:].tolist()
+        self.__pending.extend((frame_no,) + tuple(row[1:]) for row in rows)
+
+    def lines(self, start=0):
+        """
+        获取第start条及之后的记录，只读取尚未转换为数组的记录时不触发转换
+        :return [(frame_no, (xmin, xmax, ymin, ymax), text, score), ...]
+        """
+        flushed = len(self.__records)
+        if start >= flushed:
+            rows = self.__pending[start - flushed:]
+        else:
+            rows = self.__records[start:].tolist() + self.__pending
+        return [(row[0], tuple(row[1:5]), self.texts[row[6]], row[5]) for row in rows]
+
+    def replace(self, records):
+        """
+        用查询、过滤后的记录替换全部记录，字符串表不变
+        """
+        self.__records = np.asarray(records, dtype=RECORD_DTYPE)
+        self.__pending = []
+
+    def keep(self, mask):
+        """
+        只保留mask为True的记录
+        """
+        self.replace(self.records[mask])
+
+    def sort(self):
+        """
+        按帧号排序，同一帧的记录保持原有顺序
+        """
+        records = self.records
+        self.replace(records[np.argsort(records['frame_no'], kind='stable')])
+
+    def text_list(self, records=None):
+        """
+        获取记录的文本
+        :param records 记录，默认为全部记录
+        """
+        if records is None:
+            records = self.records
+        return [self.texts[text_id] for text_id in records['text'].tolist()]
+
+    def group_by_frame(self):
+        """
+        按帧号分组，一次遍历完成
+        :return (各帧第一条记录的副本, 各帧所有记录的文本列表)，按各帧第一条记录的顺序排列
+        """
+        records = self.records
+        groups = {}
+        for index, (frame_no, text_id) in enumerate(zip(records['frame_no'].tolist(), records['text'].tolist())):
+            group = groups.get(frame_no)
+            if group is None:
+                groups[frame_no] = (index, [self.texts[text_id]])
+            else:
+                group[1].append(self.texts[text_id])
+        first_indices = [index for index, _ in groups.values()]
+        return records[np.asarray(first_indices, dtype=np.int64)], [texts for _, texts in groups.values()]
+
+    def coordinates(self):
+        """
+        :return 全部记录的坐标，(n, 4)数组，每行为(xmin, xmax, ymin, ymax)
+        """
+        records = self.records
+        return np.stack([records[field] for field in COORDINATE_FIELDS], axis=1)
+
+    def set_coordinates(self, coordinates):
+        """
+        修改全部记录的坐标
+        :param coordinates (n, 4)，每行为(xmin, xmax, ymin, ymax)
+        """
+        records = self.records
+        coordinates = np.asarray(coordinates).reshape(-1, len(COORDINATE_FIELDS))
+        for i, field in enumerate(COORDINATE_FIELDS):
+            records[field] = coordinates[:, i]
+
+    def save(self, path):
+        """
+        保存为二进制文件，文本按UTF-8编码后首尾相接保存，不使用pickle
+        """
+        encoded = [text.encode('utf-8') for text in self.texts]
+        offsets = np.cumsum([0] + [len(data) for data in encoded], dtype=np.int64)
+        with open(path, mode='wb') as f:
+            np.savez(f, records=self.records, text_data=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                     text_offsets=offsets)
+
+    @classmethod
+    def load(cls, path):
+        """
+        读取save保存的文件
+        """
+        with np.load(path) as data:
+            records = data['records']
+            text_data = data['text_data'].tobytes()
+            offsets = data['text_offsets'].tolist()
+        texts = [text_data[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+        return cls(records, texts)
+
+    @classmethod
+    def merge(cls, stores):
+        """
+        按帧号顺序合并多个存储，同一帧的记录保持原有顺序
+        """
+        merged = cls()
+        chunks = []
+        for store in stores:
+            records = store.records.copy()
+            if len(store.texts) > 0:
+                text_ids = np.array([merged.intern(text) for text in store.texts], dtype=np.int32)
+                records['text'] = text_ids[records['text']]
+            chunks.append(records)
+        if chunks:
+            merged.replace(np.concatenate(chunks))
+            merged.sort()
+        return merged
+
+    def export_text(self, path):
+        """
+        导出为文本文件用于调试，每行为: 帧号\\t(xmin, xmax, ymin, ymax)\\t文本
+        """
+        records = self.records
+        with open(path, mode='w', encoding='utf-8') as f:
+            for record, text in zip(records.tolist(), self.text_list(records)):
+                f.write(f'{str(record[0]).zfill(8)}\t{tuple(record[1:5])}\t{text}\n')
+
+
+def load_subtitle_stores(paths):
+    """
+    读取并合并多个OCR进程保存的原始字幕，不存在的文件跳过
+    """
+    return SubtitleStore.merge([SubtitleStore.load(path) for path in paths if os.path.exists(path)])
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 流式字幕去重与逐条写入
+OCR进程按帧号顺序得到识别结果后，逐帧合并到当前未结束的字幕中，文本变化时结束该字幕并立即写入srt文件
+去重规则与SubtitleExtractor._remove_duplicate_subtitle相同，内存占用与视频长度无关，识别过程中即可得到部分字幕
+"""
+import time
+import unicodedata
+from collections import namedtuple
+from Levenshtein import ratio
+
+# 一条已结束的字幕
+# start_frame, end_frame起止帧号, text文本, box文本框坐标(xmin, xmax, ymin, ymax), score平均置信度
+SubtitleEvent = namedtuple('SubtitleEvent', 'start_frame end_frame text box score')
+# 换算为时间后传给调用方的字幕
+# start_ms, end_ms起止时间(毫秒), text文本, box文本框坐标(xmin, xmax, ymin, ymax), confidence平均置信度
+TimedSubtitleEvent = namedtuple('TimedSubtitleEvent', 'start_ms end_ms text box confidence')
+
+
+def milliseconds_to_timecode(milliseconds):
+    """
+    将毫秒转换为srt时间戳，如'01:02:12,032'
+    """
+    milliseconds = max(int(milliseconds), 0)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    smpte_token = ','
+    return "%02d:%02d:%02d%s%03d" % (hours, minutes, seconds, smpte_token, milliseconds)
+
+
+def text_similarity(stripped1, stripped2):
+    """
+    计算两帧去除空格后的字幕文本的相似度
+    原来比较的是raw.txt中以换行结尾的文本，换行也参与Levenshtein相似度的计算，这里补上换行，保证去重结果不变
+    """
+    return ratio(stripped1 + '\n', stripped2 + '\n')
+
+
+class _OpenEvent:
+    """
+    尚未结束的字幕，记录第一帧的文本用于比较相似度，以及其中最长的文本
+    """
+
+    def __init__(self, frame_no, text, stripped, box, score):
+        self.start_frame = frame_no
+        self.last_frame = frame_no
+        # 与后续各帧比较的是第一帧去除空格后的文本
+        self.first_stripped = stripped
+        self.text = text
+        self.text_length = len(stripped)
+        self.box = box
+        self.score = score
+
+    def update(self, frame_no, text, stripped, box, score):
+        self.last_frame = frame_no
+        # 保留最长的文本，长度相同时保留先出现的
+        if len(stripped) > self.text_length:
+            self.text = text
+            self.text_length = len(stripped)
+            self.box = box
+            self.score = score
+
+
+class SubtitleEventMerger:
+    """
+    流式去重，每次输入一帧的识别结果，返回因此结束的字幕
+    帧号必须递增，连续输入的相同帧号视为同一帧的多行字幕
+    """
+
+    def __init__(self, similarity_threshold, extend_single_frame=True):
+        """
+        :param similarity_threshold 文本相似度阈值(0-1)，与当前字幕第一帧的相似度低于该值时结束当前字幕
+        :param extend_single_frame 只有一帧的字幕以下一条字幕的开始帧作为结束帧
+        """
+        self.similarity_threshold = similarity_threshold
+        self.extend_single_frame = extend_single_frame
+        # 当前帧号与该帧已输入的识别结果，下一帧到来时才合并到字幕中
+        self.__frame_no = None
+        self.__lines = []
+        self.__event = None
+
+    def push(self, frame_no, lines):
+        """
+        输入一帧的识别结果
+        :param lines [(coordinate, text, score), ...]，coordinate为(xmin, xmax, ymin, ymax)，没有识别结果的帧不需要输入
+        :return 结束的字幕SubtitleEvent列表
+        """
+        if not lines:
+            return []
+        if frame_no == self.__frame_no:
+            self.__lines.extend(lines)
+            return []
+        closed = self.__commit_frame()
+        self.__frame_no = frame_no
+        self.__lines = list(lines)
+        return closed
+
+    def flush(self):
+        """
+        输入结束，结束最后一条字幕
+        :return 结束的字幕SubtitleEvent列表
+        """
+        closed = self.__commit_frame()
+        if self.__event is not None:
+            closed.append(self.__close(None))
+            self.__event = None
+        self.__frame_no = None
+        self.__lines = []
+        return closed
+
+    def __commit_frame(self):
+        """
+        将当前帧合并到字幕中，同一帧的多行字幕用空格连接
+        """
+        if self.__frame_no is None:
+            return []
+        frame_no, lines = self.__frame_no, self.__lines
+        text = unicodedata.normalize('NFKC', ' '.join(text for _, text, _ in lines))
+        stripped = text.replace(' ', '')
+        box = (min(coordinate[0] for coordinate, _, _ in lines), max(coordinate[1] for coordinate, _, _ in lines),
+               min(coordinate[2] for coordinate, _, _ in lines), max(coordinate[3] for coordinate, _, _ in lines))
+        score = sum(score for _, _, score in lines) / len(lines)
+        closed = []
+        event = self.__event
+        if event is not None and text_similarity(event.first_stripped, stripped) >= self.similarity_threshold:
+            event.update(frame_no, text, stripped, box, score)
+        else:
+            if event is not None:
+                closed.append(self.__close(frame_no))
+            self.__event = _OpenEvent(frame_no, text, stripped, box, score)
+        return closed
+
+    def __close(self, next_frame_no):
+        event = self.__event
+        end_frame = event.last_frame
+        if self.extend_single_frame and end_frame == event.start_frame and next_frame_no is not None:
+            # 针对只有一帧的情况，以下一帧的开始时间为准(除非是最后一帧)
+            end_frame = next_frame_no
+        return SubtitleEvent(event.start_frame, end_frame, event.text, event.box, event.score)
+
+
+class SrtWriter:
+    """
+    逐条写入srt字幕，每条写入后立即刷新到磁盘，识别中途停止时已写入的字幕仍然可用
+    """
+
+    def __init__(self, path, frame_to_milliseconds, fps):
+        """
+        :param frame_to_milliseconds 帧号转换为毫秒的函数
+        :param fps 视频帧率，持续时间不足1秒的字幕显示1秒
+        """
+        self.path = path
+        self.frame_to_milliseconds = frame_to_milliseconds
+        self.fps = fps
+        self.count = 0
+        self.file = open(path, mode='w', encoding='utf-8')
+
+    def write(self, event):
+        """
+        写入一条字幕SubtitleEvent
+        :return 写入的起止时间(毫秒)
+        """
+        self.count += 1
+        start_frame, end_frame = int(event.start_frame), int(event.end_frame)
+        start_ms = int(self.frame_to_milliseconds(start_frame))
+        # 比较起始帧号与结束帧号， 如果字幕持续时间不足1秒，则将显示时间设为1s
+        if abs(end_frame - start_frame) < self.fps:
+            end_frame = int(start_frame + self.fps)
+        end_ms = int(self.frame_to_milliseconds(end_frame))
+        self.file.write(f'{self.count}\n{milliseconds_to_timecode(start_ms)} --> {milliseconds_to_timecode(end_ms)}\n{event.text}\n\n')
+        self.file.flush()
+        return start_ms, end_ms
+
+    def close(self):
+        self.file.close()
+
+
+class SubtitleStream:
+    """
+    按帧号顺序输入原始识别结果，去重后逐条写入srt文件，并记录写入第一条字幕的耗时
+    """
+
+    def __init__(self, path, similarity_threshold, frame_to_milliseconds, fps, event_queue=None):
+        """
+        :param event_queue 不为None时，写入的字幕同时以TimedSubtitleEvent放入该队列，结束时放入None
+                           队列有界时，队列满后阻塞，直到取出字幕的一方跟上
+        """
+        self.merger = SubtitleEventMerger(similarity_threshold)
+        self.writer = SrtWriter(path, frame_to_milliseconds, fps)
+        self.event_queue = event_queue
+        self.start_time = time.time()
+        # 开始识别到写入第一条字幕的秒数
+        self.first_event_seconds = None
+
+    def push(self, lines):
+        """
+        输入识别结果
+        :param lines SubtitleStore.lines()返回的记录，可以包含多帧
+        :return 写入的字幕SubtitleEvent列表
+        """
+        events = []
+        for frame_no, coordinate, text, score in lines:
+            events.extend(self.merger.push(frame_no, [(coordinate, text, score)]))
+        return self.__write(events)
+
+    def close(self):
+        """
+        写入最后一条字幕并关闭文件
+        :return 写入的字幕SubtitleEvent列表
+        """
+        try:
+            return self.__write(self.merger.flush())
+        finally:
+            self.writer.close()
+            if self.event_queue is not None:
+                self.event_queue.put(None)
+
+    def __write(self, events):
+        for event in events:
+            if self.first_event_seconds is None:
+                self.first_event_seconds = time.time() - self.start_time
+            start_ms, end_ms = self.writer.write(event)
+            if self.event_queue is not None:
+                self.event_queue.put(TimedSubtitleEvent(start_ms, end_ms, event.text, tuple(int(v) for v in event.box),
+                                                        float(event.score)))
+        return events
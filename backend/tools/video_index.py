@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 视频索引，使用ffmpeg只解复用(不解码)扫描视频流的数据包，得到关键帧位置
+"""
+import subprocess
+from fractions import Fraction
+import cv2
+import numpy as np
+
+# ffmpeg中表示无时间戳的值
+NOPTS_VALUE = -0x8000000000000000
+# 数据包标志位: 关键帧，解码后应丢弃的帧
+AV_PKT_FLAG_KEY = 0x0001
+AV_PKT_FLAG_DISCARD = 0x0004
+
+
+def scan_video_packets(video_path):
+    """
+    使用ffmpeg的framecrc复用器扫描视频流的所有数据包，只读取数据包，不解码
+    :param video_path 视频路径
+    :return (pts列表, 是否关键帧列表, 时间基)，均按显示顺序排列，不包含解码后丢弃的数据包，扫描失败返回None
+    """
+    try:
+        import imageio_ffmpeg
+        cmd = [imageio_ffmpeg.get_ffmpeg_exe(), '-hide_banner', '-loglevel', 'error', '-i', video_path,
+               '-map', '0:v:0', '-c', 'copy', '-f', 'framecrc', '-']
+        output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+    except Exception as e:
+        print(f"Failed to scan video packets: {e}")
+        return None
+    time_base = None
+    pts_list = []
+    key_list = []
+    for line in output.decode('utf-8', errors='ignore').splitlines():
+        if line.startswith('#tb 0:'):
+            time_base = Fraction(line.split(':')[1].strip())
+            continue
+        if not line or line.startswith('#'):
+            continue
+        # 格式为: stream_index, dts, pts, duration, size, crc[, F=0x标志位][, S=附加数据个数, ...]
+        # 标志位只为关键帧时不输出，不同版本的ffmpeg可能输出更多的列，按前缀查找标志位
+        fields = [i.strip() for i in line.split(',')]
+        dts, pts = int(fields[1]), int(fields[2])
+        flags = next((int(field[2:], 16) for field in fields[6:] if field.startswith('F=')), AV_PKT_FLAG_KEY)
+        if flags & AV_PKT_FLAG_DISCARD:
+            continue
+        pts_list.append(dts if pts == NOPTS_VALUE else pts)
+        key_list.append(bool(flags & AV_PKT_FLAG_KEY))
+    if time_base is None or len(pts_list) == 0:
+        return None
+    # 数据包按解码顺序排列，按pts排序后得到显示顺序
+    order = np.argsort(np.array(pts_list, dtype=np.int64), kind='stable')
+    pts = np.array(pts_list, dtype=np.int64)[order]
+    keys = np.array(key_list, dtype=bool)[order]
+    return pts, keys, time_base
+
+
+class KeyframeIndex:
+    """
+    关键帧索引，记录视频中所有关键帧的帧号(从0开始, 按显示顺序)
+    """
+
+    def __init__(self, keyframes):
+        self.keyframes = np.asarray(keyframes, dtype=np.int64)
+
+    @classmethod
+    def from_video(cls, video_path):
+        """
+        扫描视频生成关键帧索引，失败返回None
+        """
+        packets = scan_video_packets(video_path)
+        if packets is None:
+            return None
+        _, keys, _ = packets
+        return cls(np.flatnonzero(keys))
+
+    def next_keyframe(self, frame_no):
+        """
+        获取帧号不小于frame_no的第一个关键帧
+        :return 关键帧帧号，之后没有关键帧则返回None
+        """
+        i = np.searchsorted(self.keyframes, frame_no, side='left')
+        if i >= len(self.keyframes):
+            return None
+        return int(self.keyframes[i])
+
+
+class FrameTimestampIndex:
+    """
+    帧时间戳索引，记录每一帧(从0开始, 按显示顺序)相对于视频开始的显示时间(毫秒)
+    时间来自解复用得到的数据包pts(按显示顺序排列)，可变帧率的视频也能得到准确的时间；超出索引范围的帧按帧率推算
+    要求每个数据包对应一帧，数据包数与视频帧数不一致时(如场编码)不能使用，见CaptureTimestampIndex
+    """
+
+    def __init__(self, timestamps, fps):
+        """
+        :param timestamps 各帧的显示时间(毫秒)，按帧号顺序排列
+        :param fps 视频帧率，用于推算索引范围之外的帧
+        """
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.frame_duration = 1000 / fps if fps > 0 else 0
+
+    @classmethod
+    def from_video(cls, video_path, fps, frame_count=None):
+        """
+        扫描视频生成帧时间戳索引
+        :param frame_count OpenCV得到的视频帧数，数据包数与之不一致时不生成索引
+        :return FrameTimestampIndex，扫描失败或数据包数与帧数不一致时返回None
+        """
+        packets = scan_video_packets(video_path)
+        if packets is None:
+            return None
+        pts, _, time_base = packets
+        if frame_count is not None and len(pts) != int(frame_count):
+            print(f"Video packet count {len(pts)} does not match frame count {int(frame_count)}")
+            return None
+        return cls((pts - pts[0]) * float(time_base) * 1000, fps)
+
+    def milliseconds(self, frame_no):
+        """
+        获取帧的显示时间
+        :param frame_no 帧号(从0开始)
+        :return 毫秒
+        """
+        count = len(self.timestamps)
+        if 0 <= frame_no < count:
+            return float(self.timestamps[frame_no])
+        if count == 0 or frame_no < 0:
+            return frame_no * self.frame_duration
+        return float(self.timestamps[-1]) + (frame_no - count + 1) * self.frame_duration
+
+    def frame_no(self, milliseconds):
+        """
+        获取显示时间与给定时间最接近的帧
+        :param milliseconds 毫秒
+        :return 帧号(从0开始)
+        """
+        count = len(self.timestamps)
+        if count == 0 or milliseconds > self.timestamps[-1]:
+            last_frame_no, last_ms = (count - 1, float(self.timestamps[-1])) if count > 0 else (0, 0.0)
+            if self.frame_duration <= 0:
+                return last_frame_no
+            return last_frame_no + int(round((milliseconds - last_ms) / self.frame_duration))
+        i = int(np.searchsorted(self.timestamps, milliseconds, side='left'))
+        if i > 0 and milliseconds - self.timestamps[i - 1] <= self.timestamps[i] - milliseconds:
+            i -= 1
+        return i
+
+
+class CaptureTimestampIndex:
+    """
+    无法使用数据包时间戳时，用OpenCV定位到该帧后读取CAP_PROP_POS_MSEC得到帧的显示时间，结果缓存
+    接口与FrameTimestampIndex相同，视频在首次查询时打开，可以传给其他进程
+    """
+
+    def __init__(self, video_path, fps):
+        self.video_path = video_path
+        self.frame_duration = 1000 / fps if fps > 0 else 0
+        self.cache = {}
+        self.cap = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['cap'] = None
+        return state
+
+    def milliseconds(self, frame_no):
+        """
+        获取帧的显示时间，读取失败时按帧率推算
+        :param frame_no 帧号(从0开始)
+        :return 毫秒
+        """
+        if frame_no not in self.cache:
+            if self.cap is None:
+                self.cap = cv2.VideoCapture(self.video_path)
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
+            ret, _ = self.cap.read()
+            self.cache[frame_no] = self.cap.get(cv2.CAP_PROP_POS_MSEC) if ret else frame_no * self.frame_duration
+        return self.cache[frame_no]
+
+    def frame_no(self, milliseconds):
+        """
+        获取显示时间与给定时间最接近的帧，按帧率推算
+        :param milliseconds 毫秒
+        :return 帧号(从0开始)
+        """
+        if self.frame_duration <= 0:
+            return 0
+        return max(int(round(milliseconds / self.frame_duration)), 0)
@@ -100,6 +100,7 @@ class SubtitleExtractorGUI(FluentWindow):
         # 断开信号连接
         # self.themeListener.terminate()
         # self.themeListener.deleteLater()
+        self.homeInterface.stop_ocr_server()
         ProcessManager().instance().terminate_all()
         super().closeEvent(event)
 
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 后处理与原来实现的等价性测试，原来的实现见backend.tools.postprocess_benchmark
+用法: python -m pytest tests
+"""
+import random
+import numpy as np
+from backend.tools import postprocess
+from backend.tools import postprocess_benchmark as benchmark
+
+
+def test_rank_result_matches_legacy():
+    rng = np.random.default_rng(0)
+    for box_count in (1, 2, 5, 30, 200):
+        for _ in range(20):
+            boxes, rec_res = benchmark.synthesize_boxes(box_count, rng)
+            dt_box, res = postprocess.rank_result(boxes, rec_res)
+            legacy_dt_box, legacy_res = benchmark.legacy_rank_result(boxes, rec_res)
+            assert res == legacy_res
+            assert dt_box.tolist() == [[list(point) for point in box] for box in legacy_dt_box]
+
+
+def test_rank_result_empty():
+    dt_box, res = postprocess.rank_result([], [])
+    assert dt_box.shape == (0, 4, 2)
+    assert res == []
+
+
+def test_unite_coordinates_matches_legacy():
+    # 坐标取自少量取值并且容忍度较大，相似坐标之间的链式统一与原地替换的各种情况都会出现
+    for seed in range(200):
+        rng = random.Random(seed)
+        tolerant_x, tolerant_y = rng.randint(1, 30), rng.randint(1, 30)
+        pool = [tuple(rng.randint(0, 60) for _ in range(4)) for _ in range(rng.randint(1, 40))]
+        coordinates = [rng.choice(pool) for _ in range(rng.randint(1, 200))]
+        united = postprocess.unite_coordinates(coordinates, tolerant_x, tolerant_y)
+        legacy = benchmark.legacy_unite_coordinates(list(coordinates), tolerant_x, tolerant_y)
+        assert [tuple(coordinate) for coordinate in united.tolist()] == legacy
+
+
+def test_unite_coordinates_on_synthesized_subtitles():
+    store = benchmark.synthesize(3000)
+    coordinates = store.coordinates()
+    united = postprocess.unite_coordinates(coordinates, 100, 50)
+    legacy = benchmark.legacy_unite_coordinates([tuple(coordinate) for coordinate in coordinates.tolist()], 100, 50)
+    assert [tuple(coordinate) for coordinate in united.tolist()] == legacy
+
+
+def test_concat_content_with_same_frameno_matches_legacy():
+    store = benchmark.synthesize(3000)
+    records, texts = benchmark.concat_content_with_same_frameno(store)
+    legacy_indices, legacy_texts = benchmark.legacy_concat_content_with_same_frameno(store)
+    assert texts == legacy_texts
+    assert np.array_equal(store.records[legacy_indices], records)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 原始字幕列式存储的保存、读取与合并测试
+用法: python -m pytest tests
+"""
+import numpy as np
+from backend.tools.subtitle_store import SubtitleStore, CHUNK_SIZE, load_subtitle_stores
+
+
+def build_store(frame_offset=0):
+    store = SubtitleStore()
+    texts = ['字幕', 'subtitle', '', 'tab\tand\nnewline', '全角ＡＢＣ', 'émoji 🎬', '字幕']
+    # 记录数超过CHUNK_SIZE，包含已转换为数组与尚未转换的记录
+    for i in range(CHUNK_SIZE + 10):
+        frame_no = frame_offset + i // 2 + 1
+        store.append(frame_no, (i, i + 100, 600 + i % 7, 640 + i % 5), texts[i % len(texts)], 0.5 + i % 50 / 100)
+    return store
+
+
+def test_save_load_round_trip(tmp_path):
+    store = build_store()
+    path = tmp_path / 'raw.npz'
+    store.save(path)
+    loaded = SubtitleStore.load(path)
+    assert np.array_equal(loaded.records, store.records)
+    assert loaded.texts == store.texts
+    assert loaded.text_list() == store.text_list()
+    assert loaded.lines() == store.lines()
+
+
+def test_save_load_empty(tmp_path):
+    path = tmp_path / 'raw.npz'
+    SubtitleStore().save(path)
+    loaded = SubtitleStore.load(path)
+    assert len(loaded) == 0
+    assert loaded.texts == []
+
+
+def test_export_text_matches_raw_txt(tmp_path):
+    # 导出的调试文本与原来OCR进程写入raw.txt的格式相同
+    store = SubtitleStore()
+    store.append(12, (1, 2, 3, 4), '第一行')
+    store.append(12, (5, 6, 7, 8), 'second')
+    path = tmp_path / 'raw.txt'
+    store.export_text(path)
+    assert path.read_text(encoding='utf-8') == f'{str(12).zfill(8)}\t{(1, 2, 3, 4)}\t第一行\n' \
+                                               f'{str(12).zfill(8)}\t{(5, 6, 7, 8)}\tsecond\n'
+
+
+def test_load_subtitle_stores_merges_by_frame(tmp_path):
+    first, second = build_store(), build_store(frame_offset=3)
+    paths = [tmp_path / 'raw_0.npz', tmp_path / 'raw_1.npz', tmp_path / 'missing.npz']
+    first.save(paths[0])
+    second.save(paths[1])
+    merged = load_subtitle_stores(paths)
+    expected = sorted(first.lines() + second.lines(), key=lambda line: line[0])
+    assert merged.lines() == expected
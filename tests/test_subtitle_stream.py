@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+@desc: 流式字幕去重与原来的SubtitleExtractor._remove_duplicate_subtitle、generate_subtitle_file的等价性测试
+用法: python -m pytest tests
+"""
+import random
+from collections import namedtuple
+from Levenshtein import ratio
+from backend.tools import postprocess_benchmark as benchmark
+from backend.tools.subtitle_store import SubtitleStore
+from backend.tools.subtitle_stream import SubtitleStream, milliseconds_to_timecode
+
+FPS = 25
+
+
+def frame_to_milliseconds(frame_no):
+    return frame_no * 1000 / FPS
+
+
+def legacy_remove_duplicate_subtitle(content_list, similarity_threshold):
+    """
+    原来的去重实现，content_list为合并同帧字幕后raw.txt中的(帧号, 文本)，文本以换行结尾
+    """
+    RawInfo = namedtuple('RawInfo', 'no content')
+    content_list = [RawInfo(frame_no, content) for frame_no, content in content_list]
+    unique_subtitle_list = []
+    idx_i = 0
+    content_list_len = len(content_list)
+    while idx_i < content_list_len:
+        i = content_list[idx_i]
+        start_frame = i.no
+        idx_j = idx_i
+        while idx_j < content_list_len:
+            if idx_j + 1 == content_list_len or \
+                    ratio(i.content.replace(' ', ''), content_list[idx_j + 1].content.replace(' ', '')) < similarity_threshold:
+                end_frame = content_list[idx_j].no
+                if end_frame == start_frame and idx_j + 1 < content_list_len:
+                    end_frame = content_list[idx_j + 1][0]
+                similar_list = content_list[idx_i:idx_j + 1]
+                similar_content_strip_list = [item.content.replace(' ', '') for item in similar_list]
+                index, _ = max(enumerate(similar_content_strip_list), key=lambda x: len(x[1]))
+                unique_subtitle_list.append((start_frame, end_frame, similar_list[index].content))
+                idx_i = idx_j + 1
+                break
+            else:
+                idx_j += 1
+    return unique_subtitle_list
+
+
+def legacy_generate_subtitle(subtitle_content):
+    """
+    原来的srt生成实现，时间戳改为按帧率换算
+    """
+    lines = []
+    for index, content in enumerate(subtitle_content):
+        frame_start = milliseconds_to_timecode(frame_to_milliseconds(int(content[0])))
+        if abs(int(content[1]) - int(content[0])) < FPS:
+            frame_end = milliseconds_to_timecode(frame_to_milliseconds(int(int(content[0]) + FPS)))
+        else:
+            frame_end = milliseconds_to_timecode(frame_to_milliseconds(int(content[1])))
+        lines.append(f'{index + 1}\n{frame_start} --> {frame_end}\n{content[2]}\n')
+    return ''.join(lines)
+
+
+def synthesize(seed):
+    """
+    生成按帧号排列的原始字幕：字幕持续若干帧，其间偶尔识别错字、漏字，部分帧有两行，帧号有间隔
+    """
+    rng = random.Random(seed)
+    store = SubtitleStore()
+    frame_no = 0
+    for subtitle in range(rng.randint(1, 40)):
+        text = ''.join(rng.choice('字幕测试文本ＡＢabc') for _ in range(rng.randint(1, 12)))
+        for _ in range(rng.randint(1, 30)):
+            frame_no += rng.randint(1, 3)
+            line = text
+            if line and rng.random() < 0.3:
+                position = rng.randrange(len(line))
+                line = line[:position] + rng.choice(['', 'x', ' ']) + line[position + 1:]
+            coordinate = (rng.randint(0, 50), rng.randint(500, 600), rng.randint(600, 610), rng.randint(640, 650))
+            store.append(frame_no, coordinate, line, rng.random())
+            if rng.random() < 0.2:
+                store.append(frame_no, coordinate, f'line {subtitle}', rng.random())
+    return store
+
+
+def test_subtitle_stream_matches_legacy(tmp_path):
+    for seed in range(50):
+        store = synthesize(seed)
+        similarity_threshold = random.Random(seed).choice([0.5, 0.8, 0.95])
+        records, texts = benchmark.concat_content_with_same_frameno(store)
+        content_list = [(str(frame_no).zfill(8), f'{text}\n') for frame_no, text in zip(records['frame_no'].tolist(), texts)]
+        expected = legacy_generate_subtitle(legacy_remove_duplicate_subtitle(content_list, similarity_threshold))
+
+        path = tmp_path / f'{seed}.srt'
+        stream = SubtitleStream(str(path), similarity_threshold, frame_to_milliseconds, FPS)
+        # 分多次输入，与OCR进程逐帧输入相同
+        lines = store.lines()
+        for start in range(0, len(lines), 7):
+            stream.push(lines[start:start + 7])
+        stream.close()
+        assert path.read_text(encoding='utf-8') == expected
@@ -13,7 +13,7 @@ from qfluentwidgets import (ScrollArea, ExpandLayout, CardWidget, SubtitleLabel,
 from backend.config import config, tr, VERSION, PROJECT_HOME_URL, PROJECT_ISSUES_URL, PROJECT_RELEASES_URL
 from backend.tools.version_service import VersionService
 from backend.tools.concurrent import TaskExecutor
-from backend.tools.constant import VideoSubFinderDecoder
+from backend.tools.constant import VideoSubFinderDecoder, FrameSourceBackend, OnnxGraphOptimization
 
 class AdvancedSettingInterface(ScrollArea):
     """高级设置页面"""
@@ -46,11 +46,27 @@ class AdvancedSettingInterface(ScrollArea):
     def setup_layout(self):
         self.advanced_group.addSettingCard(self.rec_batch_number)
         self.advanced_group.addSettingCard(self.max_batch_size)
+        self.advanced_group.addSettingCard(self.ocr_frame_batch_size)
+        self.advanced_group.addSettingCard(self.cascade_score_threshold)
         self.advanced_group.addSettingCard(self.subtitle_area)
         self.advanced_group.addSettingCard(self.extract_frequency)
+        self.advanced_group.addSettingCard(self.frame_source_backend)
+        self.advanced_group.addSettingCard(self.extract_shard_count)
+        self.advanced_group.addSettingCard(self.ocr_worker_count)
+        self.advanced_group.addSettingCard(self.ocr_server)
+        self.advanced_group.addSettingCard(self.onnx_cpu)
+        self.advanced_group.addSettingCard(self.onnx_intra_op_threads)
+        self.advanced_group.addSettingCard(self.onnx_inter_op_threads)
+        self.advanced_group.addSettingCard(self.onnx_graph_optimization)
+        self.advanced_group.addSettingCard(self.onnx_mem_arena)
+        self.advanced_group.addSettingCard(self.segment_extraction)
+        self.advanced_group.addSettingCard(self.refine_subtitle_boundary)
+        self.advanced_group.addSettingCard(self.stream_subtitle)
+        self.advanced_group.addSettingCard(self.box_tracker)
         self.advanced_group.addSettingCard(self.tolerant_pixel_y)
         self.advanced_group.addSettingCard(self.tolerant_pixel_x)
         self.advanced_group.addSettingCard(self.subtitle_area_deviation_pixel)
+        self.advanced_group.addSettingCard(self.subtitle_area_margin)
         self.advanced_group.addSettingCard(self.waterark_area_num)
         self.advanced_group.addSettingCard(self.threshold_text_similarity)
         self.advanced_group.addSettingCard(self.drop_score)
@@ -103,6 +119,22 @@ class AdvancedSettingInterface(ScrollArea):
             content=tr["Setting"]["MaxBatchSizeDesc"],
             parent=self.advanced_group
         )
+        # 跨帧批量识别的帧数
+        self.ocr_frame_batch_size = RangeSettingCard(
+            configItem=config.ocrFrameBatchSize,
+            icon=FluentIcon.ALBUM,
+            title=tr["Setting"]["OcrFrameBatchSize"],
+            content=tr["Setting"]["OcrFrameBatchSizeDesc"],
+            parent=self.advanced_group
+        )
+        # 级联模式重新识别的置信度阈值
+        self.cascade_score_threshold = RangeSettingCard(
+            configItem=config.cascadeScoreThreshold,
+            icon=FluentIcon.FILTER,
+            title=tr["Setting"]["CascadeScoreThreshold"],
+            content=tr["Setting"]["CascadeScoreThresholdDesc"],
+            parent=self.advanced_group
+        )
         # 字幕出现区域
         self.subtitle_area = ComboBoxSettingCard(
             configItem=config.subtitleArea,
@@ -120,6 +152,112 @@ class AdvancedSettingInterface(ScrollArea):
             content=tr["Setting"]["ExtractFrequencyDesc"],
             parent=self.advanced_group
         )
+        # 读取视频帧的解码组件
+        self.frame_source_backend = ComboBoxSettingCard(
+            configItem=config.frameSourceBackend,
+            icon=FluentIcon.VIDEO,
+            title=tr["Setting"]["FrameSourceBackend"],
+            content=tr["Setting"]["FrameSourceBackendDesc"],
+            texts=[item.value for item in FrameSourceBackend],
+            parent=self.advanced_group
+        )
+        # 并行提取分片数
+        self.extract_shard_count = RangeSettingCard(
+            configItem=config.extractShardCount,
+            icon=FluentIcon.SPEED_HIGH,
+            title=tr["Setting"]["ExtractShardCount"],
+            content=tr["Setting"]["ExtractShardCountDesc"],
+            parent=self.advanced_group
+        )
+        # OCR识别进程数
+        self.ocr_worker_count = RangeSettingCard(
+            configItem=config.ocrWorkerCount,
+            icon=FluentIcon.IOT,
+            title=tr["Setting"]["OcrWorkerCount"],
+            content=tr["Setting"]["OcrWorkerCountDesc"],
+            parent=self.advanced_group
+        )
+        # 常驻OCR推理服务
+        self.ocr_server = SwitchSettingCard(
+            configItem=config.ocrServer,
+            icon=FluentIcon.CLOUD,
+            title=tr["Setting"]["OcrServer"],
+            content=tr["Setting"]["OcrServerDesc"],
+            parent=self.advanced_group
+        )
+        # CPU上使用ONNX Runtime推理
+        self.onnx_cpu = SwitchSettingCard(
+            configItem=config.onnxCpu,
+            icon=FluentIcon.DEVELOPER_TOOLS,
+            title=tr["Setting"]["OnnxCpu"],
+            content=tr["Setting"]["OnnxCpuDesc"],
+            parent=self.advanced_group
+        )
+        # ONNX Runtime算子内线程数
+        self.onnx_intra_op_threads = RangeSettingCard(
+            configItem=config.onnxIntraOpThreads,
+            icon=FluentIcon.SPEED_MEDIUM,
+            title=tr["Setting"]["OnnxIntraOpThreads"],
+            content=tr["Setting"]["OnnxIntraOpThreadsDesc"],
+            parent=self.advanced_group
+        )
+        # ONNX Runtime算子间线程数
+        self.onnx_inter_op_threads = RangeSettingCard(
+            configItem=config.onnxInterOpThreads,
+            icon=FluentIcon.SPEED_OFF,
+            title=tr["Setting"]["OnnxInterOpThreads"],
+            content=tr["Setting"]["OnnxInterOpThreadsDesc"],
+            parent=self.advanced_group
+        )
+        # ONNX Runtime图优化级别
+        self.onnx_graph_optimization = ComboBoxSettingCard(
+            configItem=config.onnxGraphOptimization,
+            icon=FluentIcon.ROBOT,
+            title=tr["Setting"]["OnnxGraphOptimization"],
+            content=tr["Setting"]["OnnxGraphOptimizationDesc"],
+            texts=[item.value for item in OnnxGraphOptimization],
+            parent=self.advanced_group
+        )
+        # ONNX Runtime内存池
+        self.onnx_mem_arena = SwitchSettingCard(
+            configItem=config.onnxMemArena,
+            icon=FluentIcon.SAVE,
+            title=tr["Setting"]["OnnxMemArena"],
+            content=tr["Setting"]["OnnxMemArenaDesc"],
+            parent=self.advanced_group
+        )
+        # 先分段再识别
+        self.segment_extraction = SwitchSettingCard(
+            configItem=config.segmentExtraction,
+            icon=FluentIcon.CUT,
+            title=tr["Setting"]["SegmentExtraction"],
+            content=tr["Setting"]["SegmentExtractionDesc"],
+            parent=self.advanced_group
+        )
+        # 精确字幕起止位置
+        self.refine_subtitle_boundary = SwitchSettingCard(
+            configItem=config.refineSubtitleBoundary,
+            icon=FluentIcon.ALIGNMENT,
+            title=tr["Setting"]["RefineSubtitleBoundary"],
+            content=tr["Setting"]["RefineSubtitleBoundaryDesc"],
+            parent=self.advanced_group
+        )
+        # 流式输出字幕
+        self.stream_subtitle = SwitchSettingCard(
+            configItem=config.streamSubtitle,
+            icon=FluentIcon.SEND,
+            title=tr["Setting"]["StreamSubtitle"],
+            content=tr["Setting"]["StreamSubtitleDesc"],
+            parent=self.advanced_group
+        )
+        # 检测框跟踪
+        self.box_tracker = SwitchSettingCard(
+            configItem=config.boxTracker,
+            icon=FluentIcon.PIN,
+            title=tr["Setting"]["BoxTracker"],
+            content=tr["Setting"]["BoxTrackerDesc"],
+            parent=self.advanced_group
+        )
         # 容忍的像素点偏差
         self.tolerant_pixel_y = RangeSettingCard(
             configItem=config.tolerantPixelY,
@@ -143,6 +281,14 @@ class AdvancedSettingInterface(ScrollArea):
             content=tr["Setting"]["SubtitleAreaDeviationPixelDesc"],
             parent=self.advanced_group
         )
+        # 字幕区域裁剪边距
+        self.subtitle_area_margin = RangeSettingCard(
+            configItem=config.subtitleAreaMargin,
+            icon=FluentIcon.ZOOM,
+            title=tr["Setting"]["SubtitleAreaMargin"],
+            content=tr["Setting"]["SubtitleAreaMarginDesc"],
+            parent=self.advanced_group
+        )
         # 最有可能出现的水印区域
         self.waterark_area_num = RangeSettingCard(
             configItem=config.waterarkAreaNum,
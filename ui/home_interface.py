@@ -15,6 +15,7 @@ from ui.icon.my_fluent_icon import MyFluentIcon
 from backend.config import config, tr
 from backend.tools.subtitle_extractor_remote_call import SubtitleExtractorRemoteCall
 from backend.tools.process_manager import ProcessManager
+from backend.tools import ocr_server
 
 class HomeInterface(QWidget):
     progress_signal = Signal(int, int, int, bool) 
@@ -37,6 +38,9 @@ class HomeInterface(QWidget):
         self.running_task = False
         self.running_process = None
         self.running_sub_process_pids = []
+        # 常驻OCR推理服务进程，以及服务地址与认证密钥
+        self.ocr_server_process = None
+        self.ocr_server = None
         
         # 当前正在处理的任务索引
         self.current_processing_task_index = -1
@@ -321,6 +325,8 @@ class HomeInterface(QWidget):
             def task():
                 self.running_task = True
                 try:
+                    if config.ocrServer.value:
+                        self.ensure_ocr_server()
                     while self.running_task:
                         try:
                             pending_tasks = self.task_list_component.get_pending_tasks()
@@ -398,8 +404,35 @@ class HomeInterface(QWidget):
             self.run_button.setVisible(True)
             self.stop_button.setVisible(False)
 
+    def ensure_ocr_server(self):
+        """
+        启动常驻OCR推理服务，服务进程已经在运行时直接复用
+        模型在服务进程中只加载一次，之后的所有任务共享
+        """
+        if self.ocr_server_process is not None and self.ocr_server_process.is_alive():
+            return self.ocr_server
+        try:
+            self.ocr_server_process, self.ocr_server = ocr_server.start_server()
+            ProcessManager.instance().add_process(self.ocr_server_process, 'OcrServer')
+        except Exception as e:
+            print(e)
+            self.ocr_server_process, self.ocr_server = None, None
+        return self.ocr_server
+
+    def stop_ocr_server(self):
+        """
+        通知常驻OCR推理服务退出并等待结束
+        """
+        if self.ocr_server_process is None:
+            return
+        try:
+            ocr_server.stop_server(self.ocr_server_process, self.ocr_server)
+        finally:
+            ProcessManager.instance().remove_process('OcrServer')
+            self.ocr_server_process, self.ocr_server = None, None
+
     @staticmethod
-    def extractor_process(queue, video_path, output_path, options):
+    def extractor_process(queue, video_path, output_path, options, ocr_server_address=None):
         """
         在子进程中执行字幕提取的函数
         
@@ -407,12 +440,14 @@ class HomeInterface(QWidget):
             video_path: 视频文件路径
             output_path: 输出文件路径
             options: 选项
+            ocr_server_address: 常驻OCR推理服务的地址与认证密钥，为None时在子进程中加载模型
         """
         sr = None
         try:
             from backend.main import SubtitleExtractor
             sr = SubtitleExtractor(video_path)
             sr.subtitle_output_path = output_path
+            sr.ocr_server = ocr_server_address
             for key in options:
                 setattr(sr, key, options[key])
             sr.add_progress_listener(lambda progress_ocr, progress_frame_extract, progress_total, isFinished: SubtitleExtractorRemoteCall.remote_call_update_progress(queue, progress_ocr, progress_frame_extract, progress_total, isFinished))
@@ -452,7 +487,8 @@ class HomeInterface(QWidget):
         subtitle_extractor_remote_caller.register_error_callback(self.task_error_signal.emit)
         process = multiprocessing.Process(
             target=HomeInterface.extractor_process,
-            args=(subtitle_extractor_remote_caller.queue, video_path, output_path, options)
+            args=(subtitle_extractor_remote_caller.queue, video_path, output_path, options,
+                  self.ocr_server if config.ocrServer.value else None)
         )
         try:
             if not self.running_task:
@@ -591,7 +627,8 @@ class HomeInterface(QWidget):
                 self.video_cap.release()
                 self.video_cap = None
                 
-            # 确保所有子进程都已终止
+            # 先通知OCR推理服务退出，再确保所有子进程都已终止
+            self.stop_ocr_server()
             ProcessManager.instance().terminate_all()
         except Exception as e:
             print(f"Error during close window:", e)
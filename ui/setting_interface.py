@@ -35,6 +35,28 @@ class SettingInterface(QtWidgets.QVBoxLayout):
         )
         self.addWidget(self.language_combo)
 
+        # 双语字幕的第二种语言
+        self.second_language_combo = ComboBoxSettingCard(
+            configItem=config.secondLanguage,
+            icon=FluentIcon.LANGUAGE,
+            title=tr["LanguageModeGUI"]["SecondLanguage"],
+            content="",
+            parent=parent,
+            texts=[tr["LanguageModeGUI"]["SecondLanguageNone"]] + [tr['Language'][i] for i in config.secondLanguage.validator.options[1:]],
+        )
+        self.addWidget(self.second_language_combo)
+
+        # 双语字幕的输出方式
+        self.bilingual_output_combo = ComboBoxSettingCard(
+            configItem=config.bilingualOutput,
+            icon=FluentIcon.DOCUMENT,
+            title=tr["LanguageModeGUI"]["BilingualOutput"],
+            content="",
+            parent=parent,
+            texts=[tr["LanguageModeGUI"]["BilingualOutputMerged"], tr["LanguageModeGUI"]["BilingualOutputSeparate"]],
+        )
+        self.addWidget(self.bilingual_output_combo)
+
         # 识别模式设置
         self.mode_combo = ComboBoxSettingCard(
             configItem=config.mode,